@@ -0,0 +1,120 @@
+# Accuracy / CPU trade-off of the roi_hotspots pyramid mode.
+# For each image (synthetic, or a folder of real ones) the native-resolution heat is
+# the reference; every pyramid configuration is timed (process CPU time, all OpenCV
+# threads included) and compared with it (see common/roi_hotspots.compare_heat):
+#   mae / p99_abs_err : absolute error in heat levels (0..255), per pixel
+#   corr              : Pearson correlation with the native heat, per pixel
+#   top_iou           : IoU of the 5% hottest pixels
+#   block_*           : the same on 16x16 block means (the scale the LLM looks at)
+#   gate              : share of images where the pre-screening decision is unchanged
+#
+# Usage (from the repository root):
+#   python -m benchmarks.hotspot_pyramid --resolutions 4 12 24 --images 2
+#   python -m benchmarks.hotspot_pyramid --folder "images/1. ARTWORK COLLISION" --configs 0.5 0.25 0.25:0.05 0.5,0.25:0.05
+# A configuration is "scales[:refine_frac]", scales separated by commas.
+
+# Imports
+import os, sys, json, time, argparse, tempfile
+import cv2 # requires opencv-python
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_images import generate_images
+from common.roi_hotspots import HotspotEngine, compare_heat
+from common.prescreen import prescreen
+
+DEFAULT_CONFIGS = ("0.5", "0.25", "0.5:0.05", "0.25:0.05", "0.5,0.25:0.05")
+
+
+def parse_config(config: str) -> dict:
+    """ "0.5,0.25:0.05" -> {"scales": (0.5, 0.25), "refine_frac": 0.05} """
+    scales, _, refine = config.partition(":")
+    return {"scales": tuple(float(s) for s in scales.split(",")), "refine_frac": float(refine or 0)}
+
+def cpu_time(func, *args, repeat: int = 1):
+    """(result, best process CPU seconds of repeat calls)"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.process_time()
+        result = func(*args)
+        t = time.process_time() - t0
+        best = t if best is None else min(best, t)
+    return result, best
+
+def run(image_paths: list, configs, repeat: int = 1, refine_tile: int = 256) -> dict:
+    native = HotspotEngine()
+    engines = {c: HotspotEngine(refine_tile=refine_tile, **parse_config(c)) for c in configs}
+    rows = {c: [] for c in configs}
+    for path in image_paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+        reference, native_cpu = cpu_time(native.compute, gray, repeat=repeat)
+        needs_llm = prescreen(reference)["needs_llm"]
+        for c, engine in engines.items():
+            heat, cpu = cpu_time(engine.compute, gray, repeat=repeat)
+            rows[c].append({
+                "image": os.path.basename(path),
+                "megapixels": gray.size / 1e6,
+                "native_cpu_s": native_cpu,
+                "cpu_s": cpu,
+                "speedup": native_cpu / cpu if cpu else None,
+                "same_gate": prescreen(heat)["needs_llm"] == needs_llm,
+                **compare_heat(reference, heat),
+                **{f"block_{k}": v for k, v in compare_heat(reference, heat, block=16).items()},
+            })
+
+    summary = {}
+    for c, r in rows.items():
+        summary[c] = {
+            "speedup": float(np.sum([x["native_cpu_s"] for x in r]) / max(1e-9, np.sum([x["cpu_s"] for x in r]))),
+            "mae": float(np.mean([x["mae"] for x in r])),
+            "p99_abs_err": float(np.max([x["p99_abs_err"] for x in r])),
+            "corr": float(np.min([x["corr"] for x in r])),
+            "top_iou": float(np.min([x["top_iou"] for x in r])),
+            "block_mae": float(np.mean([x["block_mae"] for x in r])),
+            "block_corr": float(np.min([x["block_corr"] for x in r])),
+            "block_top_iou": float(np.min([x["block_top_iou"] for x in r])),
+            "gate": float(np.mean([x["same_gate"] for x in r])),
+        }
+    return {"images": len(image_paths), "summary": summary, "per_image": rows}
+
+def print_report(results: dict):
+    print(f"\n{results['images']} images; speedup = native CPU / pyramid CPU (total), worst case for p99 / corr / top_iou")
+    print(f"{'config':<16}{'speedup':>9}{'mae':>8}{'p99':>7}{'corr':>8}{'top_iou':>9}"
+          f"{'blk_mae':>9}{'blk_corr':>10}{'blk_iou':>9}{'gate':>7}")
+    for c, s in results["summary"].items():
+        print(f"{c:<16}{s['speedup']:>8.1f}x{s['mae']:>8.2f}{s['p99_abs_err']:>7.0f}{s['corr']:>8.3f}{s['top_iou']:>9.3f}"
+              f"{s['block_mae']:>9.2f}{s['block_corr']:>10.3f}{s['block_top_iou']:>9.3f}{s['gate']:>7.0%}")
+
+
+# ---------- Main function ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Accuracy and CPU time of the roi_hotspots pyramid mode.")
+    parser.add_argument("--folder", default=None, help="images to use (default: synthetic images)")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[4, 12], help="megapixels of the synthetic images")
+    parser.add_argument("--images", type=int, default=2, help="synthetic images per resolution")
+    parser.add_argument("--configs", nargs="+", default=list(DEFAULT_CONFIGS), help='"scales[:refine_frac]"')
+    parser.add_argument("--refine-tile", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=1, help="best of n timings")
+    parser.add_argument("--out", default=None, help="results JSON")
+    args = parser.parse_args(argv)
+
+    if args.folder:
+        image_paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder)
+                             if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")))
+        results = run(image_paths, args.configs, args.repeat, args.refine_tile)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            image_paths = generate_images(folder, args.resolutions, args.images)
+            results = run(image_paths, args.configs, args.repeat, args.refine_tile)
+    print_report(results)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# Offline benchmark suite.
+# Generates synthetic garment images at several resolutions, starts the local stub
+# Vision / OpenAI server and measures, per resolution:
+#   - latency and peak memory of roi_identification, roi_overlay, roi_hotspots and
+#     genai_analysis, each called on its own (stage benchmark)
+#   - images/second of the full main.main loop (end-to-end benchmark)
+# Results are written as JSON; --baseline compares them with a previous run.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.run_benchmarks --resolutions 1 4 12 24 --images 2 --out artifacts/bench.json
+#   python -m benchmarks.run_benchmarks --baseline artifacts/bench_main.json
+
+# Imports
+import os, sys, json, time, argparse, platform, tempfile, tracemalloc, contextlib, io
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_images import RESOLUTIONS_MP, generate_images
+from benchmarks.stub_servers import StubConfig, start_stub_server
+from common.telemetry import peak_rss_bytes
+
+STAGES = ("roi_identification", "roi_overlay", "roi_hotspots", "genai_analysis")
+
+
+# region Helpers
+def measure(func, *args, **kwargs):
+    """Call func; returns (result, wall seconds, tracemalloc peak bytes, peak RSS growth bytes)."""
+    tracemalloc.start()
+    rss0 = peak_rss_bytes()
+    t0 = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        wall = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    rss1 = peak_rss_bytes()
+    return result, wall, peak, None if rss0 is None else rss1 - rss0
+
+def stats(values) -> dict:
+    a = np.asarray(values, dtype=np.float64)
+    return {"n": int(a.size), "mean": float(a.mean()), "p50": float(np.percentile(a, 50)),
+            "p95": float(np.percentile(a, 95)), "max": float(a.max())}
+
+def stub_env(base_url: str) -> dict:
+    """Environment pointing main.main at the stub server, with the response cache and incremental runs off."""
+    return {
+        "VISION_ENDPOINT": base_url,
+        "VISION_KEY": "stub",
+        "AZURE_OPENAI_ENDPOINT": base_url,
+        "AZURE_OPENAI_API_KEY": "stub",
+        "AZURE_OPENAI_API_VERSION": "2024-08-01-preview",
+        "AZURE_OPENAI_CHAT_MULTIMODEL_DEPLOYMENT_NAME": "stub-gpt",
+        "RESPONSE_CACHE_MODE": "off",
+        "INCREMENTAL": "0",
+    }
+
+@contextlib.contextmanager
+def patched_env(values: dict):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+#endregion
+
+
+# region Benchmarks
+def bench_stages(image_paths: list, env: dict) -> dict:
+    """Each stage called on its own, image by image, as main.main does."""
+    from common.image_context import ImageContext
+    from common.roi_identification import roi_identification
+    from common.roi_highlighting import roi_overlay
+    from common.roi_hotspots import roi_hotspots
+    from common.image_genai import genai_analysis
+    from common.roi_prompt import encode_roi_prompt
+
+    samples = {stage: {"wall_s": [], "tracemalloc_peak_bytes": [], "peak_rss_delta_bytes": []} for stage in STAGES}
+
+    def record(stage, wall, peak, rss):
+        samples[stage]["wall_s"].append(wall)
+        samples[stage]["tracemalloc_peak_bytes"].append(peak)
+        if rss is not None:
+            samples[stage]["peak_rss_delta_bytes"].append(rss)
+
+    for path in image_paths:
+        ctx = ImageContext(path)
+        roi_payload, *m = measure(
+            roi_identification, image_path=ctx,
+            VISION_ENDPOINT=env["VISION_ENDPOINT"], VISION_KEY=env["VISION_KEY"],
+            features="Caption,Objects,Tags,DenseCaptions", limit_proposals=0,
+        )
+        record("roi_identification", *m)
+        _, *m = measure(roi_overlay, image_path=ctx, payload=roi_payload)
+        record("roi_overlay", *m)
+        _, *m = measure(roi_hotspots, image_path=ctx)
+        record("roi_hotspots", *m)
+        _, *m = measure(
+            genai_analysis,
+            azure_endpoint=env["AZURE_OPENAI_ENDPOINT"], api_key=env["AZURE_OPENAI_API_KEY"],
+            api_version=env["AZURE_OPENAI_API_VERSION"], deployment_name=env["AZURE_OPENAI_CHAT_MULTIMODEL_DEPLOYMENT_NAME"],
+            original_image_path=ctx, hotspots_image_path=ctx.heat_color,
+            roi_json_str=encode_roi_prompt(roi_payload, *ctx.size)[0],
+        )
+        record("genai_analysis", *m)
+
+    return {
+        stage: {
+            "wall_s": stats(s["wall_s"]),
+            "tracemalloc_peak_mb": max(s["tracemalloc_peak_bytes"]) / 1e6,
+            "peak_rss_delta_mb": max(s["peak_rss_delta_bytes"]) / 1e6 if s["peak_rss_delta_bytes"] else None,
+        }
+        for stage, s in samples.items()
+    }
+
+def bench_main(images_folder: str) -> dict:
+    """Full main.main loop over images_folder; its console output is suppressed."""
+    with patched_env({"IMAGES_PATH": images_folder, "TRACE_PATH": ""}):
+        import main as main_module
+        main_module.images_path = images_folder  # read at import time
+        main_module.VISION_ENDPOINT = os.environ["VISION_ENDPOINT"]
+        main_module.VISION_KEY = os.environ["VISION_KEY"]
+        n = len(os.listdir(images_folder))
+        rss0 = peak_rss_bytes()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            main_module.main()
+        wall = time.perf_counter() - t0
+        rss1 = peak_rss_bytes()
+    return {
+        "images": n,
+        "wall_s": wall,
+        "images_per_s": n / wall if wall else None,
+        "peak_rss_mb": None if rss1 is None else rss1 / 1e6,
+        "peak_rss_delta_mb": None if rss0 is None else (rss1 - rss0) / 1e6,
+    }
+
+def run(resolutions_mp, per_resolution: int, stub: StubConfig, workdir: str, skip_main: bool = False) -> dict:
+    server, base_url = start_stub_server(stub)
+    env = stub_env(base_url)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # artifacts/ is written relative to the working directory
+    os.makedirs("artifacts", exist_ok=True)
+    results = {"resolutions": {}}
+    try:
+        with patched_env(env):
+            for mp in resolutions_mp:
+                folder = os.path.join(workdir, "images", f"{mp:02d}MP")
+                paths = generate_images(folder, (mp,), per_resolution)
+                print(f"[{mp} MP] stage benchmark on {len(paths)} images...")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    entry = {"stages": bench_stages(paths, env)}
+                if not skip_main:
+                    print(f"[{mp} MP] main.main benchmark...")
+                    entry["main"] = bench_main(folder)
+                results["resolutions"][str(mp)] = entry
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+    results["stub_counters"] = dict(stub.counters)
+    return results
+#endregion
+
+
+# region Reports
+def flatten(results: dict) -> dict:
+    """{"<mp>MP/<stage>/wall_p50": value, "<mp>MP/main/images_per_s": value, ...}"""
+    flat = {}
+    for mp, entry in results["resolutions"].items():
+        for stage, s in entry["stages"].items():
+            flat[f"{mp}MP/{stage}/wall_p50"] = s["wall_s"]["p50"]
+            flat[f"{mp}MP/{stage}/tracemalloc_peak_mb"] = s["tracemalloc_peak_mb"]
+        if "main" in entry:
+            flat[f"{mp}MP/main/images_per_s"] = entry["main"]["images_per_s"]
+    return flat
+
+def print_report(results: dict, baseline: dict = None):
+    flat = flatten(results)
+    base = flatten(baseline) if baseline else {}
+    print(f"{'metric':<48}{'value':>12}{'baseline':>12}{'ratio':>8}")
+    print("-" * 80)
+    for key, value in flat.items():
+        ref = base.get(key)
+        ratio = f"{value / ref:>8.2f}" if ref else f"{'':>8}"
+        ref_text = f"{ref:>12.3f}" if ref is not None else f"{'':>12}"
+        print(f"{key:<48}{value:>12.3f}{ref_text}{ratio}")
+#endregion
+
+
+# ---------- Main function ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks against local stub services.")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=list(RESOLUTIONS_MP), help="megapixels")
+    parser.add_argument("--images", type=int, default=2, help="images per resolution")
+    parser.add_argument("--latency-ms", type=float, default=200, help="mean stub latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--dense-captions", type=int, default=40, help="dense captions per Vision response")
+    parser.add_argument("--bboxes", type=int, default=1, help="bboxes per chat completion")
+    parser.add_argument("--p429", type=float, default=0.0, help="probability of a 429 answer")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of injected 429s (seconds)")
+    parser.add_argument("--workdir", default=None, help="images and artifacts folder (default: temporary)")
+    parser.add_argument("--skip-main", action="store_true", help="stage benchmark only")
+    parser.add_argument("--out", default="artifacts/benchmark.json")
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare with")
+    args = parser.parse_args(argv)
+
+    stub = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, dense_captions=args.dense_captions,
+        bboxes=args.bboxes, p429=args.p429, retry_after_s=args.retry_after,
+    )
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory(prefix="cv_bench_"))
+        os.makedirs(workdir, exist_ok=True)
+        results = run(args.resolutions, args.images, stub, os.path.abspath(workdir), skip_main=args.skip_main)
+
+    results["config"] = {**vars(args), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+                         "platform": platform.platform(), "timestamp": time.time()}
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"Results saved to {args.out}")
+
+if __name__ == "__main__":
+    main()
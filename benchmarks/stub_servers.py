@@ -0,0 +1,146 @@
+# Local stand-ins for the remote services, for offline benchmarks:
+#   POST /computervision/imageanalysis:analyze          (Azure Computer Vision 4.0 REST)
+#   POST /openai/deployments/<name>/chat/completions    (Azure OpenAI chat completions)
+# with configurable latency, response size and 429 injection (with Retry-After).
+# Point VISION_ENDPOINT and AZURE_OPENAI_ENDPOINT at the base URL returned by
+# start_stub_server().
+
+# Imports
+import json, time, random, struct, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def image_size(data: bytes) -> tuple:
+    """(W, H) of a PNG or JPEG upload, read from its header; (1000, 1000) if unknown."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", data[16:24])
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            marker, length = data[i + 1], struct.unpack(">H", data[i + 2:i + 4])[0]
+            if marker in (0xC0, 0xC1, 0xC2):
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return w, h
+            i += 2 + length
+    return 1000, 1000
+
+
+class StubConfig:
+    def __init__(self, latency_ms: float = 200, jitter_ms: float = 50, vision_latency_ms: float = None,
+                 openai_latency_ms: float = None, dense_captions: int = 40, objects: int = 5,
+                 bboxes: int = 1, p429: float = 0.0, retry_after_s: float = 0.5, seed: int = 0):
+        self.vision_latency_ms = latency_ms if vision_latency_ms is None else vision_latency_ms
+        self.openai_latency_ms = latency_ms if openai_latency_ms is None else openai_latency_ms
+        self.jitter_ms = jitter_ms
+        self.dense_captions = dense_captions
+        self.objects = objects
+        self.bboxes = bboxes
+        self.p429 = p429
+        self.retry_after_s = retry_after_s
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"vision": 0, "openai": 0, "throttled": 0, "request_bytes": 0, "response_bytes": 0}
+
+    def count(self, **deltas):
+        with self.lock:
+            for k, v in deltas.items():
+                self.counters[k] += v
+
+    def sleep(self, mean_ms: float):
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, mean_ms + jitter) / 1000.0)
+
+    def throttle(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.p429
+
+
+def vision_response(W: int, H: int, cfg: StubConfig) -> dict:
+    rng = random.Random(W * 31 + H)
+
+    def box():
+        w, h = rng.randint(W // 20, W // 2), rng.randint(H // 20, H // 2)
+        return {"x": rng.randint(0, W - w), "y": rng.randint(0, H - h), "w": w, "h": h}
+
+    return {
+        "modelVersion": "2023-10-01",
+        "metadata": {"width": W, "height": H},
+        "captionResult": {"text": "a t-shirt with a logo on it", "confidence": 0.87},
+        "denseCaptionsResult": {"values": [
+            {"text": f"a close up of a logo part {i}", "confidence": round(rng.uniform(0.5, 0.95), 4), "boundingBox": box()}
+            for i in range(cfg.dense_captions)
+        ]},
+        "objectsResult": {"values": [
+            {"boundingBox": box(), "tags": [{"name": "clothing", "confidence": round(rng.uniform(0.5, 0.9), 4)}]}
+            for _ in range(cfg.objects)
+        ]},
+        "tagsResult": {"values": [{"name": n, "confidence": 0.9} for n in ("clothing", "t-shirt", "logo", "sleeve")]},
+    }
+
+def chat_response(model: str, cfg: StubConfig, prompt_tokens: int = 0) -> dict:
+    content = {
+        "bboxes": [
+            {"label": "ART_COLLISION", "crop_index": 0, "x_min": 0.45, "y_min": 0.30 + 0.1 * i, "x_max": 0.55, "y_max": 0.38 + 0.1 * i, "confidence": 0.8}
+            for i in range(cfg.bboxes)
+        ],
+        "rationale_summary": "Pixelated noisy block over the chest logo.",
+    }
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(content)}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 60, "total_tokens": prompt_tokens + 60},
+    }
+
+
+def make_handler(cfg: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+            cfg.count(response_bytes=len(data))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            cfg.count(request_bytes=len(body))
+            path = self.path.split("?")[0]
+            if cfg.throttle():
+                cfg.count(throttled=1)
+                return self._reply(429, {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                                   {"Retry-After": f"{cfg.retry_after_s:g}"})
+            if path.endswith("/imageanalysis:analyze"):
+                cfg.count(vision=1)
+                cfg.sleep(cfg.vision_latency_ms)
+                return self._reply(200, vision_response(*image_size(body), cfg))
+            if path.endswith("/chat/completions"):
+                cfg.count(openai=1)
+                cfg.sleep(cfg.openai_latency_ms)
+                model = json.loads(body or b"{}").get("model", "stub")
+                return self._reply(200, chat_response(model, cfg, prompt_tokens=len(body) // 4)) # rough proxy for the token count
+            self._reply(404, {"error": {"code": "404", "message": f"Unknown path {path}"}})
+
+    return Handler
+
+
+def start_stub_server(cfg: StubConfig = None, host: str = "127.0.0.1", port: int = 0):
+    """Start the stub on a background thread. Returns (server, base_url); stop with server.shutdown()."""
+    cfg = cfg or StubConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(cfg))
+    server.daemon_threads = True
+    server.config = cfg
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
@@ -0,0 +1,77 @@
+# Synthetic garment-like test images for the benchmarks.
+# A flat background, a T-shirt silhouette with a woven-fabric texture, seams,
+# a printed logo (text + shapes) and, optionally, a noisy "art collision" patch
+# over the logo, so every pipeline stage has realistic work to do.
+
+# Imports
+import os, cv2 # requires opencv-python
+import numpy as np
+
+RESOLUTIONS_MP = (1, 4, 12, 24)
+
+
+def size_for_megapixels(mp: float, aspect: float = 4 / 3) -> tuple:
+    """(W, H) with W / H = aspect and W * H ~ mp million pixels."""
+    H = int(round((mp * 1e6 / aspect) ** 0.5))
+    return int(round(H * aspect)), H
+
+def garment_image(W: int, H: int, seed: int = 0, collision: bool = True) -> np.ndarray:
+    """BGR uint8 image of a T-shirt on a light background."""
+    rng = np.random.default_rng(seed)
+    img = np.full((H, W, 3), 235, np.uint8)
+
+    # T-shirt silhouette (body + sleeves), in relative coordinates
+    shirt = np.array([
+        (0.30, 0.12), (0.42, 0.08), (0.58, 0.08), (0.70, 0.12), (0.88, 0.30), (0.78, 0.40),
+        (0.70, 0.33), (0.70, 0.92), (0.30, 0.92), (0.30, 0.33), (0.22, 0.40), (0.12, 0.30),
+    ])
+    pts = (shirt * [W, H]).astype(np.int32)
+    color = tuple(int(c) for c in rng.integers(40, 200, 3))
+    mask = np.zeros((H, W), np.uint8)
+    cv2.fillPoly(mask, [pts], 255)
+
+    # woven texture: low-amplitude periodic pattern + noise, only inside the garment
+    yy, xx = np.mgrid[0:H, 0:W].astype(np.float32)
+    period = max(4.0, W / 400.0)
+    weave = (np.sin(xx * 2 * np.pi / period) * np.sin(yy * 2 * np.pi / period) * 8).astype(np.float32)
+    del yy, xx
+    noise = rng.normal(0, 4, (H, W)).astype(np.float32)
+    fabric = np.empty((H, W, 3), np.float32)
+    fabric[:] = color
+    fabric += (weave + noise)[..., None]
+    del weave, noise
+    np.copyto(img, np.clip(fabric, 0, 255).astype(np.uint8), where=mask[..., None] > 0)
+    del fabric
+
+    # seams and collar
+    t = max(1, W // 800)
+    cv2.polylines(img, [pts], True, (30, 30, 30), t * 2, cv2.LINE_AA)
+    cv2.ellipse(img, (W // 2, int(0.09 * H)), (int(0.08 * W), int(0.04 * H)), 0, 0, 180, (20, 20, 20), t * 3, cv2.LINE_AA)
+    for x in (0.30, 0.70):
+        cv2.line(img, (int(x * W), int(0.33 * H)), (int(x * W), int(0.92 * H)), (60, 60, 60), t, cv2.LINE_AA)
+
+    # logo: circle + text on the chest
+    cx, cy = W // 2, int(0.35 * H)
+    cv2.circle(img, (cx, cy), int(0.06 * W), (255, 255, 255), -1, cv2.LINE_AA)
+    cv2.putText(img, "GUESS", (cx - int(0.09 * W), cy + int(0.14 * H)), cv2.FONT_HERSHEY_DUPLEX,
+                W / 700.0, (250, 250, 250), max(1, W // 300), cv2.LINE_AA)
+
+    # art collision: broken / pixelated area over the logo
+    if collision:
+        s = int(0.05 * W)
+        x0, y0 = cx - s // 2, cy - s // 2
+        img[y0:y0 + s, x0:x0 + s] = rng.integers(0, 255, (s, s, 3), dtype=np.uint8)
+    return img
+
+def generate_images(folder: str, resolutions_mp=RESOLUTIONS_MP, per_resolution: int = 2) -> list:
+    """Write per_resolution PNGs for each resolution into folder; returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for mp in resolutions_mp:
+        W, H = size_for_megapixels(mp)
+        for i in range(per_resolution):
+            path = os.path.join(folder, f"SYNTH{mp:02d}MP-{i:03d}.png")
+            if not os.path.exists(path):
+                cv2.imwrite(path, garment_image(W, H, seed=i, collision=i % 2 == 0), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            paths.append(path)
+    return paths
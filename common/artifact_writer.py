@@ -0,0 +1,252 @@
+# Background artifact writer.
+# Encodes and writes the image artifacts (00_original copy, 02A/02B overlays,
+# 03A/03B hotspots, 04_genai_bboxes) on a bounded thread pool, off the critical
+# path of the pipeline, with a per-artifact output format:
+#   {"format": "png", "compress_level": 1}   # 0..9, lower = faster / bigger
+#   {"format": "webp", "lossless": True}     # or {"format": "webp", "quality": 80}
+#   {"format": "jpeg", "quality": 90}
+#   {"format": "skip"}                       # do not write this artifact
+# The original copy can be a hard link or a reflink (copy-on-write clone) instead of a copy.
+#
+# Environment (see writer_from_env):
+#   ARTIFACT_FORMATS  : e.g. "02A_roi_overlay=skip,03B_hotspots_overlay=jpeg:85,*=png:1"
+#   ORIGINAL_MODE     : copy (default) | hardlink | reflink
+#   ARTIFACT_WRITERS  : writer threads (default 2)
+
+# Imports
+import os, shutil, threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2 # requires opencv-python
+import numpy as np
+from .utils import copy_file
+
+EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+FICLONE = 0x40049409  # linux/fs.h, reflink ioctl
+
+
+def parse_format(text: str) -> dict:
+    """"png", "png:1", "webp", "webp:80", "jpeg:90", "skip" -> format spec dict"""
+    name, _, level = text.strip().lower().partition(":")
+    name = "jpeg" if name == "jpg" else name
+    spec = {"format": name}
+    if name == "png" and level:
+        spec["compress_level"] = int(level)
+    elif name == "webp":
+        if level:
+            spec["quality"] = int(level)
+        else:
+            spec["lossless"] = True
+    elif name == "jpeg":
+        spec["quality"] = int(level or 90)
+    elif name != "skip" and name != "png":
+        raise ValueError(f"Unknown artifact format <{text}>")
+    return spec
+
+
+# region Synchronous encoding
+def partial_path(path: str) -> str:
+    """Temporary name an artifact is written to before being renamed, so that an
+    interrupted run never leaves a truncated file under the final name."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+def encode_to_file(image, path: str, spec: dict) -> None:
+    """Write a PIL image or a BGR numpy array to path according to spec."""
+    fmt = spec.get("format", "png")
+    final_path, path = path, partial_path(path)
+    if isinstance(image, np.ndarray):
+        params = []
+        if fmt == "png" and "compress_level" in spec:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, spec["compress_level"]]
+        elif fmt == "jpeg":
+            params = [cv2.IMWRITE_JPEG_QUALITY, spec.get("quality", 90)]
+        elif fmt == "webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, 101 if spec.get("lossless") else spec.get("quality", 80)]
+        if not cv2.imwrite(path, image, params):
+            raise OSError(f"Could not write artifact {path}")
+    else:
+        kwargs = {}
+        if fmt == "png" and "compress_level" in spec:
+            kwargs["compress_level"] = spec["compress_level"]
+        elif fmt == "jpeg":
+            kwargs["quality"] = spec.get("quality", 90)
+        elif fmt == "webp":
+            kwargs = {"lossless": True} if spec.get("lossless") else {"quality": spec.get("quality", 80)}
+        image.save(path, format=fmt.upper(), **kwargs)
+    os.replace(path, final_path)
+
+def link_or_copy(source_file: str, target_file: str, mode: str = "copy") -> None:
+    """Materialize the original as a copy, a hard link or a reflink; falls back to a copy."""
+    os.makedirs(os.path.dirname(target_file) or ".", exist_ok=True)
+    if mode in ("hardlink", "reflink") and os.path.lexists(target_file):
+        os.remove(target_file)
+    if mode == "hardlink":
+        try:
+            os.link(source_file, target_file)
+            return
+        except OSError:
+            pass  # e.g. different filesystems
+    elif mode == "reflink":
+        try:
+            import fcntl
+            with open(source_file, "rb") as src, open(target_file, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source_file, target_file)
+            return
+        except (ImportError, OSError):
+            pass  # filesystem without copy-on-write clones
+    copy_file(source_file=source_file, target_file=partial_path(target_file))
+    os.replace(partial_path(target_file), target_file)
+#endregion
+
+
+class ArtifactWriter:
+    """
+    Bounded background writer. write_image() returns the final artifact path
+    (extension follows the chosen format, None when skipped) as soon as the job
+    is queued; it blocks only when max_pending jobs are already waiting.
+    Call flush() at the end of the run: it waits for every job and reports errors;
+    scope() gives one image a handle to wait for its own jobs.
+    """
+    def __init__(self, formats: dict = None, max_workers: int = 2, max_pending: int = 8, original_mode: str = "copy"):
+        self.formats = dict(formats or {})  # artifact postfix (e.g. "02A_roi_overlay") or "*" -> spec
+        self.original_mode = original_mode
+        self.errors = []
+        self._slots = threading.Semaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact")
+
+    def spec_for(self, path: str) -> dict:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for postfix, spec in self.formats.items():
+            if postfix != "*" and stem.endswith(postfix):
+                return spec
+        return self.formats.get("*", {"format": "png"})
+
+    def target_path(self, path: str) -> str:
+        """Final path of an artifact, or None if its format is "skip"."""
+        spec = self.spec_for(path)
+        if spec["format"] == "skip":
+            return None
+        return f"{os.path.splitext(path)[0]}.{EXTENSIONS[spec['format']]}"
+
+    def _submit(self, job, *args):
+        self._slots.acquire()  # backpressure on the producer
+        future = self._executor.submit(job, *args)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+        if future.exception() is not None:
+            print(f"Artifact writer error: {future.exception()!r}")
+            self.errors.append(future.exception())
+
+    def write_image(self, path: str, image, encoded: bytes = None) -> str:
+        """
+        Queue a PIL image or BGR array for path. encoded (PNG bytes of the same image)
+        is written as-is when the artifact format is PNG with default compression.
+        """
+        spec = self.spec_for(path)
+        target = self.target_path(path)
+        if target is None:
+            return None
+        if encoded is not None and spec == {"format": "png"}:
+            self._submit(self._write_bytes, target, encoded)
+        else:
+            self._submit(encode_to_file, image, target, spec)
+        return target
+
+    def copy_original(self, source_file: str, target_file: str) -> str:
+        """Queue the 00_original artifact (copy / hardlink / reflink per original_mode)."""
+        if self.spec_for(target_file)["format"] == "skip":
+            return None
+        self._submit(link_or_copy, source_file, target_file, self.original_mode)
+        return target_file
+
+    @staticmethod
+    def _write_bytes(path: str, data: bytes):
+        with open(partial_path(path), "wb") as f:
+            f.write(data)
+        os.replace(partial_path(path), path)
+
+    def scope(self) -> "WriterScope":
+        """Handle for the artifacts of one image: same interface, plus wait() for its own jobs only."""
+        return WriterScope(self)
+
+    def flush(self) -> None:
+        """Wait for every queued artifact (end of the run: other producers may still be queueing)."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    pass  # already reported by _done
+        if self.errors:
+            print(f"{len(self.errors)} artifacts could not be written.")
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+
+class WriterScope:
+    """
+    View of an ArtifactWriter that records the jobs queued through it, so that one
+    image (a daemon job, a watched file) waits for its own artifacts, not for the
+    whole queue. Everything else is delegated to the writer.
+    """
+    def __init__(self, writer: ArtifactWriter):
+        self.writer = writer
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def _submit(self, job, *args):
+        future = self.writer._submit(job, *args)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    write_image = ArtifactWriter.write_image
+    copy_original = ArtifactWriter.copy_original
+
+    def wait(self) -> list:
+        """Wait for the jobs queued through this scope; returns their errors (already reported by the writer)."""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        return [f.exception() for f in futures if f.exception() is not None]
+
+
+def save_image(image, path: str, writer: ArtifactWriter = None, encoded: bytes = None) -> str:
+    """Write an image artifact through writer, or synchronously (PNG, default settings) without one."""
+    if writer is not None:
+        return writer.write_image(path, image, encoded=encoded)
+    if encoded is not None:
+        ArtifactWriter._write_bytes(path, encoded)
+    else:
+        encode_to_file(image, path, {"format": "png"})
+    return path
+
+
+def writer_from_env() -> ArtifactWriter:
+    formats = {}
+    for item in filter(None, os.getenv("ARTIFACT_FORMATS", "").split(",")):
+        postfix, _, fmt = item.partition("=")
+        formats[postfix.strip()] = parse_format(fmt)
+    return ArtifactWriter(
+        formats=formats,
+        max_workers=int(os.getenv("ARTIFACT_WRITERS", "2")),
+        original_mode=os.getenv("ORIGINAL_MODE", "copy"),
+    )
@@ -0,0 +1,75 @@
+# Array-backed box utilities: batched IoU matrices and greedy NMS.
+# Boxes are (..., 4) arrays in corner format (x1, y1, x2, y2).
+
+# Imports
+import numpy as np
+
+
+def xywh_to_xyxy(boxes):
+    """(N,4) x,y,w,h -> (N,4) x1,y1,x2,y2"""
+    b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.concatenate([b[:, :2], b[:, :2] + b[:, 2:]], axis=1)
+
+def proposals_to_array(proposals: list):
+    """Proposal dicts (bbox = {x,y,w,h}) -> (N,4) x1,y1,x2,y2 array."""
+    if not proposals:
+        return np.zeros((0, 4), dtype=np.float64)
+    xywh = np.array([[p["bbox"]["x"], p["bbox"]["y"], p["bbox"]["w"], p["bbox"]["h"]] for p in proposals], dtype=np.float64)
+    return xywh_to_xyxy(xywh)
+
+def iou_matrix(a, b):
+    """
+    IoU between every box of a (..., N, 4) and every box of b (..., M, 4),
+    returned as (..., N, M). Leading dimensions broadcast, so a stack of
+    images can be scored in one call. Zero-area unions give IoU 0.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    ax1, ay1, ax2, ay2 = (a[..., :, None, k] for k in range(4))
+    bx1, by1, bx2, by2 = (b[..., None, :, k] for k in range(4))
+    inter = np.minimum(ax2, bx2)
+    inter -= np.maximum(ax1, bx1)
+    np.maximum(inter, 0, out=inter)
+    ih = np.minimum(ay2, by2)
+    ih -= np.maximum(ay1, by1)
+    np.maximum(ih, 0, out=ih)
+    inter *= ih
+    union = ih  # reuse the buffer
+    np.add((ax2 - ax1) * (ay2 - ay1), (bx2 - bx1) * (by2 - by1), out=union)
+    union -= inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def nms(boxes, iou_threshold, order=None, chunk: int = 256):
+    """
+    Greedy non-maximum suppression.
+
+    boxes         : (N,4) x1,y1,x2,y2
+    iou_threshold : scalar, or (N,) per-box threshold; box j is suppressed when its
+                    IoU with an already kept box is >= iou_threshold[j]
+    order         : visiting order (highest priority first), default 0..N-1
+    chunk         : IoU rows are computed chunk boxes at a time, bounding memory to
+                    chunk x N floats for very large N
+
+    Returns the indices of the kept boxes, in visiting order.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.arange(n) if order is None else np.asarray(order, dtype=np.int64)
+    thr = np.broadcast_to(np.asarray(iou_threshold, dtype=np.float64), (n,))[order]
+    boxes = boxes[order]
+
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        # which later boxes each box of this chunk would suppress
+        hits = iou_matrix(boxes[start:stop], boxes[start:]) >= thr[start:]
+        for i in range(start, stop):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            # marks i itself and earlier boxes too, which are already decided
+            suppressed[start:] |= hits[i - start]
+    return order[np.array(keep, dtype=np.int64)]
@@ -0,0 +1,163 @@
+# Region crops for the GenAI crop mode.
+# Instead of the full original + full heatmap, genai_analysis can send the top-K
+# candidate regions as padded crops, each one image with the original crop on the
+# left and the heatmap crop on the right. Candidates come from:
+#   - "hotspots" : hot regions of the heat map (see common/prescreen.py), ranked by mean heat
+#   - "roi"      : roi_identification proposals (<= max_area_frac of the frame), ranked
+#                  by confidence x mean heat inside the box
+# Candidates are padded, strongly overlapping ones (IoU >= merge_iou) are merged,
+# and the model answers with
+# boxes normalized to one crop (crop_index); map_to_full maps them back to the
+# full image before draw_bboxes.
+#
+# Options (dict, None = full-frame mode):
+#   {"top_k": 4, "pad": 0.15, "min_side": 96, "max_side": 768, "max_area_frac": 0.25,
+#    "merge_iou": 0.3, "sources": ["hotspots", "roi"], "quality": 85}
+
+# Imports
+import os, cv2 # requires opencv-python
+import numpy as np
+from .prescreen import hot_regions
+from .boxes import iou_matrix
+from .utils import options_from_env
+
+DEFAULT_CROPS = {
+    "top_k": 4,           # crops per request
+    "pad": 0.15,          # padding, fraction of the region side
+    "min_side": 96,       # minimum crop side, in original pixels
+    "max_side": 768,      # each panel is downscaled to this side
+    "max_area_frac": 0.25, # larger ROI proposals are not crop candidates
+    "merge_iou": 0.3,     # padded candidates overlapping at least this much are merged
+    "sources": ["hotspots", "roi"],
+    "quality": 85,        # JPEG quality of the crop images
+}
+GAP = 8  # white separator between the original and heatmap panels
+
+
+# region Region selection
+def region_candidates(W: int, H: int, heat: np.ndarray = None, roi_payload: dict = None,
+                      sources=("hotspots", "roi"), max_area_frac: float = 0.25) -> tuple:
+    """(N,4) x1,y1,x2,y2 candidate boxes in original pixels and their (N,) scores."""
+    boxes, scores = [], []
+    integral = cv2.integral(heat) if heat is not None else None
+
+    def mean_heat(x1, y1, x2, y2):
+        if integral is None:
+            return 255.0
+        x1, y1, x2, y2 = int(x1), int(y1), max(int(x1) + 1, int(x2)), max(int(y1) + 1, int(y2))
+        s = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        return float(s) / ((x2 - x1) * (y2 - y1))
+
+    if "hotspots" in sources and heat is not None:
+        for r in hot_regions(heat):
+            b = r["bbox"]
+            boxes.append([b["x"], b["y"], b["x"] + b["w"], b["y"] + b["h"]])
+            scores.append(r["mean_heat"] / 255.0)
+    if "roi" in sources and roi_payload:
+        for p in roi_payload.get("proposals", []):
+            b = p["bbox"]
+            if b["w"] * b["h"] > max_area_frac * W * H:
+                continue
+            x1, y1 = max(0, b["x"]), max(0, b["y"])
+            x2, y2 = min(W, b["x"] + b["w"]), min(H, b["y"] + b["h"])
+            if x2 <= x1 or y2 <= y1:
+                continue
+            boxes.append([x1, y1, x2, y2])
+            scores.append(p.get("confidence", 0.0) * mean_heat(x1, y1, x2, y2) / 255.0)
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4), np.array(scores, dtype=np.float64)
+
+def pad_boxes(boxes: np.ndarray, W: int, H: int, pad: float, min_side: int) -> np.ndarray:
+    """Grow each box by pad x its side (at least min_side overall), clipped to the image."""
+    b = boxes.copy()
+    size = b[:, 2:] - b[:, :2]
+    grow = np.maximum(size * pad, (min_side - size) / 2)
+    np.maximum(grow, 0, out=grow)
+    b[:, :2] -= grow
+    b[:, 2:] += grow
+    np.clip(b[:, 0::2], 0, W, out=b[:, 0::2])
+    np.clip(b[:, 1::2], 0, H, out=b[:, 1::2])
+    return b
+
+def merge_boxes(boxes: np.ndarray, scores: np.ndarray, min_iou: float = 0.3) -> tuple:
+    """
+    Replace any two boxes overlapping with IoU >= min_iou by their union, until
+    none is left; a merged box keeps the best score. Small boxes nested in large
+    ones stay separate, so a tight hot region is not diluted into a big proposal.
+    """
+    boxes, scores = boxes.copy(), scores.copy()
+    while len(boxes) > 1:
+        iou = iou_matrix(boxes, boxes)
+        np.fill_diagonal(iou, 0)
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < min_iou:
+            break
+        boxes[i] = [min(boxes[i, 0], boxes[j, 0]), min(boxes[i, 1], boxes[j, 1]),
+                    max(boxes[i, 2], boxes[j, 2]), max(boxes[i, 3], boxes[j, 3])]
+        scores[i] = max(scores[i], scores[j])
+        boxes, scores = np.delete(boxes, j, axis=0), np.delete(scores, j)
+    return boxes, scores
+
+def select_regions(W: int, H: int, heat: np.ndarray = None, roi_payload: dict = None, options: dict = None) -> list:
+    """Top-K padded, merged regions as [x1, y1, x2, y2] int lists; the full frame when there is no candidate."""
+    options = {**DEFAULT_CROPS, **(options or {})}
+    boxes, scores = region_candidates(W, H, heat, roi_payload, options["sources"], options["max_area_frac"])
+    if not len(boxes):
+        return [[0, 0, W, H]]
+    order = np.argsort(-scores, kind="stable")[: 4 * options["top_k"]]
+    boxes, scores = merge_boxes(pad_boxes(boxes[order], W, H, options["pad"], options["min_side"]), scores[order], options["merge_iou"])
+    order = np.argsort(-scores, kind="stable")[: options["top_k"]]
+    return [[int(np.floor(b[0])), int(np.floor(b[1])), int(np.ceil(b[2])), int(np.ceil(b[3]))] for b in boxes[order]]
+#endregion
+
+
+# region Crop images and coordinates
+def crop_pair(bgr: np.ndarray, heat_color: np.ndarray, region: list, max_side: int = 768) -> np.ndarray:
+    """Original crop | white gap | heatmap crop, each panel fitted within max_side."""
+    x1, y1, x2, y2 = region
+    left, right = bgr[y1:y2, x1:x2], heat_color[y1:y2, x1:x2]
+    h, w = left.shape[:2]
+    f = min(1.0, max_side / float(max(h, w)))
+    if f < 1.0:
+        size = (max(1, round(w * f)), max(1, round(h * f)))
+        left = cv2.resize(left, size, interpolation=cv2.INTER_AREA)
+        right = cv2.resize(right, size, interpolation=cv2.INTER_AREA)
+    gap = np.full((left.shape[0], GAP, 3), 255, np.uint8)
+    return np.hstack([left, gap, right])
+
+def encode_crops(bgr: np.ndarray, heat_color: np.ndarray, regions: list, options: dict = None) -> list:
+    """JPEG bytes of one side-by-side image per region."""
+    options = {**DEFAULT_CROPS, **(options or {})}
+    encoded = []
+    for region in regions:
+        ok, buf = cv2.imencode(".jpg", crop_pair(bgr, heat_color, region, options["max_side"]),
+                               [cv2.IMWRITE_JPEG_QUALITY, int(options["quality"])])
+        if not ok:
+            raise ValueError(f"Could not encode crop {region}")
+        encoded.append(buf.tobytes())
+    return encoded
+
+def map_to_full(payload: dict, regions: list, W: int, H: int) -> dict:
+    """Boxes normalized to crop crop_index -> normalized to the full image. Boxes of unknown crops are dropped."""
+    bboxes = []
+    for b in payload.get("bboxes", []):
+        i = b.get("crop_index")
+        if not isinstance(i, int) or not 0 <= i < len(regions):
+            continue
+        x1, y1, x2, y2 = regions[i]
+        cw, ch = x2 - x1, y2 - y1
+        bboxes.append({
+            **b,
+            "x_min": min(1.0, max(0.0, (x1 + b["x_min"] * cw) / W)),
+            "y_min": min(1.0, max(0.0, (y1 + b["y_min"] * ch) / H)),
+            "x_max": min(1.0, max(0.0, (x1 + b["x_max"] * cw) / W)),
+            "y_max": min(1.0, max(0.0, (y1 + b["y_max"] * ch) / H)),
+        })
+    return {**payload, "bboxes": bboxes, "crop_regions": regions}
+
+def crop_options_from_env() -> dict:
+    """GENAI_MODE=crops enables the crop mode; GENAI_CROP_<OPTION> overrides DEFAULT_CROPS. None = full frames."""
+    if os.getenv("GENAI_MODE", "full").lower() != "crops":
+        return None
+    options = options_from_env(DEFAULT_CROPS, "GENAI_CROP_")
+    return options
+#endregion
@@ -0,0 +1,242 @@
+# Evaluation of the pipeline against labeled images.
+# Sources, all brought to normalized [0..1] corner boxes (x1, y1, x2, y2):
+#   - labels      : AutoML object detection JSONL (notebook 03), one image per line:
+#                   {"image_url": ".../<folder>/<image>.png", "image_details": {...},
+#                    "label": [{"label", "topX", "topY", "bottomX", "bottomY"}]}
+#   - predictions : genai_analysis outputs (<image>_04_genai_bboxes.json, normalized), one folder per run
+#   - proposals   : roi_identification outputs (<image>_01_ROI.json, pixels), normalized with the image size
+# All images are scored at once: boxes are padded into (images, boxes, 4) arrays, one
+# batched IoU matrix is computed per source, and predictions are matched greedily
+# (highest confidence first, each label matched at most once, IoU >= iou_threshold),
+# one prediction rank at a time across all images.
+# Reported per label and per folder (the image_url parent folder):
+#   precision / recall of the predictions, AP (all-point interpolated) and mAP, and the
+#   ROI recall: labels overlapped (IoU >= iou_threshold) or contained by a proposal.
+# Several runs (e.g. system_message_multimodal.txt vs the v1_baseline prompt) are
+# scored on the same labels, for prompt A/B tests.
+#
+# Usage:
+#   python -m common.evaluation --labels labels/val.jsonl --runs artifacts/prompt_v2 artifacts/prompt_v1 [--iou 0.5] [--out artifacts/eval.json]
+
+# Imports
+import os, json, time, argparse
+import numpy as np
+from .boxes import iou_matrix
+from .proposal_store import artifact_kind, image_size, payload_rows
+
+DEFAULT_IOU = 0.5
+
+
+# region Loading
+def load_labels(paths) -> dict:
+    """image name -> {"folder", "boxes" (M,4), "labels" [M]} from AutoML JSONL files."""
+    images = {}
+    for path in [paths] if isinstance(paths, str) else paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in filter(str.strip, f):
+                item = json.loads(line)
+                url = item["image_url"].rstrip("/")
+                name = os.path.splitext(os.path.basename(url))[0]
+                labels = item.get("label") or []
+                images[name] = {
+                    "folder": os.path.basename(os.path.dirname(url)),
+                    "boxes": np.array([[l["topX"], l["topY"], l["bottomX"], l["bottomY"]] for l in labels], np.float64).reshape(-1, 4),
+                    "labels": [l["label"] for l in labels],
+                }
+    return images
+
+def load_run(folder: str, images_dirs=()) -> tuple:
+    """
+    ({image: (boxes (N,4), scores (N,), labels [N])} of the GenAI outputs,
+     {image: boxes (P,4)} of the ROI proposals) of one run folder.
+    """
+    predictions, proposals = {}, {}
+    for root, _, files in os.walk(folder):
+        for file in files:
+            name, kind = artifact_kind(file)
+            if kind is None:
+                continue
+            path = os.path.join(root, file)
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if kind == "genai":
+                rows = payload_rows("genai", payload, None)
+                predictions[name] = (
+                    np.array([r[1:5] for r in rows], np.float64).reshape(-1, 4),
+                    np.array([r[5] for r in rows], np.float64),
+                    [r[6] for r in rows],
+                )
+            else:
+                size = image_size(path, name, payload, images_dirs)
+                if size is not None:
+                    proposals[name] = np.array([r[1:5] for r in payload_rows("roi", payload, size)], np.float64).reshape(-1, 4)
+    return predictions, proposals
+#endregion
+
+
+# region Matching
+def pad(arrays: list, fill=0.0, dtype=np.float64) -> tuple:
+    """(B, max N, ...) padded stack of arrays of shape (N, ...) and its (B, max N) validity mask."""
+    n = max([len(a) for a in arrays] + [1])
+    tail = next((np.shape(a)[1:] for a in arrays if len(a)), ())
+    out = np.full((len(arrays), n, *tail), fill, dtype=dtype)
+    valid = np.zeros((len(arrays), n), bool)
+    for i, a in enumerate(arrays):
+        out[i, :len(a)] = a
+        valid[i, :len(a)] = True
+    return out, valid
+
+def match_greedy(pred, pred_valid, scores, pred_labels, gt, gt_valid, gt_labels, iou_threshold: float = DEFAULT_IOU) -> tuple:
+    """
+    Greedy matching of a padded batch: pred (B,N,4), scores / pred_labels / pred_valid (B,N),
+    gt (B,M,4), gt_labels / gt_valid (B,M). Predictions are visited by decreasing score;
+    each takes the unmatched label box of the same label with the highest IoU >= iou_threshold.
+    Returns (tp (B,N) bool, gt_matched (B,M) bool).
+    """
+    B, N = pred_valid.shape
+    iou = iou_matrix(pred, gt)
+    same = (pred_labels[:, :, None] == gt_labels[:, None, :]) & pred_valid[:, :, None] & gt_valid[:, None, :]
+    iou = np.where(same, iou, -1.0)
+    order = np.argsort(np.where(pred_valid, -scores, np.inf), axis=1, kind="stable")
+    rows = np.arange(B)
+    tp = np.zeros((B, N), bool)
+    gt_matched = np.zeros(gt_valid.shape, bool)
+    for k in range(N):
+        p = order[:, k]
+        cand = np.where(gt_matched, -1.0, iou[rows, p])
+        best = cand.argmax(axis=1)
+        ok = cand[rows, best] >= iou_threshold
+        tp[rows[ok], p[ok]] = True
+        gt_matched[rows[ok], best[ok]] = True
+    return tp, gt_matched
+
+def covered(proposals, proposals_valid, gt, gt_valid, iou_threshold: float = DEFAULT_IOU) -> tuple:
+    """(overlapped (B,M), contained (B,M)): label boxes with a proposal of IoU >= iou_threshold / containing them."""
+    iou = np.where(proposals_valid[:, None, :], iou_matrix(gt, proposals), -1.0)
+    inside = (
+        (proposals[:, None, :, 0] <= gt[:, :, None, 0]) & (proposals[:, None, :, 1] <= gt[:, :, None, 1]) &
+        (proposals[:, None, :, 2] >= gt[:, :, None, 2]) & (proposals[:, None, :, 3] >= gt[:, :, None, 3]) &
+        proposals_valid[:, None, :]
+    )
+    return (iou >= iou_threshold).any(axis=2) & gt_valid, inside.any(axis=2) & gt_valid
+
+def average_precision(scores: np.ndarray, tp: np.ndarray, n_gt: int) -> float:
+    """All-point interpolated AP of predictions (scores, tp flags) against n_gt label boxes."""
+    if n_gt == 0:
+        return float("nan")
+    if len(scores) == 0:
+        return 0.0
+    order = np.argsort(-scores, kind="stable")
+    hits = np.cumsum(tp[order])
+    recall = np.concatenate([[0.0], hits / n_gt])
+    precision = np.concatenate([[1.0], hits / np.arange(1, len(order) + 1)])
+    precision = np.maximum.accumulate(precision[::-1])[::-1] # precision envelope
+    return float(np.sum(np.diff(recall) * precision[1:]))
+#endregion
+
+
+# region Scoring
+def evaluate(labels: dict, predictions: dict, proposals: dict = None, iou_threshold: float = DEFAULT_IOU) -> dict:
+    """
+    Score one run on the labeled images. Images without a GenAI output count as
+    predicting nothing. Returns {"overall", "labels": {label: ...}, "folders": {folder: ...},
+    "images", "missing"}; each group has precision, recall, ap, tp, predictions, labels
+    (mAP = mean AP over labels), plus roi_recall / roi_contained when proposals are given.
+    """
+    names = sorted(labels)
+    empty = (np.zeros((0, 4)), np.zeros(0), [])
+    vocab = {l: i for i, l in enumerate(sorted({l for n in names for l in labels[n]["labels"]} |
+                                              {l for n in names for l in predictions.get(n, empty)[2]}))}
+    gt, gt_valid = pad([labels[n]["boxes"] for n in names])
+    gt_labels, _ = pad([np.array([vocab[l] for l in labels[n]["labels"]], np.int64) for n in names], fill=-1, dtype=np.int64)
+    pred, pred_valid = pad([predictions.get(n, empty)[0] for n in names])
+    scores, _ = pad([predictions.get(n, empty)[1] for n in names])
+    pred_labels, _ = pad([np.array([vocab[l] for l in predictions.get(n, empty)[2]], np.int64) for n in names], fill=-2, dtype=np.int64)
+    tp, _ = match_greedy(pred, pred_valid, scores, pred_labels, gt, gt_valid, gt_labels, iou_threshold)
+    if proposals is not None:
+        props, props_valid = pad([proposals.get(n, np.zeros((0, 4))) for n in names])
+        overlapped, contained = covered(props, props_valid, gt, gt_valid, iou_threshold)
+
+    folders = np.array([labels[n]["folder"] for n in names], dtype=object)
+
+    def score(image_mask: np.ndarray, label: int = None) -> dict:
+        pm = pred_valid & image_mask[:, None]
+        gm = gt_valid & image_mask[:, None]
+        if label is not None:
+            pm &= pred_labels == label
+            gm &= gt_labels == label
+        n_pred, n_gt, n_tp = int(pm.sum()), int(gm.sum()), int(tp[pm].sum())
+        result = {
+            "images": int(image_mask.sum()), "predictions": n_pred, "labels": n_gt, "tp": n_tp,
+            "precision": n_tp / n_pred if n_pred else float("nan"),
+            "recall": n_tp / n_gt if n_gt else float("nan"),
+        }
+        if label is None:
+            aps = [average_precision(scores[pm & (pred_labels == l)], tp[pm & (pred_labels == l)], int((gm & (gt_labels == l)).sum()))
+                   for l in vocab.values() if (gm & (gt_labels == l)).any()]
+            result["ap"] = float(np.mean(aps)) if aps else float("nan") # mAP over labels
+        else:
+            result["ap"] = average_precision(scores[pm], tp[pm], n_gt)
+        if proposals is not None:
+            result["roi_recall"] = float(overlapped[gm].mean()) if n_gt else float("nan")
+            result["roi_contained"] = float(contained[gm].mean()) if n_gt else float("nan")
+        return result
+
+    everything = np.ones(len(names), bool)
+    return {
+        "overall": score(everything),
+        "labels": {l: score(everything, i) for l, i in vocab.items()},
+        "folders": {f: score(folders == f) for f in sorted(set(folders))},
+        "images": len(names),
+        "missing": sum(n not in predictions for n in names),
+    }
+
+def print_report(run: str, result: dict) -> None:
+    def line(name, r):
+        roi = f" {r['roi_recall']:>8.3f} {r['roi_contained']:>8.3f}" if "roi_recall" in r else ""
+        print(f"  {name[:32]:<32} {r['images']:>6} {r['labels']:>6} {r['predictions']:>6} {r['precision']:>9.3f} {r['recall']:>7.3f} {r['ap']:>7.3f}{roi}")
+
+    print(f"Run {run}: {result['images']} labeled images, {result['missing']} without GenAI output")
+    roi = f" {'roi_rec':>8} {'roi_in':>8}" if "roi_recall" in result["overall"] else ""
+    print(f"  {'':<32} {'images':>6} {'labels':>6} {'preds':>6} {'precision':>9} {'recall':>7} {'AP':>7}{roi}")
+    line("ALL (mAP)", result["overall"])
+    for label, r in result["labels"].items():
+        line(f"label {label}", r)
+    for folder, r in result["folders"].items():
+        line(f"folder {folder}", r)
+#endregion
+
+
+# ---------- Main function ----------
+def main():
+    parser = argparse.ArgumentParser(description="Score GenAI boxes and ROI proposals against AutoML JSONL labels.")
+    parser.add_argument("--labels", nargs="+", required=True, help="AutoML object detection JSONL files")
+    parser.add_argument("--runs", nargs="+", default=["artifacts"], help="artifact folders, one per run (e.g. one per prompt)")
+    parser.add_argument("--images", nargs="*", default=[], help="folders of the source images (for the ROI image sizes)")
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU, help="IoU threshold of a match")
+    parser.add_argument("--out", default=None, help="JSON report path")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    report = {}
+    for run in args.runs:
+        t0 = time.perf_counter()
+        predictions, proposals = load_run(run, args.images)
+        t1 = time.perf_counter()
+        report[run] = evaluate(labels, predictions, proposals or None, args.iou)
+        print_report(run, report[run])
+        print(f"  loaded in {t1 - t0:.2f} s, scored in {time.perf_counter() - t1:.2f} s\n")
+
+    if len(args.runs) > 1:
+        base = report[args.runs[0]]["overall"]
+        for run in args.runs[1:]:
+            r = report[run]["overall"]
+            print(f"{run} vs {args.runs[0]}: precision {r['precision'] - base['precision']:+.3f}, "
+                  f"recall {r['recall'] - base['recall']:+.3f}, mAP {r['ap'] - base['ap']:+.3f}")
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"iou_threshold": args.iou, "runs": report}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Persisted hotspot feature planes, for re-weighting without recomputing the features.
+# The hotspot heat is a weighted sum of three normalized feature maps (edge, local
+# variance, high frequency). Computing those maps (Sobel, box filters, Gaussian blur,
+# percentile histograms) is most of the cost of roi_hotspots; the weights only enter
+# the final sum. The store keeps the normalized maps of each image as one interleaved
+# (H, W, maps) uint8 array (.npy, memory-mapped on read), keyed by a hash of the
+# source bytes and of the feature parameters (maps, var_ksize, hf_sigma). A heat for
+# new weights is then one cv2.transform pass over the planes (fuse_planes), and the
+# colormap / overlay are rebuilt from it (reweight).
+# The heat from planes is within 1 level (of 255) of the direct computation (the
+# planes are rounded to 8 bits); with a store, roi_hotspots always fuses from the
+# planes, so cached and fresh results are identical. Native resolution only (the
+# pyramid mode computes its heat directly). Storage: 3 bytes per pixel.
+#
+# Layout:
+#   artifacts/heat_planes/<key[:2]>/<key>.npy : planes
+#   artifacts/heat_planes/index.jsonl         : {"key", "image_path", "maps", "shape"} per stored image
+#
+# Environment (see plane_store_from_env):
+#   HOTSPOT_PLANES     : 1 to store and reuse the planes (default 0)
+#   HOTSPOT_PLANES_DIR : store folder (default artifacts/heat_planes)
+#
+# Usage (weight sweep over every stored image, pre-screening decision per weight set):
+#   python -m common.heat_planes --weights 0.4,0.3,0.3 0.6,0.2,0.2 0.2,0.2,0.6
+
+# Imports
+import os, json, time, argparse, threading
+import cv2 # requires opencv-python
+import numpy as np
+from .response_cache import hash_inputs
+
+PLANES_VERSION = 1 # part of the key: bump when the plane computation changes
+
+_index_lock = threading.Lock()
+
+
+def fuse_planes(planes: np.ndarray, weights) -> np.ndarray:
+    """(H, W) uint8 heat = sum of weights[i] x planes[..., i], in one pass."""
+    weights = np.asarray(weights, np.float32).reshape(1, -1)
+    if planes.shape[2] != weights.shape[1]:
+        raise ValueError(f"{weights.shape[1]} weights for {planes.shape[2]} planes")
+    return cv2.transform(np.ascontiguousarray(planes), weights) # rounded and saturated to 0..255
+
+def reweight(planes: np.ndarray, weights, bgr: np.ndarray = None) -> dict:
+    """Heat, turbo colormap and (with the BGR image) overlay for new weights, like roi_hotspots."""
+    heat = fuse_planes(planes, weights)
+    heat_color = cv2.applyColorMap(heat, cv2.COLORMAP_TURBO)
+    overlay = cv2.addWeighted(bgr, 0.75, heat_color, 0.35, 0) if bgr is not None else None
+    return {"heat": heat, "heat_color": heat_color, "overlay": overlay}
+
+
+class PlaneStore:
+    """Content-addressed store of feature planes. Safe to share between threads and processes (picklable)."""
+    def __init__(self, root: str = "artifacts/heat_planes"):
+        self.root = root
+
+    def key(self, raw: bytes, engine, maps) -> str:
+        """Planes key: source bytes and the engine parameters that change the planes (not the weights)."""
+        return hash_inputs(raw, {"maps": list(maps), "var_ksize": engine.var_ksize, "hf_sigma": engine.hf_sigma, "version": PLANES_VERSION})
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.npy")
+
+    def get(self, key: str) -> np.ndarray:
+        """Memory-mapped (H, W, maps) planes, or None."""
+        try:
+            return np.load(self.path(key), mmap_mode="r")
+        except (OSError, ValueError):
+            return None # missing, or truncated by an interrupted write
+
+    def put(self, key: str, planes: np.ndarray, image_path: str = None, maps=()) -> np.ndarray:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, planes)
+        os.replace(tmp, path) # atomic: readers see the whole file or none
+        with _index_lock, open(os.path.join(self.root, "index.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "image_path": image_path, "maps": list(maps), "shape": list(planes.shape)}) + "\n")
+        return planes
+
+    def entries(self) -> list:
+        """Index entries of the stored planes (latest per key, files still present)."""
+        index = os.path.join(self.root, "index.jsonl")
+        if not os.path.exists(index):
+            return []
+        latest = {}
+        with open(index, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                latest[entry["key"]] = entry
+        return [e for e in latest.values() if os.path.exists(self.path(e["key"]))]
+
+
+def sweep(store: PlaneStore, weight_sets: list, metric, entries: list = None) -> list:
+    """
+    metric(heat, entry) for every stored image and weight set, reading each image's
+    planes once: [{"weights", "values": [...]}] in weight_sets order, plus timings.
+    """
+    entries = store.entries() if entries is None else entries
+    results = [{"weights": list(w), "values": [], "fuse_s": 0.0} for w in weight_sets]
+    for entry in entries:
+        planes = store.get(entry["key"])
+        if planes is None:
+            continue
+        planes = np.ascontiguousarray(planes) # one read from disk / page cache per image
+        for result, weights in zip(results, weight_sets):
+            t0 = time.perf_counter()
+            heat = fuse_planes(planes, weights)
+            result["fuse_s"] += time.perf_counter() - t0
+            result["values"].append(metric(heat, entry))
+    return results
+
+
+def plane_store_from_env() -> PlaneStore:
+    """PlaneStore at HOTSPOT_PLANES_DIR when HOTSPOT_PLANES=1, else None."""
+    if os.getenv("HOTSPOT_PLANES", "0") in ("", "0"):
+        return None
+    return PlaneStore(os.getenv("HOTSPOT_PLANES_DIR", "artifacts/heat_planes"))
+
+
+# ---------- Main function ----------
+def main():
+    from .prescreen import prescreen, gate_from_env
+
+    parser = argparse.ArgumentParser(description="Sweep hotspot weights over the stored feature planes.")
+    parser.add_argument("--weights", nargs="+", required=True, help="weight sets, e.g. 0.4,0.3,0.3 (one per stored map)")
+    parser.add_argument("--root", default=os.getenv("HOTSPOT_PLANES_DIR", "artifacts/heat_planes"))
+    parser.add_argument("--out", default=None, help="JSON report path")
+    args = parser.parse_args()
+
+    store = PlaneStore(args.root)
+    entries = store.entries()
+    weight_sets = [[float(w) for w in ws.split(",")] for ws in args.weights]
+    gate = gate_from_env()["gate"]
+    pixels = sum(int(np.prod(e["shape"])) for e in entries)
+    print(f"Sweeping {len(weight_sets)} weight sets over {len(entries)} images ({pixels / 1e9:.2f} GB of planes)...")
+
+    t0 = time.perf_counter()
+    results = sweep(store, weight_sets, lambda heat, entry: prescreen(heat, gate)["needs_llm"], entries)
+    elapsed = time.perf_counter() - t0
+    for r in results:
+        rate = pixels / r["fuse_s"] / 1e9 if r["fuse_s"] else float("inf")
+        needs = sum(r["values"])
+        print(f"  weights {r['weights']}: {needs}/{len(r['values'])} images need the LLM; fused at {rate:.1f} GB/s")
+    print(f"Done in {elapsed:.1f} s (including the pre-screening of every heat).")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"images": [e["image_path"] for e in entries], "results": results}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Pooled HTTP clients for the remote services, shared across images and threads:
+#   - one requests.Session (keep-alive connection pool) per Vision endpoint
+#   - one AzureOpenAI client per (endpoint, key, api_version)
+# plus retry with exponential backoff and jitter that honors Retry-After, and a
+# client-side rate limiter per service/endpoint so sustained throughput stays just
+# under quota instead of crashing on 429.
+#
+# Environment:
+#   VISION_RATE_PER_MIN / OPENAI_RATE_PER_MIN : client-side request rate (unset = unlimited)
+#   HTTP_MAX_RETRIES                          : retries on 429 / 5xx / connection errors (default 5)
+
+# Imports
+import os, time, random, hashlib, threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from . import telemetry
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# Connection failures, timeouts (ReadTimeout, ConnectTimeout, ...) and bodies cut mid-stream
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+
+_lock = threading.Lock()
+_sessions = {}
+_openai_clients = {}
+_rate_limiters = {}
+_throttled = 0 # 429 responses seen by this process (see throttle_events)
+
+
+def transient_errors() -> tuple:
+    """TRANSIENT_ERRORS plus openai.APIConnectionError (and its APITimeoutError) when openai is installed."""
+    try:
+        from openai import APIConnectionError
+    except ImportError:
+        return TRANSIENT_ERRORS
+    return TRANSIENT_ERRORS + (APIConnectionError,)
+
+
+# region Pooled clients
+def get_vision_session(endpoint: str, pool_size: int = 32) -> requests.Session:
+    """Keep-alive session for a Vision endpoint, created once per process."""
+    with _lock:
+        session = _sessions.get(endpoint)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[endpoint] = session
+        return session
+
+def get_openai_client(azure_endpoint: str, api_key: str, api_version: str):
+    """AzureOpenAI client, created once per (endpoint, key, api_version). Retries are handled by call_with_retry."""
+    from openai import AzureOpenAI
+    key = (azure_endpoint, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest(), api_version)
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = AzureOpenAI(
+                azure_endpoint = azure_endpoint, # Azure OpenAI resource
+                api_key        = api_key,
+                api_version    = api_version,    # at least 2024-02-15-preview
+                max_retries    = 0,
+            )
+            _openai_clients[key] = client
+        return client
+#endregion
+
+
+# region Rate limiting
+class RateLimiter:
+    """
+    Token bucket shared by all threads calling one service endpoint.
+    pause(seconds) holds every caller back, e.g. after a 429 with Retry-After.
+    """
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+def get_rate_limiter(service: str, endpoint: str):
+    """Limiter for <service> ("vision" / "openai") at endpoint, from <SERVICE>_RATE_PER_MIN; None if unset."""
+    rate = os.getenv(f"{service.upper()}_RATE_PER_MIN")
+    if not rate:
+        return None
+    key = (service, endpoint)
+    with _lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = _rate_limiters[key] = RateLimiter(float(rate))
+        return limiter
+#endregion
+
+
+# region Retry
+def note_throttle() -> None:
+    global _throttled
+    with _lock:
+        _throttled += 1
+
+def throttle_events() -> int:
+    """Number of 429 responses so far in this process, for callers that adapt their admission rate."""
+    return _throttled
+
+def retry_after_seconds(headers) -> float:
+    """Delay requested by the server (retry-after-ms, x-ms-retry-after-ms or Retry-After), or None."""
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) / 1000.0
+            except ValueError:
+                pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def call_with_retry(send, limiter: RateLimiter = None, max_retries: int = None, base_delay: float = 1.0, max_delay: float = 60.0, on_retry=None):
+    """
+    Call send() until it succeeds or max_retries retries are spent.
+    send() either returns a response with .status_code (requests) or raises an
+    exception carrying .status_code / .response (openai). 429, 5xx and connection
+    errors are retried after the server's Retry-After, else after a jittered
+    exponential backoff; a 429 also pauses the shared rate limiter.
+    The last retryable response is returned (or its exception re-raised).
+    on_retry(attempt, status, delay) is called before each wait.
+    """
+    if max_retries is None:
+        max_retries = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        error = None
+        try:
+            result = send()
+            status = getattr(result, "status_code", None)
+            if status not in RETRY_STATUSES:
+                telemetry.annotate(http_status=status if status is not None else 200) # openai results carry no status
+                return result
+            headers = result.headers
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            if status not in RETRY_STATUSES and not isinstance(e, transient_errors()):
+                raise
+            error = e
+            headers = getattr(getattr(e, "response", None), "headers", None)
+
+        telemetry.annotate(http_status=status)
+        if attempt >= max_retries:
+            if error is not None:
+                raise error
+            return result
+        delay = retry_after_seconds(headers)
+        delay = backoff_delay(attempt, base_delay, max_delay) if delay is None else delay + random.uniform(0, base_delay)
+        if status == 429:
+            note_throttle()
+            if limiter is not None:
+                limiter.pause(delay)
+        telemetry.count("retries")
+        if on_retry is not None:
+            on_retry(attempt + 1, status, delay)
+        print(f"Retrying after {delay:.1f}s (status {status}, attempt {attempt + 1}/{max_retries})...")
+        time.sleep(delay)
+        attempt += 1
+#endregion
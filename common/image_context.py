@@ -0,0 +1,88 @@
+# Decode-once image context shared by all pipeline stages.
+# Holds, for one image:
+#   - the raw file bytes (uploaded as-is to Vision / Azure OpenAI)
+#   - one decoded RGBA pixel buffer, exposed without copying both as a numpy
+#     array (OpenCV) and as a read-only PIL image
+#   - in-memory artifacts produced by the stages (e.g. the hotspots heatmap)
+# Every stage accepts either an image path or an ImageContext.
+
+# Imports
+import io, threading
+import cv2 # requires opencv-python
+import numpy as np
+from PIL import Image as PILImage
+
+
+class ImageContext:
+    def __init__(self, path: str, raw: bytes = None):
+        self.path = path
+        self._raw = raw
+        self._pixels = None
+        self._gray = None
+        self._lock = threading.Lock()  # overlay and hotspots may decode concurrently
+        # in-memory artifacts, filled by roi_hotspots
+        self.heat = None        # (H, W) uint8 heat
+        self.heat_color = None  # (H, W, 3) BGR turbo colormap of the heat
+        self.heat_png = None    # PNG encoding of heat_color
+        self.uploads = []       # upload preparation stats, one dict per remote request
+        self.prepared = {}      # prepared uploads keyed by options, shared by Vision and Azure OpenAI
+        self.shared = None      # shared-memory copy of the pixels for worker processes (see common/process_pool.py)
+
+    @classmethod
+    def from_pixels(cls, path: str, pixels: np.ndarray) -> "ImageContext":
+        """Context over already decoded (H, W, 4) RGBA pixels, e.g. a shared-memory frame in a worker process."""
+        ctx = cls(path)
+        ctx._pixels = pixels
+        return ctx
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            with open(self.path, "rb") as f:
+                self._raw = f.read()
+        return self._raw
+
+    @property
+    def pixels(self) -> np.ndarray:
+        """(H, W, 4) RGBA uint8, decoded once. Alpha is dropped (set to 255) like PIL convert("RGB") / cv2.imread do."""
+        if self._pixels is None:
+            with self._lock:
+                if self._pixels is None:
+                    # EXIF orientation ignored: pixels keep the stored layout, like the PIL header size and the box coordinates
+                    bgr = cv2.imdecode(np.frombuffer(self.raw, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+                    if bgr is None:
+                        raise ValueError(f"Not readable image: {self.path}")
+                    self._pixels = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGBA)
+        return self._pixels
+
+    @property
+    def size(self) -> tuple:
+        """(W, H), like PIL. Read from the file header when the pixels are not decoded yet."""
+        if self._pixels is None:
+            with PILImage.open(io.BytesIO(self.raw)) as im:
+                return im.size
+        H, W = self._pixels.shape[:2]
+        return W, H
+
+    def pil(self) -> PILImage.Image:
+        """Read-only RGBA PIL view sharing the decoded buffer (drawing on it triggers a private copy)."""
+        H, W = self.pixels.shape[:2]
+        return PILImage.frombuffer("RGBA", (W, H), self.pixels, "raw", "RGBA", 0, 1)
+
+    def pil_rgb(self) -> PILImage.Image:
+        """RGB PIL copy, to draw on."""
+        return self.pil().convert("RGB")
+
+    def bgr(self) -> np.ndarray:
+        """(H, W, 3) BGR copy for OpenCV color operations."""
+        return cv2.cvtColor(self.pixels, cv2.COLOR_RGBA2BGR)
+
+    def gray(self) -> np.ndarray:
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.pixels, cv2.COLOR_RGBA2GRAY)
+        return self._gray
+
+
+def as_image_context(image) -> ImageContext:
+    """Accept an ImageContext or an image path."""
+    return image if isinstance(image, ImageContext) else ImageContext(image)
@@ -1,16 +1,50 @@
-import os, json, base64
+import os, json, base64, cv2
+import numpy as np
+from functools import lru_cache
 from dotenv import load_dotenv  # requires python-dotenv
-from openai import AzureOpenAI        
 from .overlay_bboxes import draw_bboxes
 from pathlib import Path
 from .utils import compose_filename
+from .response_cache import hash_inputs
+from .image_context import as_image_context
+from .upload import prepare_upload, report_upload
+from .crops import select_regions, encode_crops, map_to_full
+from .roi_prompt import estimate_tokens
+from .http_clients import get_openai_client, get_rate_limiter, call_with_retry
+from . import telemetry
 
 CURRENT_DIR = Path(__file__).parent
+SYSTEM_MESSAGE_PATH = CURRENT_DIR / "llm_data/system_message_multimodal.txt"
+OUTPUT_SCHEMA_PATH = CURRENT_DIR / "llm_data/multimodal_output_schema.json"
+CROPS_SYSTEM_MESSAGE_PATH = CURRENT_DIR / "llm_data/system_message_crops.txt"
+CROPS_OUTPUT_SCHEMA_PATH = CURRENT_DIR / "llm_data/multimodal_output_schema_crops.json"
+
+
+@lru_cache(maxsize=8)
+def _read_prompts(system_path, schema_path, system_mtime_ns: int, schema_mtime_ns: int) -> tuple:
+    with open(system_path, "r", encoding="utf-8") as f:
+        system_text = f.read()
+
+    with open(schema_path, "r", encoding="utf-8") as f:
+        schema  = json.loads(f.read())
+
+    return system_text, schema, hash_inputs(system_text, schema)
+
+def load_prompts(crops: bool = False) -> tuple:
+    """
+    (system message, output schema, digest of both) of the full-frame or the crop mode;
+    the files are re-read only when they change.
+    """
+    system_path, schema_path = (CROPS_SYSTEM_MESSAGE_PATH, CROPS_OUTPUT_SCHEMA_PATH) if crops else (SYSTEM_MESSAGE_PATH, OUTPUT_SCHEMA_PATH)
+    return _read_prompts(system_path, schema_path, os.stat(system_path).st_mtime_ns, os.stat(schema_path).st_mtime_ns)
 
 def to_data_uri(path):
     with open(path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
-    return f"data:image/png;base64,{b64}"
+        return bytes_to_data_uri(f.read())
+
+def bytes_to_data_uri(data: bytes, mime: str = "image/png"):
+    b64 = base64.b64encode(data).decode("utf-8")
+    return f"data:{mime};base64,{b64}"
 
 
 def genai_analysis(
@@ -18,65 +52,147 @@ def genai_analysis(
         api_key: str,
         api_version: str,
         deployment_name: str,
-        original_image_path: str, 
-        hotspots_image_path: str,
+        original_image_path, 
+        hotspots_image_path,
         roi_json_str: str,
         save_payload: bool = True,
+        cache=None,
+        upload: dict = None,
+        heat_upload: dict = None,
+        writer=None,
+        roi_payload: dict = None,
+        crops: dict = None,
         ):
     """
     Analyze art collision in an image using Azure OpenAI multimodal capabilities
     comparing the original image to the hotspots heatmap image.
+    If a ResponseCache is given, the model answer is reused when images, ROI JSON,
+    prompts, schema and model parameters are all unchanged.
+    original_image_path is a path or an ImageContext; hotspots_image_path is a path,
+    the already encoded heatmap PNG bytes or the BGR heatmap array.
+    upload / heat_upload = {"max_side", "format", "quality"} downscale and re-encode
+    the two images before they are embedded (see common/upload.py); the heatmap
+    usually tolerates a much lower fidelity than the original.
+    roi_json_str is the ROI_JSON text of the prompt (see common/roi_prompt.py).
+    crops (see common/crops.py) switches to the crop mode: the top-K regions from
+    roi_payload proposals and hotspot components are sent as padded side-by-side
+    crops (original | heatmap) in one request, and the returned boxes are mapped
+    back to full-image coordinates before draw_bboxes.
     """
 
     message_text = "Analyze the art collision in the image. Identify the areas with the most color distortion due to overlapping paint layers."
     
-    original_uri = to_data_uri(original_image_path)
-    hotspots_uri = to_data_uri(hotspots_image_path)
-
-    with open(CURRENT_DIR / "llm_data/system_message_multimodal.txt", "r", encoding="utf-8") as f:
-        system_text = f.read()
-
-    with open(CURRENT_DIR / "llm_data/multimodal_output_schema.json", "r", encoding="utf-8") as f:
-        schema  = json.loads(f.read())
-
-    messages = [
-        {"role":"system","content": system_text},
-        {"role":"user","content": [
-            {"type":"text","text":message_text},
-            {"type":"image_url","image_url":{"url": original_uri}},
-            {"type":"image_url","image_url":{"url": hotspots_uri}},
-            {
-                "type": "text",
-                "text": f"ROI_JSON:\n{roi_json_str}"
-            }
-
-        ]}
-    ]
-
-    client = AzureOpenAI(
-        azure_endpoint = azure_endpoint, # Azure OpenAI resource
-        api_key        = api_key,  
-        api_version    = api_version ,# at least 2024-02-15-preview,
-    )
-
-    response = client.chat.completions.create(
-        model=deployment_name,
-        temperature=0.2,
-        top_p=0.9,
-        seed=7,  # balance results
-        response_format={ "type": "json_schema", "json_schema": { "name": "art_collision_schema", "schema": schema } },
-        messages=messages
-    )
-
-    payload = json.loads(response.choices[0].message.content)
+    ctx = as_image_context(original_image_path)
+    original_bytes = ctx.raw
+    heat_array = None
+    if isinstance(hotspots_image_path, np.ndarray):
+        heat_array = hotspots_image_path
+        hotspots_bytes = ctx.heat_png if ctx.heat_color is heat_array else cv2.imencode(".png", heat_array)[1].tobytes()
+    elif isinstance(hotspots_image_path, (bytes, bytearray)):
+        hotspots_bytes = bytes(hotspots_image_path)
+    else:
+        with open(hotspots_image_path, "rb") as f:
+            hotspots_bytes = f.read()
+
+    system_text, schema, _ = load_prompts(crops=bool(crops)) # read from disk once, until the files change
+    regions = None
+    if crops:
+        message_text = "Analyze the art collision in the crops. Identify the areas with the most color distortion due to overlapping paint layers."
+        W, H = ctx.size
+        regions = select_regions(W, H, heat=ctx.heat, roi_payload=roi_payload, options=crops)
+
+    model_params = {
+        "model": deployment_name,
+        "temperature": 0.2,
+        "top_p": 0.9,
+        "seed": 7,  # balance results
+        "response_format": { "type": "json_schema", "json_schema": { "name": "art_collision_schema", "schema": schema } },
+    }
+
+    if crops: # what the crop request sends: crops of both images, no ROI_JSON, no full-frame uploads
+        cache_key = hash_inputs(
+            azure_endpoint, api_version, model_params,
+            original_bytes, hotspots_bytes, message_text, system_text,
+            {"crops": crops, "regions": regions},
+        )
+    else:
+        cache_key = hash_inputs(
+            azure_endpoint, api_version, model_params,
+            original_bytes, hotspots_bytes, roi_json_str, message_text, system_text,
+            *([{"upload": upload, "heat_upload": heat_upload}] if upload or heat_upload else []),
+        )
+    payload = cache.get("openai", cache_key) if cache is not None else None
+    telemetry.annotate(cache_hit=payload is not None)
+
+    if payload is None and crops:
+        if heat_array is None:
+            heat_array = cv2.imdecode(np.frombuffer(hotspots_bytes, np.uint8), cv2.IMREAD_COLOR)
+        content = [{"type":"text","text":message_text}]
+        for i, (region, data) in enumerate(zip(regions, encode_crops(ctx.bgr(), heat_array, regions, crops))):
+            x1, y1, x2, y2 = region
+            content += [
+                {"type":"text","text": f"CROP {i}: x [{x1 / W:.3f}..{x2 / W:.3f}], y [{y1 / H:.3f}..{y2 / H:.3f}] of the full image"},
+                {"type":"image_url","image_url":{"url": bytes_to_data_uri(data, "image/jpeg")}},
+            ]
+        messages = [
+            {"role":"system","content": system_text},
+            {"role":"user","content": content},
+        ]
+        telemetry.annotate(crops=len(regions))
+    elif payload is None:
+        telemetry.annotate(roi_tokens=estimate_tokens(roi_json_str))
+        original_up = prepare_upload(ctx, upload)
+        report_upload(ctx, "openai/original", original_up)
+        if heat_upload and heat_array is None:
+            heat_array = cv2.imdecode(np.frombuffer(hotspots_bytes, np.uint8), cv2.IMREAD_COLOR)
+        hotspots_up = prepare_upload(heat_array, heat_upload, original_bytes=hotspots_bytes)
+        report_upload(ctx, "openai/hotspots", hotspots_up)
+
+        messages = [
+            {"role":"system","content": system_text},
+            {"role":"user","content": [
+                {"type":"text","text":message_text},
+                {"type":"image_url","image_url":{"url": bytes_to_data_uri(original_up["data"], original_up["mime"])}},
+                {"type":"image_url","image_url":{"url": bytes_to_data_uri(hotspots_up["data"], hotspots_up["mime"])}},
+                {
+                    "type": "text",
+                    "text": f"ROI_JSON:\n{roi_json_str}"
+                }
+
+            ]}
+        ]
+
+    if payload is None:
+        client = get_openai_client(azure_endpoint, api_key, api_version) # pooled, reused across images
+
+        response = call_with_retry(
+            lambda: client.chat.completions.create(messages=messages, **model_params),
+            limiter=get_rate_limiter("openai", azure_endpoint),
+        )
+
+        content = response.choices[0].message.content
+        usage = getattr(response, "usage", None)
+        telemetry.annotate(
+            request_bytes=sum(len(json.dumps(m)) for m in messages),
+            response_bytes=len(content.encode("utf-8")),
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+        payload = json.loads(content)
+        if cache is not None:
+            cache.put("openai", cache_key, payload)
     
+    if crops:
+        payload = map_to_full(payload, regions, W, H) # crop-normalized -> full-image-normalized boxes
     print(json.dumps(payload, indent=2))
     
     if save_payload:        
-        with open(compose_filename(original_image_path, "04_genai_bboxes", "json"), "w", encoding="utf-8") as f:
+        with open(compose_filename(ctx.path, "04_genai_bboxes", "json"), "w", encoding="utf-8") as f:
             json.dump(payload, f, indent=4)
 
-    out = draw_bboxes(original_image_path, payload, compose_filename(original_image_path, "04_genai_bboxes"))
+    telemetry.annotate(bboxes=len(payload.get("bboxes", [])))
+    with telemetry.substage("draw_bboxes"):
+        out = draw_bboxes(ctx, payload, compose_filename(ctx.path, "04_genai_bboxes"), writer=writer)
     return out
 
 
@@ -0,0 +1,88 @@
+# Per-image manifest for incremental, resumable runs.
+# The per-image pipeline is a small dependency graph:
+#   original ──> roi ──> overlay
+#      │          └──────────┐
+#      └──> hotspots ──> genai (+ bbox overlay)
+# For every stage the manifest records:
+#   key     : hash of the stage inputs (source image digest, digests of the upstream
+#             results, parameters such as features, keep_confidence, hotspot weights)
+#   params  : the parameters themselves, for inspection
+#   outputs : the artifacts the stage produced, by name
+#   digest  : hash of the stage result, used in the keys of the downstream stages
+#   result  : small JSON result reused when the stage is skipped (e.g. the pre-screening decision)
+# A stage re-executes only when its key changed or one of its artifacts is missing.
+# The manifest is saved after every stage, so an interrupted batch resumes where it stopped.
+#
+# Layout:
+#   artifacts/manifests/<image base name>.json
+
+# Imports
+import os, json, time, threading
+from .response_cache import hash_inputs
+
+MANIFEST_VERSION = 1
+
+
+class Manifest:
+    def __init__(self, image_path: str, manifest_dir: str = "artifacts/manifests", enabled: bool = True):
+        self.image_path = image_path
+        self.enabled = enabled
+        self.path = os.path.join(manifest_dir, os.path.splitext(os.path.basename(image_path))[0] + ".json")
+        self._lock = threading.Lock()  # overlay and hotspots record concurrently
+        self.data = {"version": MANIFEST_VERSION, "image_path": image_path, "source": {}, "stages": {}}
+        if enabled and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    self.data = data
+            except (OSError, ValueError):
+                pass  # unreadable manifest: every stage runs again
+
+    def source_digest(self, ctx) -> str:
+        """SHA-256 of the source image bytes; reused from the manifest while size and mtime are unchanged."""
+        st = os.stat(ctx.path)
+        source = self.data["source"]
+        if source.get("size") == st.st_size and source.get("mtime_ns") == st.st_mtime_ns and source.get("digest"):
+            return source["digest"]
+        digest = hash_inputs(ctx.raw)
+        self.data["source"] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest}
+        return digest
+
+    def key(self, stage: str, *inputs) -> str:
+        return hash_inputs(stage, *inputs)
+
+    def is_fresh(self, stage: str, key: str) -> bool:
+        """True when the stage already ran with this key and all its artifacts still exist."""
+        if not self.enabled:
+            return False
+        entry = self.data["stages"].get(stage)
+        return (
+            entry is not None
+            and entry["key"] == key
+            and all(os.path.exists(p) for p in entry["outputs"].values())
+        )
+
+    def entry(self, stage: str) -> dict:
+        return self.data["stages"].get(stage, {})
+
+    def record(self, stage: str, key: str, params: dict = None, outputs: dict = None, digest: str = None, result=None) -> None:
+        """Store the stage entry and save the manifest (atomically)."""
+        with self._lock:
+            self.data["stages"][stage] = {
+                "key": key,
+                "params": params or {},
+                "outputs": {name: p for name, p in (outputs or {}).items() if p}, # None = not saved
+                "digest": digest,
+                "result": result,
+                "ts": time.time(),
+            }
+            if self.enabled:
+                self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, default=str)
+        os.replace(tmp, self.path)
@@ -1,32 +1,36 @@
 from PIL import Image, ImageDraw, ImageFont
 import json
+from .image_context import ImageContext
+from .text_render import get_font, text_bbox
+from .artifact_writer import save_image
 
 
-def draw_bboxes(original_path:str, result_json:str, out_path:str) -> str:
+def draw_bboxes(original_path, result_json:str, out_path:str, writer=None) -> str:
     data = result_json if isinstance(result_json, dict) else json.loads(result_json)
-    im = Image.open(original_path).convert("RGB")
+    # original_path is a path or an ImageContext (already decoded pixels)
+    im = original_path.pil_rgb() if isinstance(original_path, ImageContext) else Image.open(original_path).convert("RGB")
+    render_bboxes(im, data)
+    return save_image(im, out_path, writer)
+
+
+def render_bboxes(im, data: dict):
+    """Draw the normalized genai_analysis bboxes (x_min..y_max in 0..1) on a PIL RGB image, in place."""
     w, h = im.size
     dr = ImageDraw.Draw(im)
     color = (255, 0, 0)
+    font = get_font("DejaVuSans.ttf", max(12, int(0.025*h))) # cached across boxes and images
 
     for b in data.get("bboxes", []):
         x0 = int(b["x_min"] * w)
         y0 = int(b["y_min"] * h)
         x1 = int(b["x_max"] * w)
         y1 = int(b["y_max"] * h)
-        for t in range(4):  # thickness
-            dr.rectangle([x0-t,y0-t,x1+t,y1+t], outline=color)
+        dr.rectangle([x0-3,y0-3,x1+3,y1+3], outline=color, width=4)  # 4 px thick, growing outwards
         label = f'{b["label"]} {b["confidence"]:.2f}'
         # label bg
-        try:
-            font = ImageFont.truetype("DejaVuSans.ttf", max(12, int(0.025*h)))
-        except:
-            font = ImageFont.load_default()
-        tw, th = dr.textbbox((0,0), label, font=font)[2:]
+        tw, th = text_bbox(font, label)[2:]
         pad = 4
         lx, ly = x0, max(0, y0 - th - 2*pad)
         dr.rectangle([lx-pad, ly-pad, lx+tw+pad, ly+th+pad], fill=color)
         dr.text((lx, ly), label, fill=(255,255,255), font=font)
-
-    im.save(out_path)
-    return out_path
\ No newline at end of file
+    return im
\ No newline at end of file
@@ -0,0 +1,235 @@
+# Perceptual-hash index of processed images, to reuse the results of near-duplicates.
+# Folders often hold several shots of the same article (e.g. BUTTON-DOUBLE-1 / -2);
+# an image whose hashes are within max_distance of an indexed one can take the
+# ROI payload (NEAR_DUP=seed, the LLM still runs) or the ROI and GenAI payloads
+# (NEAR_DUP=reuse) of that image, with the pixel boxes rescaled to its size.
+#   - phash : 64-bit DCT hash (8x8 low frequencies of a 32x32 reduction), used for the lookup
+#   - dhash : 64-bit gradient hash (9x8 reduction), a second check on the candidates
+#   - a 128x128 color thumbnail comparison against the indexed image file: a global
+#     hash does not see a small local difference (e.g. an art collision patch present
+#     in one shot only), so a match is accepted only if no 8x8 block of the thumbnails
+#     differs by more than max_block_diff levels (after removing the global color shift)
+# Lookup is multi-index hashing: the pHash is split into CHUNKS 16-bit chunks, each
+# with its own table. Two hashes within distance d agree within d // CHUNKS bits on
+# at least one chunk, so probing each table with those few variants finds every
+# candidate; only the candidates are compared bit by bit. Lookups stay around a
+# millisecond with hundreds of thousands of entries.
+# Only images analyzed for real are indexed (never one that reused results), and
+# an image whose near-duplicate is still being analyzed waits for it.
+#
+# Layout:
+#   artifacts/phash_index.jsonl : one entry per line, a later line for the same image replaces the earlier one
+#
+# Environment (see near_dup_from_env):
+#   NEAR_DUP                    : off (default) | seed | reuse
+#   NEAR_DUP_MAX_DISTANCE       : max pHash Hamming distance (default 6 of 64 bits)
+#   NEAR_DUP_MAX_DHASH_DISTANCE : max dHash Hamming distance (default 12)
+#   NEAR_DUP_MAX_ASPECT_DELTA   : max relative aspect ratio difference (default 0.02)
+#   NEAR_DUP_MAX_BLOCK_DIFF     : max thumbnail block difference, 0..255 (default 16)
+#   NEAR_DUP_INDEX              : index file (default artifacts/phash_index.jsonl)
+
+# Imports
+import os, json, time, threading
+from itertools import combinations
+import cv2 # requires opencv-python
+import numpy as np
+from .utils import options_from_env
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+NEAR_DUP_MODES = ("off", "seed", "reuse")
+DEFAULT_NEAR_DUP = {
+    "max_distance": 6,
+    "max_dhash_distance": 12,
+    "max_aspect_delta": 0.02,
+    "max_block_diff": 16.0,
+}
+
+
+# region Hashes
+def bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(bool)).tobytes(), "big")
+
+def phash(gray: np.ndarray) -> int:
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    bits[0] = False # the DC term is the mean brightness
+    return bits_to_int(bits)
+
+def dhash(gray: np.ndarray) -> int:
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return bits_to_int(small[:, 1:] > small[:, :-1])
+
+def image_hashes(gray: np.ndarray) -> dict:
+    return {"phash": phash(gray), "dhash": dhash(gray)}
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def thumbnail(image: np.ndarray, side: int = 128) -> np.ndarray:
+    """side x side float32 BGR thumbnail of a BGR or RGBA image."""
+    small = cv2.resize(image, (side, side), interpolation=cv2.INTER_AREA)
+    if small.shape[2] == 4:
+        small = cv2.cvtColor(small, cv2.COLOR_RGBA2BGR)
+    return small.astype(np.float32)
+
+def block_diff(a: np.ndarray, b: np.ndarray, block: int = 8) -> float:
+    """Largest mean absolute difference of the block x block cells of two thumbnails, global color shift removed."""
+    d = a - b
+    d -= d.reshape(-1, 3).mean(axis=0)
+    d = np.abs(d).mean(axis=2)
+    side = d.shape[0] // block
+    return float(cv2.resize(d, (side, side), interpolation=cv2.INTER_AREA).max())
+#endregion
+
+
+class PHashIndex:
+    """Persistent multi-index Hamming lookup over the pHash of processed images. Thread-safe."""
+    def __init__(self, path: str = "artifacts/phash_index.jsonl", options: dict = None):
+        self.path = path
+        self.options = {**DEFAULT_NEAR_DUP, **(options or {})}
+        self.entries = []                                # entry id -> entry (None = replaced)
+        self.by_path = {}                                # image_path -> entry id
+        self.tables = [{} for _ in range(CHUNKS)]        # chunk value -> entry ids
+        self.pending = {}                                # token -> in-flight image being analyzed
+        self._masks = {}
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._insert(json.loads(line))
+                    except (ValueError, KeyError):
+                        pass # truncated last line of an interrupted run
+
+    def __len__(self):
+        return len(self.by_path)
+
+    def _insert(self, entry: dict):
+        entry["phash"], entry["dhash"] = int(entry["phash"], 16), int(entry["dhash"], 16)
+        if entry["image_path"] in self.by_path:
+            self.entries[self.by_path[entry["image_path"]]] = None
+        i = len(self.entries)
+        self.entries.append(entry)
+        self.by_path[entry["image_path"]] = i
+        for c, table in enumerate(self.tables):
+            table.setdefault((entry["phash"] >> (c * CHUNK_BITS)) & 0xFFFF, []).append(i)
+
+    def _chunk_masks(self, radius: int) -> list:
+        """All CHUNK_BITS-bit masks with at most radius bits set."""
+        if radius not in self._masks:
+            self._masks[radius] = [sum(1 << b for b in bits) for r in range(radius + 1) for bits in combinations(range(CHUNK_BITS), r)]
+        return self._masks[radius]
+
+    def candidates(self, h: int, max_distance: int) -> set:
+        masks = self._chunk_masks(max_distance // CHUNKS)
+        found = set()
+        for c, table in enumerate(self.tables):
+            chunk = (h >> (c * CHUNK_BITS)) & 0xFFFF
+            for m in masks:
+                found.update(table.get(chunk ^ m, ()))
+        return found
+
+    def _acceptable(self, entry: dict, hashes: dict, size: tuple) -> tuple:
+        """(pHash distance, dHash distance) when entry is a near-duplicate, None otherwise."""
+        o = self.options
+        d = hamming(entry["phash"], hashes["phash"])
+        dd = hamming(entry["dhash"], hashes["dhash"])
+        aspect, other = size[0] / size[1], entry["width"] / entry["height"]
+        if d <= o["max_distance"] and dd <= o["max_dhash_distance"] and abs(aspect - other) <= o["max_aspect_delta"] * other:
+            return d, dd
+        return None
+
+    def nearest(self, hashes: dict, size: tuple, exclude=()) -> dict:
+        """Closest indexed or in-flight near-duplicate, with "distance" (and "waiter" when in flight), or None.
+        exclude: image paths to ignore."""
+        best = None
+        with self._lock:
+            in_flight = list(self.pending.values())
+            for i in self.candidates(hashes["phash"], self.options["max_distance"]):
+                entry = self.entries[i]
+                if entry is None or entry["image_path"] in exclude:
+                    continue
+                d = self._acceptable(entry, hashes, size)
+                if d is not None and (best is None or d < best[0]):
+                    best = (d, entry)
+            for entry in in_flight:
+                d = self._acceptable(entry, hashes, size)
+                if entry["image_path"] not in exclude and d is not None and (best is None or d < best[0]):
+                    best = (d, entry)
+        if best is None:
+            return None
+        return {**best[1], "distance": best[0][0], "dhash_distance": best[0][1]}
+
+    def claim(self, image_path: str, hashes: dict, size: tuple, waiter=None, exclude=()) -> tuple:
+        """
+        (match, None) when a near-duplicate exists (match["waiter"] set while it is still
+        being analyzed), else (None, token): the image is registered as in flight, with
+        waiter (e.g. an asyncio.Event) for the near-duplicates that arrive meanwhile.
+        Call add() or release() with the token when the image is done.
+        """
+        with self._lock: # lookup and registration are atomic
+            match = self.nearest(hashes, size, exclude={image_path, *exclude})
+            if match is not None:
+                return match, None
+            token = object()
+            self.pending[token] = {"image_path": image_path, **hashes, "width": size[0], "height": size[1], "waiter": waiter}
+        return None, token
+
+    def verify(self, match: dict, image: np.ndarray) -> bool:
+        """Thumbnail check of a hash match against its image file (image: BGR or RGBA pixels of the new image)."""
+        other = cv2.imread(match["image_path"], cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION)
+        if other is None:
+            return False # the indexed image is gone: the match cannot be checked
+        return block_diff(thumbnail(image), thumbnail(other)) <= self.options["max_block_diff"]
+
+    def release(self, token) -> None:
+        with self._lock:
+            self.pending.pop(token, None)
+
+    def add(self, entry: dict, token=None) -> None:
+        """Index an analyzed image (image_path, phash, dhash, width, height, roi/genai json paths and digests)."""
+        record = {**entry, "phash": f"{entry['phash']:016x}", "dhash": f"{entry['dhash']:016x}", "ts": time.time()}
+        with self._lock:
+            self.pending.pop(token, None)
+            i = self.by_path.get(entry["image_path"])
+            old = self.entries[i] if i is not None else None
+            if old is not None and all(old.get(k) == v for k, v in entry.items()):
+                return # already indexed as is
+            self._insert(dict(record))
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+
+# region Reuse
+def rescale_roi_payload(payload: dict, sx: float, sy: float, image_path: str) -> dict:
+    """ROI payload of a near-duplicate with its pixel boxes scaled by (sx, sy)."""
+    proposals = [
+        {**p, "bbox": {"x": round(p["bbox"]["x"] * sx), "y": round(p["bbox"]["y"] * sy),
+                       "w": round(p["bbox"]["w"] * sx), "h": round(p["bbox"]["h"] * sy)}}
+        for p in payload.get("proposals", [])
+    ]
+    context = {**payload["context"], "image_path": image_path} if payload.get("context") else payload.get("context", {})
+    return {**payload, "context": context, "proposals": proposals}
+
+def rescale_genai_payload(payload: dict, sx: float, sy: float) -> dict:
+    """GenAI payload of a near-duplicate: bboxes are normalized and kept, crop regions (pixels) are scaled."""
+    if "crop_regions" not in payload:
+        return dict(payload)
+    regions = [[round(x1 * sx), round(y1 * sy), round(x2 * sx), round(y2 * sy)] for x1, y1, x2, y2 in payload["crop_regions"]]
+    return {**payload, "crop_regions": regions}
+#endregion
+
+
+def near_dup_from_env() -> dict:
+    """{"mode", "index"} from NEAR_DUP, NEAR_DUP_<OPTION>, NEAR_DUP_INDEX; None when off."""
+    mode = os.getenv("NEAR_DUP", "off").lower()
+    if mode not in NEAR_DUP_MODES:
+        raise ValueError(f"Unknown NEAR_DUP mode <{mode}>, expected one of {NEAR_DUP_MODES}")
+    if mode == "off":
+        return None
+    options = options_from_env(DEFAULT_NEAR_DUP, "NEAR_DUP_")
+    return {"mode": mode, "index": PHashIndex(os.getenv("NEAR_DUP_INDEX", "artifacts/phash_index.jsonl"), options)}
@@ -0,0 +1,452 @@
+# Concurrent batch pipeline.
+# Runs the per-image stages of main.main (copy -> ROI -> overlay/hotspots -> GenAI)
+# for many images at once, with a separate in-flight limit for each kind of work:
+#   - "vision" : Azure Computer Vision REST call (roi_identification)
+#   - "openai" : Azure OpenAI multimodal call (genai_analysis)
+#   - "cpu"    : local work (file copy, overlays, hotspots); overlays and hotspots
+#                run in worker processes when settings carries a "process_pool"
+# Network waits for one image overlap with hotspot computation for another.
+# Each image keeps a manifest (common/manifest.py): stages whose inputs and
+# parameters are unchanged are skipped, so an interrupted batch resumes.
+
+# Imports
+import os, json, asyncio, traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from .utils import compose_filename, copy_file
+from .image_context import ImageContext
+from .telemetry import traced
+from .manifest import Manifest
+from .response_cache import hash_inputs
+
+
+STAGES = ("original", "roi", "overlay", "hotspots", "genai")
+DEPENDENCIES = {"overlay": ("roi",), "genai": ("roi", "hotspots")}
+
+DEFAULT_LIMITS = {
+    "vision": 4,
+    "openai": 2,
+    "cpu": os.cpu_count() or 1,
+}
+
+
+def limits_from_env(defaults: dict = None) -> dict:
+    """
+    Read the per-service in-flight limits from the environment
+    (VISION_MAX_IN_FLIGHT, OPENAI_MAX_IN_FLIGHT, CPU_MAX_IN_FLIGHT).
+    """
+    limits = dict(defaults or DEFAULT_LIMITS)
+    for kind in limits:
+        value = os.getenv(f"{kind.upper()}_MAX_IN_FLIGHT")
+        if value:
+            limits[kind] = max(1, int(value))
+    return limits
+
+
+class StageLimiter:
+    """
+    Runs blocking stage functions on a shared thread pool,
+    allowing at most limits[kind] calls of each kind in flight.
+    """
+    def __init__(self, limits: dict = None):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self._semaphores = {kind: asyncio.Semaphore(n) for kind, n in self.limits.items()}
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(self.limits.values()),
+            thread_name_prefix="stage",
+        )
+
+    async def run(self, kind: str, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        async with self._semaphores[kind]:
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# ---------- Per-image pipeline ----------
+def read_json(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def resolve_stages(stages=None) -> set:
+    """Requested stages plus the stages they depend on; None = all."""
+    run = set(STAGES if stages is None else stages)
+    unknown = run - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {STAGES}")
+    for stage in list(run):
+        run.update(DEPENDENCIES.get(stage, ()))
+    return run
+
+def artifact_params(writer, image_path: str, *postfixes) -> dict:
+    """Output format of the artifacts of one stage, part of its manifest key."""
+    if writer is None:
+        return {}
+    return {postfix: writer.spec_for(compose_filename(image_path, postfix)) for postfix in postfixes}
+
+
+async def process_image(image_source_path: str, settings: dict, limiter: StageLimiter, stages=None, wait_artifacts: bool = False) -> dict:
+    """
+    Run every stage for one image. Independent local stages (overlay and hotspots)
+    run concurrently; remote calls go through their own limiter slot.
+    The image is read and decoded once, in an ImageContext shared by all stages.
+    Stages whose inputs and parameters are unchanged since the last run (per the
+    image manifest, see common/manifest.py) are skipped.
+    stages restricts the run to some of STAGES (and what they depend on).
+    With settings["near_dup"] the results of an indexed near-duplicate are reused
+    (see common/phash_index.py); an image analyzed for real is added to the index.
+    With wait_artifacts the call returns once this image's artifacts are on disk
+    (not those that other images queued on the shared writer meanwhile).
+    """
+    writer = settings.get("writer")
+    if writer is None:
+        return await analyze_image(image_source_path, settings, limiter, stages)
+    writes = writer.scope() # the jobs of this image only
+    result = await analyze_image(image_source_path, {**settings, "writer": writes}, limiter, stages)
+    if wait_artifacts:
+        await asyncio.to_thread(writes.wait)
+    return result
+
+async def analyze_image(image_source_path: str, settings: dict, limiter: StageLimiter, stages=None) -> dict:
+    """process_image without waiting for the artifact writer."""
+    from .phash_index import image_hashes
+
+    ctx = ImageContext(image_source_path)
+    run = resolve_stages(stages)
+    near = settings.get("near_dup") # {"mode", "index"}, None = off
+    if near is None or not {"roi", "genai"} & run:
+        return await run_stages(ctx, settings, limiter, run)
+
+    index = near["index"]
+    hashes = await limiter.run("cpu", image_hashes, ctx.gray())
+    rejected = set() # hash matches that differ locally (thumbnail check)
+    while True:
+        waiter = asyncio.Event()
+        match, token = index.claim(image_source_path, hashes, ctx.size, waiter, exclude=rejected)
+        if match is None:
+            break
+        if not await limiter.run("cpu", index.verify, match, ctx.pixels):
+            rejected.add(match["image_path"])
+            continue
+        if match.get("waiter") is None:
+            break
+        print(f"Image {os.path.basename(image_source_path)} waits for its near-duplicate {os.path.basename(match['image_path'])}...")
+        await match["waiter"].wait() # then look again: indexed, or failed and gone
+    try:
+        result = await run_stages(ctx, settings, limiter, run, near_match=match, near_mode=near["mode"])
+        artifacts = result["artifacts"]
+        if token is not None and "roi_json_path" in artifacts:
+            genai_json_path = artifacts.get("genai_json_path")
+            index.add({
+                "image_path": image_source_path,
+                **hashes,
+                "width": ctx.size[0],
+                "height": ctx.size[1],
+                "roi_json_path": artifacts["roi_json_path"],
+                "roi_digest": hash_inputs(read_json(artifacts["roi_json_path"])),
+                "genai_json_path": genai_json_path,
+                "genai_digest": hash_inputs(read_json(genai_json_path)) if genai_json_path else None,
+            }, token)
+    finally:
+        if token is not None:
+            index.release(token)
+            waiter.set()
+    return result
+
+
+async def run_stages(ctx: ImageContext, settings: dict, limiter: StageLimiter, run: set, near_match: dict = None, near_mode: str = None) -> dict:
+    """The stages of process_image in run; near_match is the index entry of a near-duplicate whose results are reused."""
+    from .roi_identification import roi_identification
+    from .roi_highlighting import roi_overlay
+    from .roi_hotspots import roi_hotspots, default_engine
+    from .image_genai import genai_analysis, load_prompts
+    from .roi_prompt import encode_roi_prompt
+    from .prescreen import prescreen, log_decision
+    from .overlay_bboxes import draw_bboxes
+    from .phash_index import rescale_roi_payload, rescale_genai_payload
+
+    image_source_path = ctx.path
+    image_file_name = os.path.basename(image_source_path)
+    manifest = Manifest(image_source_path, enabled=settings.get("incremental", True))
+    skipped = []
+    reused = []
+    roi_payload = genai_bboxes_path = decision = None
+
+    def up_to_date(stage: str, key: str) -> bool:
+        if manifest.is_fresh(stage, key):
+            skipped.append(stage)
+            return True
+        return False
+
+    writer = settings.get("writer") # ArtifactWriter, None = synchronous writes
+    pool = settings.get("process_pool") # ProcessStagePool for overlay / hotspots, None = stage threads
+    os.makedirs(os.path.dirname(compose_filename(image_source_path, "00_original")), exist_ok=True)
+    source = manifest.source_digest(ctx)
+
+    # --- original ---
+    key = manifest.key("original", source, artifact_params(writer, image_source_path, "00_original"),
+                       writer.original_mode if writer is not None else "copy")
+    if "original" in run and not up_to_date("original", key):
+        print(f"Duplicating source image {image_file_name}...")
+        original_path = compose_filename(image_source_path, "00_original")
+        if writer is not None:
+            # off the event loop: the writer blocks while its queue is full
+            original_path = await limiter.run("cpu", writer.copy_original, image_source_path, original_path)
+        else:
+            await limiter.run("cpu", copy_file, source_file=image_source_path, target_file=original_path)
+        manifest.record("original", key, outputs={"original_path": original_path})
+
+    # --- original -> roi ---
+    roi_params = {
+        "endpoint": settings["VISION_ENDPOINT"],
+        "features": settings.get("features", "Caption,Objects,Tags,DenseCaptions"),
+        "limit_proposals": settings.get("limit_proposals", 0),
+        "keep_confidence": settings.get("keep_confidence", 0.6),
+        "upload": settings.get("upload"),
+    }
+    # near-duplicate results, boxes rescaled to this image
+    if near_match is not None:
+        scale = (ctx.size[0] / near_match["width"], ctx.size[1] / near_match["height"])
+        near_roi = near_match.get("roi_json_path") and os.path.exists(near_match["roi_json_path"])
+        near_genai = near_mode == "reuse" and near_match.get("genai_json_path") and os.path.exists(near_match["genai_json_path"])
+    else:
+        near_roi = near_genai = False
+    near_params = lambda stage: [{"near_dup": near_match["image_path"], "digest": near_match[f"{stage}_digest"]}]
+
+    key = manifest.key("roi", source, roi_params, *(near_params("roi") if near_roi else []))
+    roi_json_path = compose_filename(image_source_path, "01_ROI", "json")
+    if "roi" in run and up_to_date("roi", key):
+        roi_payload = read_json(roi_json_path)
+    elif "roi" in run and near_roi:
+        print(f"Reusing the ROI of near-duplicate {near_match['image_path']} (distance {near_match['distance']}) for image {image_file_name}...")
+        roi_payload = rescale_roi_payload(read_json(near_match["roi_json_path"]), *scale, image_source_path)
+        with open(roi_json_path, "w", encoding="utf-8") as f:
+            json.dump(roi_payload, f, indent=4)
+        reused.append("roi")
+        manifest.record("roi", key, {**roi_params, "near_dup": near_match["image_path"]},
+                        outputs={"roi_json_path": roi_json_path}, digest=hash_inputs(roi_payload))
+    elif "roi" in run:
+        print(f"Analyzing image {image_file_name}...")
+        roi_payload = await limiter.run(
+            "vision", traced(settings, "roi_identification", image_file_name, roi_identification),
+            image_path=ctx,
+            VISION_ENDPOINT=roi_params["endpoint"],
+            VISION_KEY=settings["VISION_KEY"],
+            features=roi_params["features"],
+            limit_proposals=roi_params["limit_proposals"],
+            keep_confidence=roi_params["keep_confidence"],
+            cache=settings.get("cache"),
+            upload=roi_params["upload"],
+        )
+        manifest.record("roi", key, roi_params, outputs={"roi_json_path": roi_json_path}, digest=hash_inputs(roi_payload))
+    roi_digest = manifest.entry("roi").get("digest")
+
+    # --- roi -> overlay, original -> hotspots ---
+    async def overlay_stage():
+        if "overlay" not in run:
+            return
+        key = manifest.key("overlay", source, roi_digest,
+                           artifact_params(writer, image_source_path, "02A_roi_overlay", "02B_roi_overlay_labels"))
+        if up_to_date("overlay", key):
+            return
+        if pool is not None:
+            paths = await limiter.run("cpu", traced(settings, "roi_overlay", image_file_name, pool.overlay), ctx, roi_payload)
+        else:
+            paths = await limiter.run(
+                "cpu", traced(settings, "roi_overlay", image_file_name, roi_overlay),
+                image_path=ctx,
+                payload=roi_payload,
+                writer=writer,
+            )
+        manifest.record("overlay", key, outputs=paths)
+
+    engine = default_engine()
+    planes = settings.get("heat_planes")
+    hotspot_params = {"maps": ["edge", "var", "hf"], **engine.params()}
+    if planes is not None and not engine.pyramid:
+        hotspot_params["planes"] = True # heat fused from 8-bit planes: within 1 level of the direct one
+    async def hotspots_stage():
+        if "hotspots" not in run:
+            return {}
+        key = manifest.key("hotspots", source, hotspot_params,
+                           artifact_params(writer, image_source_path, "03A_hotspots_heat", "03B_hotspots_overlay"))
+        if up_to_date("hotspots", key):
+            outputs = manifest.entry("hotspots")["outputs"]
+            return {k: outputs.get(k) for k in ("hotspots_heat_path", "hotspots_overlay_path")}
+        options = dict(
+            create_edge_map=True,
+            create_local_variance_map=True,
+            create_high_freq_map=True,
+            save_hotspots_heat=True,
+            save_hotspots_overlay=True,
+            planes=planes,
+        )
+        if pool is not None:
+            hotspots = await limiter.run("cpu", traced(settings, "roi_hotspots", image_file_name, pool.hotspots), ctx, **options)
+        else:
+            hotspots = await limiter.run(
+                "cpu", traced(settings, "roi_hotspots", image_file_name, roi_hotspots),
+                image_path=ctx,
+                writer=writer,
+                **options,
+            )
+        manifest.record(
+            "hotspots", key, hotspot_params,
+            outputs={k: hotspots[k] for k in ("hotspots_heat_path", "hotspots_overlay_path")},
+            digest=hash_inputs(ctx.heat_png),
+        )
+        return hotspots
+
+    print(f"Overlaying ROI and creating hotspots for image {image_file_name}...")
+    # both stages finish before a failure propagates, so the shared frame is not in use when released
+    results = await asyncio.gather(overlay_stage(), hotspots_stage(), return_exceptions=True)
+    if pool is not None:
+        pool.release(ctx) # the workers are done with the shared frame
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    hotspots = results[1]
+    hotspots_digest = manifest.entry("hotspots").get("digest")
+
+    async def ensure_heat():
+        if ctx.heat is None: # hotspots were up to date: recompute the heatmap in memory, without saving it
+            await limiter.run(
+                "cpu", roi_hotspots, image_path=ctx,
+                save_hotspots_heat=False, save_hotspots_overlay=False, planes=planes,
+            )
+
+    # --- hotspots -> pre-screening gate ---
+    screening = settings.get("prescreen") or {"mode": "off"}
+    if "genai" in run and screening["mode"] != "off":
+        key = prescreen_key = manifest.key("prescreen", hotspots_digest, screening["gate"])
+        if up_to_date("prescreen", key):
+            decision = manifest.entry("prescreen")["result"]
+        else:
+            await ensure_heat()
+            decision = await limiter.run(
+                "cpu", traced(settings, "prescreen", image_file_name, prescreen),
+                ctx.heat, screening["gate"],
+            )
+            log_decision(image_source_path, decision, screening["mode"], screening.get("log_path"))
+            manifest.record("prescreen", key, screening["gate"], result=decision)
+    gated = decision is not None and screening["mode"] == "on" and not decision["needs_llm"]
+
+    # --- roi + hotspots -> genai -> bbox overlay ---
+    genai_params = {
+        "endpoint": settings["AZURE_OPENAI_ENDPOINT"],
+        "deployment": settings["AZURE_OPENAI_CHAT_MULTIMODEL_DEPLOYMENT_NAME"],
+        "api_version": settings["AZURE_OPENAI_API_VERSION"],
+        "prompts": load_prompts(crops=bool(settings.get("genai_crops")))[2],
+        "crops": settings.get("genai_crops"),
+        "upload": settings.get("upload"),
+        "heat_upload": settings.get("heat_upload"),
+        "roi_prompt": settings.get("roi_prompt"),
+    }
+    key = manifest.key("genai", source, roi_digest, hotspots_digest, genai_params,
+                       artifact_params(writer, image_source_path, "04_genai_bboxes"),
+                       *(near_params("genai") if near_genai else []))
+    genai_json_path = compose_filename(image_source_path, "04_genai_bboxes", "json")
+    if "genai" in run and gated:
+        gated_key = manifest.key("genai", "gated", prescreen_key)
+        if not up_to_date("genai", gated_key):
+            print(f"Skipping GENAI analysis for image {image_file_name}: no hot region above the pre-screening threshold.")
+            # the verdict of an earlier ungated run no longer applies: remove it
+            bboxes_path = compose_filename(image_source_path, "04_genai_bboxes")
+            stale = {genai_json_path, writer.target_path(bboxes_path) if writer is not None else bboxes_path,
+                     *manifest.entry("genai").get("outputs", {}).values()}
+            for path in stale:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            manifest.record("genai", gated_key, result={"gated": True})
+    elif "genai" in run and up_to_date("genai", key):
+        genai_bboxes_path = manifest.entry("genai")["outputs"].get("genai_bboxes_path")
+    elif "genai" in run and near_genai:
+        print(f"Reusing the GENAI analysis of near-duplicate {near_match['image_path']} for image {image_file_name}...")
+        payload = rescale_genai_payload(read_json(near_match["genai_json_path"]), *scale)
+        with open(genai_json_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=4)
+        genai_bboxes_path = await limiter.run(
+            "cpu", draw_bboxes, ctx, payload, compose_filename(image_source_path, "04_genai_bboxes"), writer=writer,
+        )
+        reused.append("genai")
+        manifest.record(
+            "genai", key, {**genai_params, "near_dup": near_match["image_path"]},
+            outputs={"genai_json_path": genai_json_path, "genai_bboxes_path": genai_bboxes_path},
+            digest=hash_inputs(payload),
+        )
+    elif "genai" in run:
+        await ensure_heat()
+        print(f"Analyzing with GENAI hotspots for image {image_file_name}...")
+        roi_json_str, roi_stats = encode_roi_prompt(roi_payload, *ctx.size, genai_params["roi_prompt"])
+        print(f"ROI_JSON for image {image_file_name}: {roi_stats['sent']} of {roi_stats['proposals']} proposals, ~{roi_stats['tokens']} tokens.")
+        genai_bboxes_path = await limiter.run(
+            "openai", traced(settings, "genai_analysis", image_file_name, genai_analysis),
+            deployment_name=genai_params["deployment"],
+            azure_endpoint=genai_params["endpoint"],
+            api_key=settings["AZURE_OPENAI_API_KEY"],
+            api_version=genai_params["api_version"],
+            original_image_path=ctx,
+            hotspots_image_path=ctx.heat_color,
+            roi_json_str=roi_json_str,
+            save_payload=True,
+            cache=settings.get("cache"),
+            upload=genai_params["upload"],
+            heat_upload=genai_params["heat_upload"],
+            writer=writer,
+            roi_payload=roi_payload,
+            crops=genai_params["crops"],
+        )
+        manifest.record(
+            "genai", key, genai_params,
+            outputs={"genai_json_path": genai_json_path, "genai_bboxes_path": genai_bboxes_path},
+            digest=hash_inputs(read_json(genai_json_path)),
+        )
+
+    if skipped:
+        print(f"Up to date for image {image_file_name}: {', '.join(skipped)}.")
+    saved = sum(u["bytes_saved"] for u in ctx.uploads)
+    if saved:
+        print(f"Upload preparation saved {saved / 1024:.0f} KB for image {image_file_name}.")
+
+    return {
+        "roi_payload": roi_payload,
+        "uploads": ctx.uploads,
+        "hotspots": {k: v for k, v in hotspots.items() if k.endswith("_path")}, # arrays are not kept for the whole batch
+        "genai_bboxes_path": genai_bboxes_path,
+        "skipped": skipped,
+        "prescreen": decision,
+        "near_duplicate": {"image_path": near_match["image_path"], "distance": near_match["distance"], "reused": reused} if near_match else None,
+        "artifacts": {name: path for stage in STAGES if stage in run for name, path in manifest.entry(stage).get("outputs", {}).items()},
+    }
+
+
+async def run_batch(image_paths: list, settings: dict, limits: dict = None) -> list:
+    """
+    Process all images concurrently. A failure on one image is recorded in its
+    result ({"ok": False, "error": ...}) and does not stop the rest of the batch.
+    """
+    limiter = StageLimiter(limits)
+    # bound the number of images held in memory at once
+    images_in_flight = asyncio.Semaphore(2 * sum(limiter.limits.values()))
+
+    async def guarded(image_path):
+        try:
+            async with images_in_flight:
+                result = await process_image(image_path, settings, limiter)
+            return {"image_path": image_path, "ok": True, **result}
+        except Exception as e:
+            print(f"Image {os.path.basename(image_path)} failed: {e!r}")
+            return {
+                "image_path": image_path,
+                "ok": False,
+                "error": repr(e),
+                "traceback": traceback.format_exc(),
+            }
+
+    try:
+        return await asyncio.gather(*(guarded(p) for p in image_paths))
+    finally:
+        limiter.close()
@@ -0,0 +1,118 @@
+# Hotspot pre-screening gate.
+# Decides from the roi_hotspots heat array whether an image needs the (slow,
+# billed) genai_analysis call:
+#   1) the heat is reduced to at most max_side pixels per side (area averaging)
+#   2) hot pixels (heat >= hot_level) are counted in a window of window_frac of
+#      the shorter side; dense windows (>= min_density hot) form hot regions, so
+#      thin seam / print edges drop out and compact defect-like blobs remain
+#   3) connected hot regions are scored: area fraction x mean heat / 255
+#   4) the LLM is needed when the best region scores >= min_score
+# The heat is normalized per image, so the gate looks at how concentrated the
+# hot pixels are, not at their absolute level.
+#
+# Environment (see gate_from_env):
+#   PRESCREEN            : off (default) | shadow (decide and log, still call the LLM) | on
+#   PRESCREEN_<PARAM>    : override one of DEFAULT_GATE, e.g. PRESCREEN_MIN_SCORE=0.0005
+#   PRESCREEN_LOG        : JSONL decision log (default artifacts/prescreen.jsonl)
+# PRESCREEN=on is refused with the hotspot pyramid mode (see check_engine).
+
+# Imports
+import os, json, time, threading
+import cv2 # requires opencv-python
+import numpy as np
+from .utils import options_from_env
+
+DEFAULT_GATE = {
+    "max_side": 1024,         # analysis resolution
+    "hot_level": 180,         # heat (0..255) of a hot pixel
+    "window_frac": 0.02,      # density window, fraction of the shorter side
+    "min_density": 0.5,       # fraction of hot pixels in the window
+    "min_area_frac": 0.0001,  # smaller hot regions are ignored
+    "min_score": 0.0002,      # best region score that requires the LLM
+}
+PRESCREEN_MODES = ("off", "shadow", "on")
+
+_log_lock = threading.Lock()
+
+
+def hot_regions(heat: np.ndarray, gate: dict = None) -> list:
+    """Hot regions of a uint8 heat map, best score first, with boxes in heat pixels."""
+    gate = {**DEFAULT_GATE, **(gate or {})}
+    H, W = heat.shape[:2]
+    scale = min(1.0, gate["max_side"] / max(H, W))
+    small = cv2.resize(heat, (max(1, round(W * scale)), max(1, round(H * scale))), interpolation=cv2.INTER_AREA) if scale < 1 else heat
+    h, w = small.shape
+
+    win = max(3, int(round(gate["window_frac"] * min(h, w))) | 1)
+    hot = np.where(small >= gate["hot_level"], np.uint8(255), np.uint8(0))
+    density = cv2.blur(hot, (win, win))
+    mask = (density >= gate["min_density"] * 255).astype(np.uint8)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if n <= 1:
+        return []
+
+    areas = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+    sums = np.bincount(labels.ravel(), weights=small.ravel(), minlength=n)[1:]
+    means = sums / areas
+    area_frac = areas / float(h * w)
+    scores = area_frac * means / 255.0
+
+    regions = []
+    for i in np.argsort(-scores):
+        if area_frac[i] < gate["min_area_frac"]:
+            continue
+        x, y, bw, bh = stats[i + 1, :4]
+        regions.append({
+            "bbox": {"x": int(x / scale), "y": int(y / scale), "w": int(np.ceil(bw / scale)), "h": int(np.ceil(bh / scale))},
+            "area_frac": float(area_frac[i]),
+            "mean_heat": float(means[i]),
+            "score": float(scores[i]),
+        })
+    return regions
+
+def prescreen(heat: np.ndarray, gate: dict = None, top: int = 5) -> dict:
+    """Gate decision for one heat map: {"needs_llm", "score", "regions" (top ones), "gate"}."""
+    gate = {**DEFAULT_GATE, **(gate or {})}
+    regions = hot_regions(heat, gate)
+    score = regions[0]["score"] if regions else 0.0
+    return {
+        "needs_llm": score >= gate["min_score"],
+        "score": score,
+        "hot_regions": len(regions),
+        "regions": regions[:top],
+        "gate": gate,
+    }
+
+def check_engine(screening: dict, engine) -> None:
+    """
+    The gate thresholds are calibrated on native-resolution heat: refuse PRESCREEN=on
+    with a pyramid engine (HOTSPOT_SCALES), whose heat changes the decisions; warn in shadow mode.
+    """
+    if screening["mode"] == "off" or not engine.pyramid:
+        return
+    message = (f"PRESCREEN={screening['mode']} with HOTSPOT_SCALES={','.join(map(str, engine.scales))}: the gate thresholds "
+               "are calibrated on native-resolution heat (see benchmarks/hotspot_pyramid.py, gate column)")
+    if screening["mode"] == "on":
+        raise ValueError(f"{message}; use HOTSPOT_SCALES=1 or PRESCREEN=shadow.")
+    print(f"Warning: {message}; shadow decisions will not match the native ones.")
+
+def log_decision(image_path: str, decision: dict, mode: str, log_path: str = "artifacts/prescreen.jsonl") -> None:
+    """Print the decision and append it to the JSONL decision log."""
+    verdict = "LLM needed" if decision["needs_llm"] else "LLM skipped" if mode == "on" else "LLM would be skipped"
+    print(f"Pre-screening {os.path.basename(image_path)}: {verdict} "
+          f"(score {decision['score']:.5f}, threshold {decision['gate']['min_score']}, {decision['hot_regions']} hot regions).")
+    if not log_path:
+        return
+    record = {"ts": time.time(), "image": image_path, "mode": mode, **decision}
+    with _log_lock:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+def gate_from_env() -> dict:
+    """{"mode", "gate", "log_path"} from PRESCREEN, PRESCREEN_<PARAM>, PRESCREEN_LOG."""
+    mode = os.getenv("PRESCREEN", "off").lower()
+    if mode not in PRESCREEN_MODES:
+        raise ValueError(f"Unknown PRESCREEN mode <{mode}>, expected one of {PRESCREEN_MODES}")
+    gate = options_from_env(DEFAULT_GATE, "PRESCREEN_")
+    return {"mode": mode, "gate": gate, "log_path": os.getenv("PRESCREEN_LOG", "artifacts/prescreen.jsonl")}
@@ -0,0 +1,187 @@
+# Process pool for the CPU-bound local stages (roi_hotspots, roi_overlay).
+# Threads do not scale the PIL drawing and the NumPy glue of these stages (GIL),
+# so they can run in worker processes instead. Arrays never go through pickle:
+#   - the decoded RGBA frame is copied once into a multiprocessing.shared_memory
+#     segment, shared by the overlay and hotspots jobs of the image
+#   - the heat and its colormap are written by the worker into segments allocated
+#     by the parent, then copied into the ImageContext
+# Only paths, small dicts and the encoded heat PNG are pickled.
+# Each worker writes its artifacts itself, with the formats of the batch ArtifactWriter.
+#
+# OpenCV threads are split between the processes (cv2.setNumThreads), so that
+# workers x OpenCV threads does not exceed the cores.
+#
+# Environment (see pool_from_env):
+#   CPU_PROCESSES : worker processes, "auto" = number of cores; unset or 0 = thread pool only
+
+# Imports
+import os, time, threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import cv2 # requires opencv-python
+import numpy as np
+from .image_context import ImageContext
+from .telemetry import annotate
+
+_worker = {} # per worker process: ArtifactWriter
+
+
+# region Shared arrays
+class SharedArray:
+    """numpy array backed by a shared memory segment. spec (name, shape, dtype) is what crosses processes."""
+    def __init__(self, shape, dtype, spec: tuple = None):
+        if spec is None:
+            dtype = np.dtype(dtype)
+            size = max(1, int(np.prod(shape)) * dtype.itemsize)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            name, shape, dtype = spec
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False) # the parent unlinks it
+            except TypeError: # Python < 3.13: the workers share the parent resource tracker, registering again is harmless
+                self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.array = np.ndarray(shape, np.dtype(dtype), buffer=self.shm.buf)
+        self.spec = (self.shm.name, tuple(shape), np.dtype(dtype).str)
+
+    @classmethod
+    def attach(cls, spec: tuple) -> "SharedArray":
+        return cls(None, None, spec=spec)
+
+    @classmethod
+    def copy_of(cls, array: np.ndarray) -> "SharedArray":
+        shared = cls(array.shape, array.dtype)
+        np.copyto(shared.array, array)
+        return shared
+
+    def close(self):
+        """Drop the view and the mapping; the creator also removes the segment."""
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # a view is still alive somewhere: the mapping goes with it
+        if self.owner:
+            self.shm.unlink()
+#endregion
+
+
+# region Worker side
+def _init_worker(cv2_threads: int, formats: dict):
+    from .artifact_writer import ArtifactWriter
+
+    cv2.setNumThreads(cv2_threads)
+    _worker["writer"] = ArtifactWriter(formats=formats, max_workers=1) if formats is not None else None
+
+def _run_job(frame_spec: tuple, image_path: str, func):
+    """Call func(ctx, writer) on an ImageContext over the shared frame; (result, cpu seconds)."""
+    cpu0 = time.process_time()
+    frame = SharedArray.attach(frame_spec)
+    ctx = ImageContext.from_pixels(image_path, frame.array)
+    writer = _worker.get("writer")
+    try:
+        result = func(ctx, writer)
+        if writer is not None:
+            writer.flush() # the artifacts exist when the job returns
+            if writer.errors:
+                raise writer.errors.pop()
+    finally:
+        ctx = None
+        frame.close()
+    return result, time.process_time() - cpu0
+
+def _hotspots_job(frame_spec: tuple, heat_spec: tuple, color_spec: tuple, image_path: str, kwargs: dict):
+    from .roi_hotspots import roi_hotspots
+
+    def job(ctx, writer):
+        result = roi_hotspots(image_path=ctx, writer=writer, **kwargs)
+        heat, color = SharedArray.attach(heat_spec), SharedArray.attach(color_spec)
+        np.copyto(heat.array, ctx.heat)
+        np.copyto(color.array, ctx.heat_color)
+        heat.close()
+        color.close()
+        return {k: v for k, v in result.items() if k != "heat"}
+
+    return _run_job(frame_spec, image_path, job) + (os.getpid(),)
+
+def _overlay_job(frame_spec: tuple, image_path: str, payload: dict):
+    from .roi_highlighting import roi_overlay
+
+    job = lambda ctx, writer: roi_overlay(image_path=ctx, payload=payload, writer=writer)
+    return _run_job(frame_spec, image_path, job) + (os.getpid(),)
+#endregion
+
+
+# region Pool
+class ProcessStagePool:
+    """
+    Runs roi_hotspots / roi_overlay in worker processes. The methods block until
+    the job is done: call them from the StageLimiter "cpu" threads
+    (limiter.run("cpu", pool.hotspots, ctx, ...)).
+    """
+    def __init__(self, workers: int = None, writer=None):
+        cores = os.cpu_count() or 1
+        self.workers = max(1, workers or cores)
+        self.cv2_threads = max(1, cores // self.workers)
+        cv2.setNumThreads(self.cv2_threads) # the parent decodes and encodes uploads concurrently with the workers
+        context = mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+        if context.get_start_method() == "forkserver":
+            context.set_forkserver_preload(["common.process_pool", "common.roi_hotspots", "common.roi_highlighting"])
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context, # not fork: the parent has threads (event loop, stage pool, artifact writer)
+            initializer=_init_worker,
+            initargs=(self.cv2_threads, writer.formats if writer is not None else None),
+        )
+        self._lock = threading.Lock()
+
+    def frame(self, ctx: ImageContext) -> SharedArray:
+        """Shared copy of the decoded frame of ctx, made once per image (see release())."""
+        pixels = ctx.pixels # decoded outside the lock
+        with self._lock:
+            if ctx.shared is None:
+                ctx.shared = SharedArray.copy_of(pixels)
+            return ctx.shared
+
+    def release(self, ctx: ImageContext) -> None:
+        with self._lock:
+            if ctx.shared is not None:
+                ctx.shared.close()
+                ctx.shared = None
+
+    def hotspots(self, ctx: ImageContext, **kwargs) -> dict:
+        """roi_hotspots in a worker; fills ctx.heat, ctx.heat_color and ctx.heat_png like the in-process call."""
+        frame = self.frame(ctx)
+        H, W = frame.array.shape[:2]
+        heat, color = SharedArray((H, W), np.uint8), SharedArray((H, W, 3), np.uint8)
+        try:
+            result, cpu, pid = self._executor.submit(
+                _hotspots_job, frame.spec, heat.spec, color.spec, ctx.path, kwargs
+            ).result()
+            ctx.heat, ctx.heat_color = heat.array.copy(), color.array.copy()
+        finally:
+            heat.close()
+            color.close()
+        ctx.heat_png = result["hotspots_heat_png"]
+        annotate(worker_cpu_s=cpu, worker_pid=pid)
+        return {**result, "heat": ctx.heat}
+
+    def overlay(self, ctx: ImageContext, payload: dict) -> dict:
+        """roi_overlay in a worker; returns its artifact paths."""
+        result, cpu, pid = self._executor.submit(_overlay_job, self.frame(ctx).spec, ctx.path, payload).result()
+        annotate(worker_cpu_s=cpu, worker_pid=pid)
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def pool_from_env(writer=None) -> ProcessStagePool:
+    """ProcessStagePool with CPU_PROCESSES workers ("auto" = cores), None when unset or 0."""
+    value = os.getenv("CPU_PROCESSES", "0").lower()
+    if value in ("", "0"):
+        return None
+    return ProcessStagePool(None if value == "auto" else int(value), writer=writer)
+#endregion
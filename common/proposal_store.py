@@ -0,0 +1,384 @@
+# Columnar store of the ROI proposals and GenAI boxes of the whole corpus.
+# Each image's results live in their own JSON files (artifacts/<image>_01_ROI.json,
+# artifacts/<image>_04_genai_bboxes.json); corpus-level queries would have to parse
+# all of them. The store keeps one fixed-size record per box in a binary file that
+# is memory-mapped on load, so filters are NumPy operations over whole columns:
+#   image id, kind (roi / genai), source, x1, y1, x2, y2 (normalized 0..1), confidence, text id
+# Texts (captions, object names, GenAI labels) are interned: a row holds an id.
+#
+# Layout (append-only; loading ignores what follows the last recorded batch, the next
+# ingest cuts off what an interrupted one left):
+#   rows.bin      : ROW_DTYPE records
+#   texts.jsonl   : line n = text n
+#   images.jsonl  : {"id", "name", "width", "height"}, a later line for an id updates it
+#   sources.jsonl : line n = ingest batch n: {"path", "mtime_ns", "size", "image", "kind", "rows"}
+# Re-ingesting a changed JSON appends a new batch; rows of the batches it supersedes
+# (same image and kind) are masked out by `live`. Unchanged files are not read again.
+# A file removed since its ingest gets an empty "deleted" batch, so its rows stop being live.
+# ROI boxes are in pixels: the image size is read from the header of its 00_original
+# copy (or of the image in images_dirs); ROI files whose image is not found are skipped.
+#
+# Usage:
+#   python -m common.proposal_store artifacts [--images "images/1. ARTWORK COLLISION"] [--store artifacts/proposal_store]
+#
+#   store = ProposalStore()
+#   logo = store.select(kind="roi", source="dense_captions", text="logo", min_confidence=0.8)
+#   hits = store.overlapping(logo, store.select(kind="genai", text="ART_COLLISION"))
+#   store.export(hits, "artifacts/logo_collisions.parquet")   # .parquet (pyarrow), .csv or .npy
+
+# Imports
+import os, csv, json, time, argparse
+import numpy as np
+from PIL import Image as PILImage
+from .boxes import iou_matrix
+
+KINDS = ("roi", "genai")
+SOURCES = ("dense_captions", "objects", "genai", "other")
+ROW_DTYPE = np.dtype([
+    ("image", "<u4"),
+    ("batch", "<u4"),
+    ("kind", "u1"),
+    ("source", "u1"),
+    ("x1", "<f4"), ("y1", "<f4"), ("x2", "<f4"), ("y2", "<f4"),
+    ("confidence", "<f4"),
+    ("text", "<u4"),
+])
+POSTFIXES = {"_01_ROI.json": "roi", "_04_genai_bboxes.json": "genai"}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+
+# region Append-only files
+def read_lines(path: str) -> list:
+    """Complete JSON lines of path; an incomplete last line (append in progress or interrupted) is ignored."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+    return [json.loads(line) for line in data[:data.rfind(b"\n") + 1].splitlines()]
+
+def truncate_partial_line(path: str) -> None:
+    """Cut off an incomplete last line left by an interrupted append (writer side only)."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r+b") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+
+def append_lines(path: str, items: list) -> None:
+    if items:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items))
+#endregion
+
+
+# region Artifact parsing
+def is_within(path: str, folder: str) -> bool:
+    """True when path is folder or inside it (path components, so "store2" is not inside "store")."""
+    path, folder = os.path.abspath(path), os.path.abspath(folder)
+    return os.path.commonpath([path, folder]) == folder
+
+def artifact_kind(path: str) -> tuple:
+    """(image name, kind) of a pipeline JSON artifact, (None, None) for other files."""
+    name = os.path.basename(path)
+    for postfix, kind in POSTFIXES.items():
+        if name.endswith(postfix):
+            return name[:-len(postfix)], kind
+    return None, None
+
+def image_size(json_path: str, image_name: str, payload: dict, images_dirs=()) -> tuple:
+    """(W, H) of the image of an ROI payload, from its 00_original copy or the source image; None if not found."""
+    folder = os.path.dirname(json_path)
+    candidates = [os.path.join(folder, f"{image_name}_00_original{ext}") for ext in IMAGE_EXTENSIONS]
+    candidates += [os.path.join(d, image_name + ext) for d in images_dirs for ext in IMAGE_EXTENSIONS]
+    context_path = (payload.get("context") or {}).get("image_path")
+    if context_path:
+        candidates.append(context_path)
+    for path in candidates:
+        if os.path.isfile(path):
+            with PILImage.open(path) as im: # header only
+                return im.size
+    return None
+
+def payload_rows(kind: str, payload: dict, size: tuple) -> list:
+    """(source, x1, y1, x2, y2, confidence, text) per box, coordinates normalized."""
+    if kind == "genai":
+        return [("genai", b["x_min"], b["y_min"], b["x_max"], b["y_max"], b.get("confidence", 0.0), b.get("label", ""))
+                for b in payload.get("bboxes", [])]
+    W, H = size
+    rows = []
+    for p in payload.get("proposals", []):
+        b = p["bbox"]
+        rows.append((p.get("source", "other"), b["x"] / W, b["y"] / H, (b["x"] + b["w"]) / W, (b["y"] + b["h"]) / H,
+                     p.get("confidence", 0.0), p.get("text", "")))
+    return rows
+#endregion
+
+
+class ProposalStore:
+    """
+    Append-only columnar store of ROI proposals and GenAI boxes. One writer at a time;
+    loading never modifies the files, so readers can open the store during an ingest.
+    """
+    def __init__(self, root: str = "artifacts/proposal_store"):
+        self.root = root
+        # sources first: the texts, images and rows of a recorded batch are on disk before its sources line
+        self.sources = read_lines(self._path("sources.jsonl"))
+        self._files = {s["path"]: s for s in self.sources} # latest batch per file
+        self._n = sum(s["rows"] for s in self.sources) # rows beyond belong to an ingest in progress or interrupted
+        self.texts = read_lines(self._path("texts.jsonl"))
+        self._text_ids = {t: i for i, t in enumerate(self.texts)}
+        self.images = {}    # id -> {"id", "name", "width", "height"}
+        for item in read_lines(self._path("images.jsonl")):
+            self.images[item["id"]] = item
+        self._image_ids = {item["name"]: i for i, item in self.images.items()}
+        self._rows = self._live = None
+        self._repaired = False
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    # region Columns
+    @property
+    def rows(self) -> np.ndarray:
+        """All rows of the recorded batches (live or superseded), memory-mapped read-only."""
+        if self._rows is None:
+            path = self._path("rows.bin")
+            self._rows = np.memmap(path, ROW_DTYPE, mode="r", shape=(self._n,)) if self._n else np.zeros(0, ROW_DTYPE)
+        return self._rows
+
+    @property
+    def live(self) -> np.ndarray:
+        """Boolean mask of the rows of the latest batch of each (image, kind)."""
+        if self._live is None:
+            latest = {}
+            for batch, s in enumerate(self.sources):
+                latest[(s["image"], s["kind"])] = batch
+            live_batch = np.zeros(len(self.sources) + 1, bool)
+            live_batch[list(latest.values())] = True
+            self._live = live_batch[self.rows["batch"]]
+        return self._live
+
+    def __len__(self):
+        return int(self.live.sum())
+
+    def text_ids(self, needle: str) -> np.ndarray:
+        """Ids of the interned texts containing needle (case-insensitive)."""
+        needle = needle.lower()
+        return np.array([i for i, t in enumerate(self.texts) if needle in t.lower()], dtype=np.uint32)
+    #endregion
+
+    # region Ingest
+    def _repair(self) -> None:
+        """Cut off what an interrupted ingest left after the last recorded batch (before the first append)."""
+        if self._repaired:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        for name in ("texts.jsonl", "images.jsonl", "sources.jsonl"):
+            truncate_partial_line(self._path(name))
+        rows_path = self._path("rows.bin")
+        if os.path.exists(rows_path) and os.path.getsize(rows_path) != self._n * ROW_DTYPE.itemsize:
+            with open(rows_path, "r+b") as f:
+                f.truncate(self._n * ROW_DTYPE.itemsize)
+        self._repaired = True
+
+    def _intern(self, text: str, new: list) -> int:
+        i = self._text_ids.get(text)
+        if i is None:
+            i = self._text_ids[text] = len(self.texts)
+            self.texts.append(text)
+            new.append(text)
+        return i
+
+    def _image(self, name: str, size: tuple, new: list) -> int:
+        i = self._image_ids.get(name)
+        if i is None:
+            i = self._image_ids[name] = len(self.images)
+        item = {"id": i, "name": name, "width": size[0] if size else None, "height": size[1] if size else None}
+        old = self.images.get(i)
+        if old is None or (size and (old["width"], old["height"]) != size):
+            self.images[i] = item
+            new.append(item)
+        return i
+
+    def is_current(self, path: str) -> bool:
+        """True when path was ingested and has not changed since."""
+        known = self._files.get(path)
+        st = os.stat(path)
+        return known is not None and (known["mtime_ns"], known["size"]) == (st.st_mtime_ns, st.st_size)
+
+    def ingest_file(self, path: str, images_dirs=()) -> int:
+        """
+        Append the boxes of one ROI / GenAI JSON artifact. Returns the number of rows
+        appended, 0 when the file is unchanged since its last ingest, None when skipped
+        (not an artifact, or ROI file whose image size is unknown).
+        """
+        name, kind = artifact_kind(path)
+        if kind is None:
+            return None
+        if self.is_current(path):
+            return 0
+        st = os.stat(path)
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        size = image_size(path, name, payload, images_dirs) if kind == "roi" else None
+        if kind == "roi" and size is None:
+            return None
+
+        new_texts, new_images = [], []
+        image = self._image(name, size, new_images)
+        batch = len(self.sources)
+        parsed = payload_rows(kind, payload, size)
+        rows = np.zeros(len(parsed), ROW_DTYPE)
+        if parsed:
+            source, x1, y1, x2, y2, conf, text = zip(*parsed)
+            rows["image"], rows["batch"], rows["kind"] = image, batch, KINDS.index(kind)
+            rows["source"] = [SOURCES.index(s) if s in SOURCES else SOURCES.index("other") for s in source]
+            rows["x1"], rows["y1"], rows["x2"], rows["y2"], rows["confidence"] = x1, y1, x2, y2, conf
+            rows["text"] = [self._intern(t, new_texts) for t in text]
+
+        # texts and images first: a row never points to an id that is not on disk
+        self._repair()
+        append_lines(self._path("texts.jsonl"), new_texts)
+        append_lines(self._path("images.jsonl"), new_images)
+        with open(self._path("rows.bin"), "ab") as f:
+            f.write(rows.tobytes())
+        source = {"path": path, "mtime_ns": st.st_mtime_ns, "size": st.st_size, "image": image, "kind": kind, "rows": len(rows)}
+        append_lines(self._path("sources.jsonl"), [source])
+        self.sources.append(source)
+        self._files[path] = source
+        self._n += len(rows)
+        self._rows = self._live = None
+        return len(rows)
+
+    def remove_file(self, path: str) -> None:
+        """Record that an ingested file is gone (e.g. GenAI boxes removed by the pre-screening gate): its rows stop being live."""
+        known = self._files[path]
+        self._repair()
+        source = {"path": path, "mtime_ns": None, "size": None, "image": known["image"], "kind": known["kind"], "rows": 0, "deleted": True}
+        append_lines(self._path("sources.jsonl"), [source])
+        self.sources.append(source)
+        self._files[path] = source
+        self._live = None
+
+    def ingest(self, folder: str, images_dirs=()) -> dict:
+        """Ingest every ROI / GenAI JSON artifact under folder (recursively); files removed since are tombstoned."""
+        counts = {"files": 0, "rows": 0, "unchanged": 0, "skipped": 0, "removed": 0}
+        for root, _, files in os.walk(folder):
+            if is_within(root, self.root):
+                continue
+            for name in sorted(files):
+                if artifact_kind(name)[1] is None:
+                    continue
+                path = os.path.join(root, name)
+                if self.is_current(path):
+                    counts["unchanged"] += 1
+                    continue
+                n = self.ingest_file(path, images_dirs)
+                if n is None:
+                    counts["skipped"] += 1
+                else:
+                    counts["files"] += 1
+                    counts["rows"] += n
+        for path, source in list(self._files.items()):
+            if not source.get("deleted") and is_within(path, folder) and not os.path.exists(path):
+                self.remove_file(path)
+                counts["removed"] += 1
+        return counts
+    #endregion
+
+    # region Queries
+    def select(self, kind: str = None, source: str = None, text: str = None, min_confidence: float = None,
+               image: str = None) -> np.ndarray:
+        """Indices of the live rows matching all the given filters (text: case-insensitive substring)."""
+        rows = self.rows
+        mask = self.live.copy()
+        if kind is not None:
+            mask &= rows["kind"] == KINDS.index(kind)
+        if source is not None:
+            mask &= rows["source"] == SOURCES.index(source)
+        if text is not None:
+            mask &= np.isin(rows["text"], self.text_ids(text))
+        if min_confidence is not None:
+            mask &= rows["confidence"] >= min_confidence
+        if image is not None:
+            mask &= rows["image"] == self._image_ids.get(image, -1)
+        return np.flatnonzero(mask)
+
+    def overlapping(self, a: np.ndarray, b: np.ndarray, min_iou: float = 0.0) -> np.ndarray:
+        """The rows of a that overlap (IoU > min_iou) at least one row of b of the same image."""
+        rows = self.rows
+        a, b = np.asarray(a), np.asarray(b)
+        a = a[np.argsort(rows["image"][a], kind="stable")]
+        b = b[np.argsort(rows["image"][b], kind="stable")]
+        ia, ib = rows["image"][a], rows["image"][b]
+        keep = []
+        for image in np.intersect1d(ia, ib):
+            ra = a[np.searchsorted(ia, image):np.searchsorted(ia, image, side="right")]
+            rb = b[np.searchsorted(ib, image):np.searchsorted(ib, image, side="right")]
+            iou = iou_matrix(self.boxes(ra), self.boxes(rb))
+            keep.append(ra[(iou > min_iou).any(axis=1)])
+        return np.sort(np.concatenate(keep)) if keep else np.zeros(0, np.int64)
+
+    def boxes(self, idx: np.ndarray) -> np.ndarray:
+        """(N,4) normalized x1,y1,x2,y2 of rows idx."""
+        r = self.rows[idx]
+        return np.stack([r["x1"], r["y1"], r["x2"], r["y2"]], axis=1).astype(np.float64)
+
+    def columns(self, idx: np.ndarray) -> dict:
+        """Decoded columns of rows idx: image name, kind, source and text as strings."""
+        r = np.asarray(self.rows[idx])
+        names = np.array([self.images[i]["name"] for i in range(len(self.images))], dtype=object)
+        texts = np.array(self.texts, dtype=object)
+        return {
+            "image": names[r["image"]] if len(r) else np.zeros(0, object),
+            "kind": np.array(KINDS, dtype=object)[r["kind"]],
+            "source": np.array(SOURCES, dtype=object)[r["source"]],
+            **{c: r[c] for c in ("x1", "y1", "x2", "y2", "confidence")},
+            "text": texts[r["text"]] if len(r) else np.zeros(0, object),
+        }
+
+    def export(self, idx: np.ndarray, path: str) -> str:
+        """Write rows idx to path: .parquet (requires pyarrow), .csv (decoded) or .npy (raw records)."""
+        ext = os.path.splitext(path)[1].lower()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if ext == ".npy":
+            np.save(path, np.asarray(self.rows[idx]))
+            return path
+        columns = self.columns(idx)
+        if ext == ".parquet":
+            try:
+                import pyarrow as pa, pyarrow.parquet as pq # optional dependency
+            except ImportError as e:
+                raise ImportError("Parquet export requires pyarrow (pip install pyarrow); use .csv or .npy otherwise") from e
+            pq.write_table(pa.table({k: list(v) if v.dtype == object else v for k, v in columns.items()}), path)
+        elif ext == ".csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                out = csv.writer(f)
+                out.writerow(columns)
+                out.writerows(zip(*(v.tolist() for v in columns.values())))
+        else:
+            raise ValueError(f"Unknown export format <{ext}>, expected .parquet, .csv or .npy")
+        return path
+    #endregion
+
+
+# ---------- Main function ----------
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the ROI / GenAI JSON artifacts into the columnar proposal store.")
+    parser.add_argument("folder", nargs="?", default="artifacts", help="folder of JSON artifacts (searched recursively)")
+    parser.add_argument("--images", nargs="*", default=[], help="folders of the source images (for the ROI image sizes)")
+    parser.add_argument("--store", default="artifacts/proposal_store")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    store = ProposalStore(args.store)
+    print(f"Loaded {len(store)} live rows of {len(store.images)} images in {time.perf_counter() - t0:.2f} s.")
+    t0 = time.perf_counter()
+    counts = store.ingest(args.folder, args.images)
+    print(f"Ingested {counts['rows']} rows from {counts['files']} files ({counts['unchanged']} unchanged, "
+          f"{counts['skipped']} skipped: image not found, {counts['removed']} removed) in {time.perf_counter() - t0:.2f} s; {len(store)} live rows.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Content-addressed on-disk cache for remote responses (Vision REST, Azure OpenAI).
+# Entries are keyed by a SHA-256 of the exact request inputs, so a re-run with the
+# same image bytes / prompt / schema / model parameters makes no remote call.
+#
+# Layout:
+#   <cache_dir>/<namespace>/<key[:2]>/<key>.json
+#
+# Modes:
+#   - "use"     : read and write entries (default)
+#   - "refresh" : ignore existing entries, call the service and overwrite them
+#   - "off"     : bypass the cache completely
+
+# Imports
+import os, json, hashlib, threading
+from collections import OrderedDict
+
+
+CACHE_MODES = ("use", "refresh", "off")
+
+
+def hash_inputs(*parts) -> str:
+    """
+    Hash the request inputs into a cache key.
+    bytes are hashed as-is, str as UTF-8, anything else as canonical JSON.
+    Each part is length-prefixed so that ("ab", "c") != ("a", "bc").
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            data = bytes(part)
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of JSON-serializable responses.
+    Safe to share between the threads of the batch pipeline.
+    """
+    def __init__(self, cache_dir: str = "artifacts/cache", max_bytes: int = 512 * 1024**2, mode: str = "use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode <{mode}>, expected one of {CACHE_MODES}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = self.misses = self.writes = self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._total_bytes = 0
+        if mode != "off":
+            self._load_index()
+
+    def _load_index(self):
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    st = os.stat(os.path.join(root, name))
+                    found.append((st.st_mtime, os.path.join(root, name), st.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+
+    def _path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.cache_dir, namespace, key[:2], f"{key}.json")
+
+    def get(self, namespace: str, key: str):
+        """Return the cached value, or None on a miss (always None unless mode is "use")."""
+        if self.mode == "off":
+            return None
+        path = self._path(namespace, key)
+        with self._lock:
+            if self.mode != "use" or path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # keep recency across runs
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget(path)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, namespace: str, key: str, value) -> None:
+        if self.mode == "off":
+            return
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # atomic, readers never see a partial entry
+        with self._lock:
+            self._forget(path)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            self.writes += 1
+            self._evict()
+
+    def _forget(self, path: str):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+
+def cache_from_env() -> ResponseCache:
+    """
+    Build the cache from RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB and
+    RESPONSE_CACHE_MODE (use | refresh | off).
+    """
+    return ResponseCache(
+        cache_dir=os.getenv("RESPONSE_CACHE_DIR", "artifacts/cache"),
+        max_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB", "512")) * 1024**2),
+        mode=os.getenv("RESPONSE_CACHE_MODE", "use"),
+    )
@@ -8,12 +8,14 @@
 #   - artifacts/roi_overlay_labels.png  : overlay with rectangles + labels
 
 # Imports
-import requests, json, os, cv2, textwrap
-from azure.ai.vision.imageanalysis import ImageAnalysisClient # !pip install azure-ai-vision-imageanalysis
-from azure.ai.vision.imageanalysis.models import VisualFeatures # enum
-from IPython.display import Image as IPyImage, display
-from PIL import Image as PILImage, ImageDraw, ImageFont
+import textwrap
+from functools import lru_cache
+from PIL import ImageDraw, ImageFont
 from .utils import compose_filename
+from .image_context import as_image_context
+from .text_render import get_font, text_bbox
+from .artifact_writer import save_image
+from . import telemetry
 
 
 # region Helpers
@@ -32,17 +34,21 @@ def wrap_caption(text, max_chars=36):
 
 def measure_multiline(draw, text, font, padding=4):
     """
-    Measure a multiline text box using draw.textbbox().
+    Measure a multiline text box (same metrics as draw.textbbox(), cached per font and text).
     Returns (box_w, box_h) without including the (x,y) origin,
     plus the per-line heights to help with vertical layout.
     """
+    return _measure_multiline(font, text, padding)
+
+@lru_cache(maxsize=16384)
+def _measure_multiline(font, text, padding):
     lines = text.split("\n") if text else [""]
     line_heights = []
     max_w = 0
     total_h = 0
     for ln in lines:
         # textbbox returns (left, top, right, bottom)
-        l, t, r, b = draw.textbbox((0, 0), ln, font=font)
+        l, t, r, b = text_bbox(font, ln)
         w = r - l
         h = b - t
         max_w = max(max_w, w)
@@ -50,7 +56,7 @@ def measure_multiline(draw, text, font, padding=4):
         line_heights.append(h)
     box_w = max_w + 2 * padding
     box_h = total_h + 2 * padding
-    return box_w, box_h, line_heights
+    return box_w, box_h, tuple(line_heights)
 
 def draw_label(draw, W, H, xy, text, bg_color, fg_color=(255, 255, 255), font=None, padding=4):
     """
@@ -82,13 +88,21 @@ def area_ratio(b, W, H):
 
 # ---------- Main function ----------
 def roi_overlay(
-        image_path:str, 
+        image_path, 
         payload:dict,
         save_overlay_boxes: bool = True,
-        save_overlay_labels: bool = True
+        save_overlay_labels: bool = True,
+        writer=None
         ):
+    """
+    Draw the proposals on the image: 02A (boxes) and 02B (boxes + labels).
+    With an ArtifactWriter the PNGs are encoded in the background.
+    Returns the artifact paths (None for the ones not saved).
+    """
     
-    img = PILImage.open(image_path).convert("RGB")
+    ctx = as_image_context(image_path) # path or ImageContext
+    image_path = ctx.path
+    img = ctx.pil_rgb()
     W, H = img.size
         
     # Color map by source
@@ -101,39 +115,31 @@ def roi_overlay(
         "objects":        (0, 128, 255),
     }
     
-    # Try to use a truetype font if available, otherwise fallback
-    try:
-        # Adjust to a valid TTF on your system if you prefer a specific font
-        font = ImageFont.truetype("arial.ttf", size=16)
-    except:
-        font = ImageFont.load_default()
-    
-    # Prepare canvases
-    overlay_boxes = img.copy()
-    overlay_labels = img.copy()
-    draw_boxes = ImageDraw.Draw(overlay_boxes)
-    draw_labels = ImageDraw.Draw(overlay_labels)
+    # Try to use a truetype font if available, otherwise fallback (loaded once per process)
+    # Adjust to a valid TTF on your system if you prefer a specific font
+    font = get_font("arial.ttf", 16)
     
     proposals = payload.get("proposals", [])
     
     # (Optional) filter out near full-frame boxes (>85% area)
     proposals_for_draw = [p for p in proposals if area_ratio(p["bbox"], W, H) <= 0.85]
+    telemetry.annotate(proposals=len(proposals_for_draw))
     
-    # Draw rectangles only
+    # Draw rectangles only, once
+    overlay_boxes = img
+    draw_boxes = ImageDraw.Draw(overlay_boxes)
     for p in proposals_for_draw:
         src = p.get("source", "dense_captions")
         color = SRC_COLOR.get(src, (255, 0, 0))
         draw_bbox(draw_boxes, p["bbox"], color=color, width=3)
     
-    # Draw rectangles + labels
-    for p in proposals_for_draw:
+    # Rectangles + labels: the labels are composited on a copy of the boxes layer
+    overlay_labels = overlay_boxes.copy() if save_overlay_labels else None
+    draw_labels = ImageDraw.Draw(overlay_labels) if save_overlay_labels else None
+    for p in (proposals_for_draw if save_overlay_labels else []):
         src = p.get("source", "dense_captions")
-        color = SRC_COLOR.get(src, (255, 0, 0))
         bg = LABEL_BG.get(src, (255, 0, 0))
     
-        # Rectangle
-        draw_bbox(draw_labels, p["bbox"], color=color, width=3)
-    
         # Build label text
         cap = p.get("text", "")
         conf = p.get("confidence", 0.0)
@@ -150,8 +156,16 @@ def roi_overlay(
         draw_label(draw_labels, W=W, H=H, xy=(label_x, label_y), text=label_text, bg_color=bg, fg_color=(255, 255, 255), font=font, padding=4)
     
 
+    # with an ArtifactWriter the path may change extension, or be None if skipped
+    roi_overlay_path = compose_filename(image_path, "02A_roi_overlay")
     if save_overlay_boxes:
-        overlay_boxes.save(compose_filename(image_path, "02A_roi_overlay"))
+        roi_overlay_path = save_image(overlay_boxes, roi_overlay_path, writer)
     
+    roi_overlay_labels_path = compose_filename(image_path, "02B_roi_overlay_labels")
     if save_overlay_labels:
-        overlay_labels.save(compose_filename(image_path, "02B_roi_overlay_labels"))
\ No newline at end of file
+        roi_overlay_labels_path = save_image(overlay_labels, roi_overlay_labels_path, writer)
+
+    return {
+        "roi_overlay_path": roi_overlay_path if save_overlay_boxes else None,
+        "roi_overlay_labels_path": roi_overlay_labels_path if save_overlay_labels else None,
+    }
\ No newline at end of file
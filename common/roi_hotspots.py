@@ -1,82 +1,453 @@
 # Imports
-import os, cv2 # requires opencv-python
+import os, cv2, threading # requires opencv-python
 import numpy as np
 from .utils import compose_filename
+from .image_context import as_image_context
+from .artifact_writer import save_image
+from .heat_planes import fuse_planes
+
+# Fixed value ranges of the feature maps for an 8-bit gray input.
+# Fixed ranges make the per-tile histograms mergeable into one global histogram.
+EDGE_RANGE = 1448.0   # max Sobel magnitude: sqrt(2) * 4 * 255 ~ 1442.5
+VAR_RANGE = 16384.0   # max local variance: 255**2 / 4 ~ 16256
+HF_RANGE = 256.0      # absdiff of two 8-bit images
+FEATURE_HIST = {      # name -> (bins, upper bound, integer valued)
+    "edge": (16384, EDGE_RANGE, False),
+    "var": (65536, VAR_RANGE, False),
+    "hf": (256, HF_RANGE, True),
+}
+HALO = 8  # minimum tile overlap; larger kernels widen it (see kernel_halo)
 
 # region Helper functions
-def robust_normalize(m):
-    m = m.astype(np.float32)
-    lo, hi = np.percentile(m, 2), np.percentile(m, 98)
-    if hi - lo < 1e-6:
-        return np.zeros_like(m, dtype=np.float32)
-    m = np.clip((m - lo) / (hi - lo), 0, 1)
-    return m
+def histogram_percentile(hist, upper: float, q: float, integer_valued: bool = False) -> float:
+    """
+    Percentile q (0..100) of the samples counted in hist, a histogram with equal
+    bins over [0, upper). Same linear interpolation as np.percentile; the value of
+    each sample is approximated by its position inside its bin (exact for
+    integer-valued maps with one bin per integer).
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    cdf = np.cumsum(hist)
+    n = cdf[-1]
+    if n == 0:
+        return 0.0
+    width = upper / len(hist)
+
+    def value_at(k):  # k-th smallest sample, 0-based
+        b = int(np.searchsorted(cdf, k, side="right"))
+        if integer_valued:
+            return b * width
+        before = cdf[b - 1] if b > 0 else 0.0
+        return (b + (k - before + 0.5) / hist[b]) * width
+
+    rank = q / 100.0 * (n - 1)
+    k0 = int(rank)
+    v0 = value_at(k0)
+    v1 = value_at(min(k0 + 1, n - 1))
+    return v0 + (rank - k0) * (v1 - v0)
+
+def kernel_halo(var_ksize: int, hf_sigma: float) -> int:
+    """Tile overlap covering the largest kernel radius: box var_ksize, Gaussian hf_sigma (8-bit: 6 sigma + 1), Sobel 3x3."""
+    gaussian_ksize = int(round(hf_sigma * 3 * 2 + 1)) | 1 # as cv2.GaussianBlur picks it for 8-bit input
+    return max(HALO, var_ksize // 2, gaussian_ksize // 2, 1)
 #endregion
 
-# ---------- Main function ----------
-def roi_hotspots(
-        image_path:str,
-        create_edge_map: bool = True,
-        create_local_variance_map: bool = True,
-        create_high_freq_map: bool = True,
-        save_hotspots_heat: bool = True,
-        save_hotspots_overlay: bool = True
-        ) -> dict:
-    
-    # --- 1) Load image ---
-    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    if img is None:
-        raise ValueError(f"Not readable image: {image_path}")
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    H, W = gray.shape[:2]
+# region Hotspot engine
+class HotspotEngine:
+    """
+    Memory-bounded hotspot heatmap computation.
+
+    The image is processed in tiles (overlapping by a halo of the largest kernel
+    radius, so the filters see the same neighbourhood as on the full image) using
+    buffers allocated once and reused across tiles and images:
+      - pass 1 computes the feature maps per tile and accumulates fixed-range
+        histograms, giving the global 2/98 percentiles of each map;
+      - pass 2 recomputes the features per tile, normalizes, fuses and writes the
+        8-bit heat. With a single tile the features of pass 1 are reused.
+    Peak memory of the intermediates depends on tile_size, not on the image area.
+    Tolerance: compared to the previous full-frame np.percentile implementation
+    the 8-bit heat differs by at most 1 level (out of 255), on a few % of pixels.
+
+    Pyramid mode (scales other than (1.0,)): the feature maps are computed on
+    downscaled copies of the image (one heat per scale, averaged at the largest
+    scale) and only the final heat is upsampled to the native size. With
+    refine_frac > 0 the hottest refine_tile tiles (that fraction of all tiles) are
+    then recomputed at native resolution, normalized with percentiles taken on
+    those tiles plus an evenly spaced sample of the others. The result is an
+    approximation of the native heat: see compare_heat() and
+    benchmarks/hotspot_pyramid.py for the accuracy / CPU trade-off. Images not
+    larger than two refine tiles per side are always computed natively.
+
+    An engine is not thread-safe: use one per thread (see default_engine()).
+    """
+    def __init__(self, tile_size: int = 1024, weights: tuple = (0.4, 0.3, 0.3), var_ksize: int = 9, hf_sigma: float = 2.0,
+                 scales: tuple = (1.0,), refine_frac: float = 0.0, refine_tile: int = 256):
+        self.tile_size = tile_size
+        self.weights = dict(zip(("edge", "var", "hf"), weights))
+        self.var_ksize = var_ksize
+        self.hf_sigma = hf_sigma
+        self.halo = kernel_halo(var_ksize, hf_sigma)
+        self.scales = tuple(sorted((float(s) for s in scales), reverse=True))
+        if not self.scales or not all(0 < s <= 1 for s in self.scales):
+            raise ValueError(f"Hotspot scales must be in (0, 1], got {scales}")
+        self.refine_frac = refine_frac
+        self.refine_tile = refine_tile
+        self._capacity = 0
+        self._buf = {}
+
+    def _buffers(self, h: int, w: int) -> dict:
+        """Contiguous (h, w) views over flat buffers, grown only when needed."""
+        n = h * w
+        if n > self._capacity:
+            self._capacity = n
+            self._buf = {
+                "gray_f": np.empty(n, np.float32),
+                "gx": np.empty(n, np.float32),
+                "gy": np.empty(n, np.float32),
+                "edge": np.empty(n, np.float32),
+                "mean": np.empty(n, np.float32),
+                "var": np.empty(n, np.float32),
+                "blur": np.empty(n, np.uint8),
+                "hf_u8": np.empty(n, np.uint8),
+                "hf": np.empty(n, np.float32),
+                "heat": np.empty(n, np.float32),
+            }
+        return {k: v[:n].reshape(h, w) for k, v in self._buf.items()}
+
+    def _features(self, gray, maps) -> dict:
+        """Raw feature maps of a (halo-extended) gray tile, written into the shared buffers."""
+        b = self._buffers(*gray.shape)
+        out = {}
+        if "edge" in maps:
+            cv2.Sobel(gray, cv2.CV_32F, 1, 0, dst=b["gx"], ksize=3)
+            cv2.Sobel(gray, cv2.CV_32F, 0, 1, dst=b["gy"], ksize=3)
+            out["edge"] = cv2.magnitude(b["gx"], b["gy"], magnitude=b["edge"])
+        if "var" in maps:
+            k = (self.var_ksize, self.var_ksize)
+            gray_f = b["gray_f"]
+            np.copyto(gray_f, gray, casting="unsafe")
+            cv2.boxFilter(gray_f, -1, k, dst=b["mean"])
+            cv2.multiply(gray_f, gray_f, dst=gray_f)
+            cv2.boxFilter(gray_f, -1, k, dst=b["var"])             # mean of squares
+            cv2.multiply(b["mean"], b["mean"], dst=b["mean"])      # squared mean
+            cv2.subtract(b["var"], b["mean"], dst=b["var"])
+            out["var"] = np.maximum(b["var"], 0.0, out=b["var"])
+        if "hf" in maps:
+            cv2.GaussianBlur(gray, (0, 0), self.hf_sigma, dst=b["blur"], sigmaY=self.hf_sigma)
+            cv2.absdiff(gray, b["blur"], dst=b["hf_u8"])
+            out["hf"] = b["hf_u8"]
+        return out
+
+    def _tiles(self, H: int, W: int):
+        """Yield (core slice, halo slice, core-in-halo slice) for each tile."""
+        ts = self.tile_size or max(H, W)
+        for y0 in range(0, H, ts):
+            for x0 in range(0, W, ts):
+                y1, x1 = min(H, y0 + ts), min(W, x0 + ts)
+                hy0, hx0 = max(0, y0 - self.halo), max(0, x0 - self.halo)
+                hy1, hx1 = min(H, y1 + self.halo), min(W, x1 + self.halo)
+                yield (
+                    (slice(y0, y1), slice(x0, x1)),
+                    (slice(hy0, hy1), slice(hx0, hx1)),
+                    (slice(y0 - hy0, y1 - hy0), slice(x0 - hx0, x1 - hx0)),
+                )
+
+    def _normalized(self, m, core, lo: float, hi: float, h: int, w: int):
+        """clip((m[core] - lo) / (hi - lo), 0, 1) as float32, in a shared buffer."""
+        core_m = m[core]
+        if core_m.dtype != np.float32:
+            tmp = self._buf["hf"][: h * w].reshape(h, w)
+            np.copyto(tmp, core_m, casting="unsafe")
+            core_m = tmp
+        norm = self._buf["gx"][: h * w].reshape(h, w)
+        cv2.subtract(core_m, lo, dst=norm)
+        cv2.multiply(norm, 1.0 / (hi - lo), dst=norm)
+        np.clip(norm, 0, 1, out=norm)
+        return norm
+
+    def _fuse(self, feats: dict, core, ranges: dict, out):
+        """Normalize the core of each feature map, fuse with the weights and write 8-bit heat into out."""
+        h, w = out.shape
+        heat = self._buf["heat"][: h * w].reshape(h, w)
+        heat.fill(0)
+        for name, m in feats.items():
+            lo, hi = ranges[name]
+            if hi - lo < 1e-6:
+                continue  # flat map, normalizes to zeros
+            cv2.scaleAdd(self._normalized(m, core, lo, hi, h, w), self.weights[name], heat, dst=heat)
+        cv2.multiply(heat, 255.0, dst=heat)
+        np.copyto(out, heat, casting="unsafe")  # truncation, same as .astype(np.uint8)
+
+    @property
+    def pyramid(self) -> bool:
+        return self.scales != (1.0,)
+
+    def params(self) -> dict:
+        """Parameters that change the heat (recorded in the manifest)."""
+        params = {
+            "weights": self.weights,
+            "tile_size": self.tile_size,
+            "var_ksize": self.var_ksize,
+            "hf_sigma": self.hf_sigma,
+        }
+        if self.pyramid:
+            params.update(scales=list(self.scales), refine_frac=self.refine_frac, refine_tile=self.refine_tile)
+        return params
+
+    def compute(self, gray, maps=("edge", "var", "hf")):
+        """Return the 8-bit (H, W) heat of an 8-bit gray image."""
+        maps = tuple(m for m in ("edge", "var", "hf") if m in maps)
+        if self.pyramid and max(gray.shape[:2]) > 2 * self.refine_tile: # small images: native is as cheap
+            return self._compute_pyramid(gray, maps)
+        return self._compute_native(gray, maps)
 
+    def _ranges(self, hists: dict) -> dict:
+        """Global 2/98 percentiles of each feature map from its merged histogram."""
+        ranges = {}
+        for name, hist in hists.items():
+            bins, upper, integer_valued = FEATURE_HIST[name]
+            ranges[name] = (
+                histogram_percentile(hist, upper, 2, integer_valued),
+                histogram_percentile(hist, upper, 98, integer_valued),
+            )
+        return ranges
 
-    # --- 2) Edge map (Sobel magnitude) ---
-    if create_edge_map:
-        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
-        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
-        mag = cv2.magnitude(gx, gy)
-        edge_map = mag
+    def _native_ranges(self, gray, maps, tiles) -> tuple:
+        """Pass 1: (global 2/98 percentiles of each map, features of the last tile)."""
+        hists = {name: np.zeros(FEATURE_HIST[name][0], np.float64) for name in maps}
+        feats = None
+        for core, halo, inner in tiles:
+            feats = self._features(gray[halo], maps)
+            for name, m in feats.items():
+                bins, upper, _ = FEATURE_HIST[name]
+                core_m = np.ascontiguousarray(m[inner])
+                hists[name] += cv2.calcHist([core_m], [0], None, [bins], [0, upper]).ravel()
+        return self._ranges(hists), feats
 
+    def compute_planes(self, gray, maps=("edge", "var", "hf")) -> np.ndarray:
+        """
+        (H, W, len(maps)) uint8 normalized feature maps (2/98 percentiles -> 0..255) at
+        native resolution, for re-weighting without recomputing the features (see
+        common/heat_planes.py). Fused with fuse_planes they give the heat within 1 level.
+        """
+        maps = tuple(m for m in ("edge", "var", "hf") if m in maps)
+        H, W = gray.shape[:2]
+        tiles = list(self._tiles(H, W))
+        ranges, feats = self._native_ranges(gray, maps, tiles)
+        planes = np.zeros((H, W, len(maps)), np.uint8)
+        for core, halo, inner in tiles:
+            if len(tiles) > 1:
+                feats = self._features(gray[halo], maps)
+            out = planes[core]
+            for i, name in enumerate(maps):
+                lo, hi = ranges[name]
+                if hi - lo < 1e-6:
+                    continue  # flat map, normalizes to zeros
+                norm = self._normalized(feats[name], inner, lo, hi, *out.shape[:2])
+                cv2.multiply(norm, 255.0, dst=norm)
+                cv2.add(norm, 0.5, dst=norm) # rounded
+                np.copyto(out[..., i], norm, casting="unsafe")
+        return planes
 
-    # --- 3) Local variance (sliding window) ---
-    # 9x9 window (tunable)
-    if create_local_variance_map:
-        k = 9
-        mean = cv2.boxFilter(gray.astype(np.float32), ddepth=-1, ksize=(k, k))
-        mean_sq = cv2.boxFilter((gray.astype(np.float32)**2), ddepth=-1, ksize=(k, k))
-        var_map = np.maximum(mean_sq - mean**2, 0.0)
+    def _compute_native(self, gray, maps):
+        H, W = gray.shape[:2]
+        tiles = list(self._tiles(H, W))
 
+        # --- pass 1: global histograms ---
+        ranges, feats = self._native_ranges(gray, maps, tiles)
 
-    # --- 4) High-frequency energy (hi-pass) ---
-    # Blurred - original -> high-freq approx (or use Laplacian)
-    if create_high_freq_map:
-        blur = cv2.GaussianBlur(gray, (0, 0), sigmaX=2, sigmaY=2)
-        hf_map = cv2.absdiff(gray, blur).astype(np.float32)
+        # --- pass 2: normalize and fuse ---
+        heat = np.empty((H, W), np.uint8)
+        for core, halo, inner in tiles:
+            if len(tiles) > 1:
+                feats = self._features(gray[halo], maps)
+            self._fuse(feats, inner, ranges, heat[core])
+        return heat
 
+    def _compute_pyramid(self, gray, maps):
+        H, W = gray.shape[:2]
+        size = lambda s: (max(1, round(W * s)), max(1, round(H * s)))
+        base = size(self.scales[0])  # the heats of all scales are averaged at the largest one
+
+        # --- per-scale heat, averaged at the base scale ---
+        acc = None
+        for s in self.scales:
+            small = gray if s == 1.0 else cv2.resize(gray, size(s), interpolation=cv2.INTER_AREA)
+            heat_s = self._compute_native(small, maps)
+            if heat_s.shape[::-1] != base:
+                heat_s = cv2.resize(heat_s, base, interpolation=cv2.INTER_LINEAR)
+            if len(self.scales) == 1:
+                acc = heat_s
+                break
+            if acc is None:
+                acc = np.zeros(heat_s.shape, np.float32)
+            cv2.accumulate(heat_s, acc)
+        if acc.dtype != np.uint8:
+            acc = (acc * (1.0 / len(self.scales))).astype(np.uint8)
+
+        # --- upsample the final heat only ---
+        heat = cv2.resize(acc, (W, H), interpolation=cv2.INTER_LINEAR) if acc.shape != (H, W) else acc
+        if self.refine_frac > 0:
+            self._refine(gray, heat, maps)
+        return heat
+
+    def _refine(self, gray, heat, maps):
+        """Recompute the hottest refine_tile tiles of heat at native resolution, in place."""
+        H, W = heat.shape
+        ts = self.refine_tile
+        grid = [(slice(y, min(H, y + ts)), slice(x, min(W, x + ts))) for y in range(0, H, ts) for x in range(0, W, ts)]
+        means = np.array([cv2.mean(heat[t])[0] for t in grid])
+        n = max(1, int(np.ceil(self.refine_frac * len(grid))))
+        hottest = [i for i in np.argsort(-means, kind="stable")[:n] if means[i] > 0]
+        if not hottest:
+            return
+        # percentiles of the native maps: hottest tiles + an evenly spaced sample of the others
+        sample = sorted(set(hottest) | set(range(0, len(grid), max(1, len(grid) // n))))
+
+        def halo_slices(t):
+            (ys, xs) = t
+            hy0, hx0 = max(0, ys.start - self.halo), max(0, xs.start - self.halo)
+            hy1, hx1 = min(H, ys.stop + self.halo), min(W, xs.stop + self.halo)
+            return (
+                (slice(hy0, hy1), slice(hx0, hx1)),
+                (slice(ys.start - hy0, ys.stop - hy0), slice(xs.start - hx0, xs.stop - hx0)),
+            )
+
+        hists = {name: np.zeros(FEATURE_HIST[name][0], np.float64) for name in maps}
+        for i in sample:
+            halo, inner = halo_slices(grid[i])
+            for name, m in self._features(gray[halo], maps).items():
+                bins, upper, _ = FEATURE_HIST[name]
+                hists[name] += cv2.calcHist([np.ascontiguousarray(m[inner])], [0], None, [bins], [0, upper]).ravel()
+        ranges = self._ranges(hists)
+
+        for i in hottest:
+            halo, inner = halo_slices(grid[i])
+            self._fuse(self._features(gray[halo], maps), inner, ranges, heat[grid[i]])
+
+
+def compare_heat(reference: np.ndarray, heat: np.ndarray, top_frac: float = 0.05, block: int = 1) -> dict:
+    """
+    Agreement of an approximate heat (e.g. pyramid mode) with the native one:
+    mean / p99 absolute error in levels (0..255), Pearson correlation and IoU of
+    the top_frac hottest cells of each map. With block > 1 both maps are first
+    averaged over block x block cells (closer to what the LLM sees after the
+    heatmap upload is downscaled).
+    """
+    if block > 1:
+        H, W = reference.shape[:2]
+        cells = (max(1, W // block), max(1, H // block))
+        reference = cv2.resize(reference, cells, interpolation=cv2.INTER_AREA)
+        heat = cv2.resize(heat, cells, interpolation=cv2.INTER_AREA)
+    ref = reference.astype(np.float32).ravel()
+    approx = heat.astype(np.float32).ravel()
+    err = np.abs(ref - approx)
+    corr = float(np.corrcoef(ref, approx)[0, 1]) if ref.std() > 0 and approx.std() > 0 else 0.0
+    k = max(1, int(top_frac * ref.size))
+    top_ref = np.zeros(ref.size, bool)
+    top_ref[np.argpartition(-ref, k - 1)[:k]] = True
+    top_approx = np.zeros(ref.size, bool)
+    top_approx[np.argpartition(-approx, k - 1)[:k]] = True
+    union = np.count_nonzero(top_ref | top_approx)
+    return {
+        "mae": float(err.mean()),
+        "p99_abs_err": float(np.percentile(err, 99)),
+        "corr": corr,
+        "top_iou": np.count_nonzero(top_ref & top_approx) / union if union else 1.0,
+    }
+
+
+_local = threading.local()
+
+def engine_options_from_env() -> dict:
+    """
+    Pyramid mode options (HotspotEngine keyword arguments) from the environment:
+    HOTSPOT_SCALES (e.g. "0.5" or "0.5,0.25"; default 1 = native resolution),
+    HOTSPOT_REFINE_FRAC (fraction of tiles refined at native resolution, default 0),
+    HOTSPOT_REFINE_TILE (refinement tile side in pixels, default 256),
+    and the fusion weights HOTSPOT_WEIGHTS (edge,var,hf; default 0.4,0.3,0.3).
+    """
+    options = {}
+    if os.getenv("HOTSPOT_WEIGHTS"):
+        options["weights"] = tuple(float(w) for w in os.environ["HOTSPOT_WEIGHTS"].split(","))
+    if os.getenv("HOTSPOT_SCALES"):
+        options["scales"] = tuple(float(s) for s in os.environ["HOTSPOT_SCALES"].split(","))
+    if os.getenv("HOTSPOT_REFINE_FRAC"):
+        options["refine_frac"] = float(os.environ["HOTSPOT_REFINE_FRAC"])
+    if os.getenv("HOTSPOT_REFINE_TILE"):
+        options["refine_tile"] = int(os.environ["HOTSPOT_REFINE_TILE"])
+    return options
+
+def default_engine() -> HotspotEngine:
+    """Per-thread engine, so buffers are reused across the images of one worker thread."""
+    if not hasattr(_local, "engine"):
+        _local.engine = HotspotEngine(**engine_options_from_env())
+    return _local.engine
+#endregion
+
+
+# ---------- Main function ----------
+def roi_hotspots(
+        image_path,
+        create_edge_map: bool = True,
+        create_local_variance_map: bool = True,
+        create_high_freq_map: bool = True,
+        save_hotspots_heat: bool = True,
+        save_hotspots_overlay: bool = True,
+        engine: HotspotEngine = None,
+        writer=None,
+        planes=None
+        ) -> dict:
+    """
+    Hotspot heat (weighted edge / variance / high-frequency maps), its turbo colormap
+    (03A) and overlay (03B). With a PlaneStore (planes, see common/heat_planes.py) the
+    normalized maps are stored on the first run and the heat is fused from them, so
+    a run with other weights does not recompute the features.
+    """
 
-    # --- 5) Normalizes each map on [0,1] safely (percentiles) ---
-    edge_n = robust_normalize(edge_map)
-    var_n  = robust_normalize(var_map)
-    hf_n   = robust_normalize(hf_map)
+    # --- 1) Load image (path or ImageContext, decoded once) ---
+    ctx = as_image_context(image_path)
+    image_path = ctx.path
+    engine = engine or default_engine()
 
 
-    # --- 6) Weigthed fusion into a heatmap (weights are correlated with defects) ---
-    w_edge, w_var, w_hf = 0.4, 0.3, 0.3
-    heat = (w_edge * edge_n + w_var * var_n + w_hf * hf_n).astype(np.float32)
+    # --- 2..6) Edge map (Sobel magnitude), local variance (9x9 window), high-frequency energy
+    # (Gaussian hi-pass), each normalized on [0,1] (2/98 percentiles) and fused with
+    # weights correlated with defects (0.4, 0.3, 0.3) ---
+    maps = [name for name, enabled in (
+        ("edge", create_edge_map),
+        ("var", create_local_variance_map),
+        ("hf", create_high_freq_map),
+    ) if enabled]
+    if planes is not None and not engine.pyramid:
+        key = planes.key(ctx.raw, engine, maps)
+        stored = planes.get(key)
+        if stored is None:
+            stored = planes.put(key, engine.compute_planes(ctx.gray(), maps), image_path=image_path, maps=maps)
+        heat = fuse_planes(stored, [engine.weights[m] for m in maps])
+    else:
+        heat = engine.compute(ctx.gray(), maps)
 
 
     # --- 7) Show and save overlay ---
-    heat_color = cv2.applyColorMap((heat*255).astype(np.uint8), cv2.COLORMAP_TURBO)
-    overlay = cv2.addWeighted(img, 0.75, heat_color, 0.35, 0)
+    heat_color = cv2.applyColorMap(heat, cv2.COLORMAP_TURBO)
+    ctx.heat, ctx.heat_color = heat, heat_color
+    ctx.heat_png = cv2.imencode(".png", heat_color)[1].tobytes() # encoded once: saved and uploaded
 
+    # with an ArtifactWriter the files are written in the background (path may change extension, or be None if skipped)
     hotspots_heat_path = compose_filename(image_path, "03A_hotspots_heat")
     if save_hotspots_heat:
-        cv2.imwrite(hotspots_heat_path, heat_color,)
+        hotspots_heat_path = save_image(heat_color, hotspots_heat_path, writer, encoded=ctx.heat_png)
 
     hotspots_overlay_path = compose_filename(image_path, "03B_hotspots_overlay")
     if save_hotspots_overlay:
-        cv2.imwrite(hotspots_overlay_path, overlay)
+        overlay = cv2.addWeighted(ctx.bgr(), 0.75, heat_color, 0.35, 0)
+        hotspots_overlay_path = save_image(overlay, hotspots_overlay_path, writer)
 
-    return {"hotspots_heat_path": hotspots_heat_path, "hotspots_overlay_path": hotspots_overlay_path}
\ No newline at end of file
+    return {
+        "hotspots_heat_path": hotspots_heat_path,
+        "hotspots_overlay_path": hotspots_overlay_path,
+        "heat": heat,
+        "hotspots_heat_png": ctx.heat_png,
+    }
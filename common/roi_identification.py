@@ -1,6 +1,12 @@
 # ---------- Imports ----------
 import os, json, requests
 from .utils import compose_filename
+from .response_cache import hash_inputs
+from .boxes import proposals_to_array, nms
+from .image_context import as_image_context
+from .upload import prepare_upload, upload_scale, report_upload
+from .http_clients import get_vision_session, get_rate_limiter, call_with_retry
+from . import telemetry
 
 
 #region helper functions
@@ -33,23 +39,50 @@ def get_payload_filename(image_path: str) -> str:
     return f"artifacts/{prefix}-ROI.json"
 
 # Parse REST JSON to the same payload schema used by the SDK path
-def to_bbox_dict(bb):
-    return {"x": int(bb["x"]), "y": int(bb["y"]), "w": int(bb["w"]), "h": int(bb["h"])}
+def to_bbox_dict(bb, scale: tuple = (1.0, 1.0)):
+    """scale = (sx, sy) maps the pixels of a downscaled upload back to the original image"""
+    sx, sy = scale
+    return {"x": round(bb["x"] * sx), "y": round(bb["y"] * sy), "w": round(bb["w"] * sx), "h": round(bb["h"] * sy)}
+
+def nms_proposals(proposals: list, iou_threshold: float = 0.6, source_thresholds: dict = None) -> list:
+    """
+    Deduplicate proposals with vectorized greedy NMS.
+    Dense captions are visited first, then by decreasing confidence; a proposal is
+    dropped when its IoU with an already kept one reaches the threshold of its
+    source (source_thresholds[source], default iou_threshold).
+    """
+    if not proposals:
+        return []
+    source_thresholds = source_thresholds or {}
+    order = sorted(range(len(proposals)), key=lambda i: (proposals[i]["source"] != "dense_captions", -proposals[i]["confidence"]))
+    thresholds = [source_thresholds.get(p["source"], iou_threshold) for p in proposals]
+    keep = nms(proposals_to_array(proposals), thresholds, order=order)
+    return [proposals[i] for i in keep]
 
 #endregion
 
 def roi_identification(
-        image_path: str,
+        image_path,
         VISION_ENDPOINT: str, 
         VISION_KEY: str,
         features: str = "Caption,Objects,Tags,DenseCaptions",
         api_version: str="2023-10-01",
         save_payload: bool = True,
         keep_confidence: float = 0.6,
-        limit_proposals: int = 12
+        limit_proposals: int = 12,
+        cache=None,
+        source_thresholds: dict = None,
+        upload: dict = None
         ) -> dict:
     """
     Identify ROIs in an image using Azure Computer Vision REST API.
+    image_path is a path or an ImageContext (its raw bytes are uploaded as-is).
+    Proposals are always deduplicated with NMS (IoU threshold keep_confidence,
+    or source_thresholds[source]); limit_proposals > 0 then keeps the top ones.
+    If a ResponseCache is given, the raw REST response is reused when the
+    image bytes and request URL (endpoint, api_version, features) are unchanged.
+    upload = {"max_side", "format", "quality"} downscales / re-encodes the image
+    before the POST (see common/upload.py); returned boxes are in original pixels.
     """
         
     endpoint = with_trailing_slash(VISION_ENDPOINT)
@@ -58,12 +91,28 @@ def roi_identification(
         "Ocp-Apim-Subscription-Key": VISION_KEY,
         "Content-Type": "application/octet-stream"
     }
-    with open(image_path, "rb") as f:
-        resp = requests.post(url, headers=headers, data=f.read(), timeout=60)
-    
-    resp.raise_for_status()
-    data = resp.json()
-
+    ctx = as_image_context(image_path)
+    image_path = ctx.path
+    image_bytes = ctx.raw
+
+    cache_key = hash_inputs(url, image_bytes, *([upload] if upload else []))
+    data = cache.get("vision", cache_key) if cache is not None else None
+    cache_hit = data is not None
+    if data is None:
+        prepared = prepare_upload(ctx, upload)
+        report_upload(ctx, "vision", prepared)
+        session = get_vision_session(endpoint) # pooled keep-alive connections
+        resp = call_with_retry(
+            lambda: session.post(url, headers=headers, data=prepared["data"], timeout=60),
+            limiter=get_rate_limiter("vision", endpoint),
+        )
+        telemetry.annotate(request_bytes=len(prepared["data"]), response_bytes=len(resp.content))
+        resp.raise_for_status()
+        data = resp.json()
+        if cache is not None:
+            cache.put("vision", cache_key, data)
+
+    scale = upload_scale(*ctx.size, upload) if upload else (1.0, 1.0)
     payload = {"context": {}, "proposals": [], "global_tags": []}
 
     # Caption
@@ -79,7 +128,7 @@ def roi_identification(
             "source": "dense_captions",
             "text": v.get("text", ""),
             "confidence": float(v.get("confidence", 0.0)),
-            "bbox": to_bbox_dict(bb)
+            "bbox": to_bbox_dict(bb, scale)
         })
 
     # Objects
@@ -91,7 +140,7 @@ def roi_identification(
             "source": "objects",
             "text": name,
             "confidence": float(o.get("confidence", 0.0)),
-            "bbox": to_bbox_dict(bb)
+            "bbox": to_bbox_dict(bb, scale)
         })
 
     # Tags
@@ -103,16 +152,9 @@ def roi_identification(
         })
 
 
-    proposals_sorted = sorted(payload["proposals"], key=lambda p: (p["source"] != "dense_captions", -p["confidence"]))
-    selected = []
-    for p in proposals_sorted:
-        if not selected:
-            selected.append(p); continue
-        if max(iou(p["bbox"], s["bbox"]) for s in selected) < keep_confidence:
-            selected.append(p)
-
-    if limit_proposals > 0:
-        payload["proposals"] = selected[:limit_proposals]
+    selected = nms_proposals(payload["proposals"], iou_threshold=keep_confidence, source_thresholds=source_thresholds)
+    payload["proposals"] = selected[:limit_proposals] if limit_proposals > 0 else selected
+    telemetry.annotate(cache_hit=cache_hit, proposals=len(payload["proposals"]))
 
     if save_payload:        
         with open(compose_filename(image_path, "01_ROI", "json"), "w", encoding="utf-8") as f:
@@ -0,0 +1,88 @@
+# Compact ROI_JSON encoding for the GenAI prompt.
+# The full roi_identification payload (every proposal text, global tags, image paths,
+# near full-frame boxes, float confidences) costs many input tokens for little signal.
+# encode_roi_prompt sends only what the ROI rules of the system message use:
+#   {"grid": 1000, "cols": ["x1", "y1", "x2", "y2", "conf", "label"],
+#    "roi": [[120, 85, 320, 175, 87, "logo on shirt"], ...]}
+#   - corners normalized to integers 0..grid (the model answers in [0..1] coordinates)
+#   - confidence in percent, label cut to label_chars at a word boundary
+#   - boxes above max_area_frac of the frame dropped (like roi_overlay), top_n by confidence
+#   - lowest-confidence rows dropped until the estimated tokens fit max_tokens
+#
+# Options (dict):
+#   {"top_n": 12, "max_area_frac": 0.85, "label_chars": 32, "grid": 1000, "max_tokens": 400}
+
+# Imports
+import re, json, math
+from .utils import options_from_env
+
+DEFAULT_ROI_PROMPT = {
+    "top_n": 12,            # rows sent at most
+    "max_area_frac": 0.85,  # larger boxes carry no location information
+    "label_chars": 32,      # label length cap
+    "grid": 1000,           # coordinate resolution
+    "max_tokens": 400,      # token budget of the ROI_JSON text
+}
+COLUMNS = ["x1", "y1", "x2", "y2", "conf", "label"]
+_TOKEN = re.compile(r"\d{1,3}|[A-Za-z]+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate BPE token count: words, 1-3 digit groups and punctuation marks count one each.
+    Close to (slightly above) the GPT-4o tokenizer on JSON; no tokenizer dependency.
+    """
+    return len(_TOKEN.findall(text))
+
+def short_label(text: str, max_chars: int) -> str:
+    text = " ".join(str(text).split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars + 1].rsplit(" ", 1)[0]
+    return cut if cut and len(cut) <= max_chars else text[:max_chars]
+
+def encode_roi_prompt(payload: dict, W: int, H: int, options: dict = None) -> tuple:
+    """
+    (ROI_JSON text, stats) of a roi_identification payload for an image of W x H pixels.
+    stats: {"proposals", "sent", "dropped_large", "dropped_budget", "tokens"}.
+    """
+    o = {**DEFAULT_ROI_PROMPT, **(options or {})}
+    proposals = payload.get("proposals", []) if payload else []
+    grid = o["grid"]
+    rows, large = [], 0
+    for p in proposals:
+        b = p["bbox"]
+        if b["w"] * b["h"] > o["max_area_frac"] * W * H:
+            large += 1
+            continue
+        x1, y1 = max(0, b["x"]) / W, max(0, b["y"]) / H
+        x2, y2 = min(W, b["x"] + b["w"]) / W, min(H, b["y"] + b["h"]) / H
+        rows.append((
+            float(p.get("confidence", 0.0)),
+            [math.floor(x1 * grid), math.floor(y1 * grid), math.ceil(x2 * grid), math.ceil(y2 * grid), # rounded outward: containment holds
+             round(float(p.get("confidence", 0.0)) * 100), short_label(p.get("text", ""), o["label_chars"])],
+        ))
+    rows.sort(key=lambda r: -r[0]) # stable: ties keep the proposal order
+    rows = [r for _, r in rows[:o["top_n"]]]
+
+    def encode(rows):
+        return json.dumps({"grid": grid, "cols": COLUMNS, "roi": rows}, separators=(",", ":"), ensure_ascii=False)
+
+    text = encode(rows)
+    kept = len(rows)
+    while kept and estimate_tokens(text) > o["max_tokens"]:
+        kept -= 1
+        text = encode(rows[:kept])
+    return text, {
+        "proposals": len(proposals),
+        "sent": kept,
+        "dropped_large": large,
+        "dropped_budget": len(rows) - kept,
+        "tokens": estimate_tokens(text),
+    }
+
+
+def roi_prompt_options_from_env() -> dict:
+    """DEFAULT_ROI_PROMPT overridden by ROI_PROMPT_<OPTION> (e.g. ROI_PROMPT_TOP_N, ROI_PROMPT_MAX_TOKENS)."""
+    options = options_from_env(DEFAULT_ROI_PROMPT, "ROI_PROMPT_")
+    return options
@@ -0,0 +1,172 @@
+# Per-stage instrumentation for the pipeline.
+# Each stage call (roi_identification, roi_overlay, roi_hotspots, genai_analysis,
+# draw_bboxes, ...) produces one record with:
+#   wall_s, cpu_s (CPU time of the stage thread), peak_rss_delta_bytes (growth of
+#   the process high-water mark), ok / error, and whatever the stage annotates:
+#   request_bytes, response_bytes, http_status, retries, proposals, cache_hit, ...
+# Records are appended to a JSONL trace file; close() prints a p50/p95 summary per
+# stage and optionally writes a Prometheus text-format snapshot.
+#
+# Stages annotate the record of the span that is running in their thread with
+# annotate() / count(); both are no-ops when no span is active.
+
+# Imports
+import os, sys, json, time, threading, contextvars
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+
+
+# region Helpers
+def peak_rss_bytes() -> int:
+    """High-water mark of the process resident set size, None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KB on Linux
+
+def annotate(**fields) -> None:
+    """Set fields on the record of the running stage."""
+    span = _current.get()
+    if span is not None:
+        span[1].update(fields)
+
+def count(field: str, n: int = 1) -> None:
+    """Add n to a counter field of the record of the running stage."""
+    span = _current.get()
+    if span is not None:
+        span[1][field] = span[1].get(field, 0) + n
+
+def substage(name: str):
+    """Nested stage on the tracer of the running stage (same image), or a no-op."""
+    span = _current.get()
+    if span is None:
+        return nullcontext()
+    tracer, record = span
+    return tracer.stage(name, image=record.get("image"))
+#endregion
+
+
+class Tracer:
+    def __init__(self, trace_path: str = "artifacts/trace.jsonl", prometheus_path: str = None):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.records = []
+        self._lock = threading.Lock()
+        self._file = None
+        if trace_path:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            self._file = open(trace_path, "a", encoding="utf-8")
+
+    @contextmanager
+    def stage(self, name: str, image: str = None, **fields):
+        record = {"stage": name, "image": image, "ts": time.time(), **fields}
+        token = _current.set((self, record))
+        rss0 = peak_rss_bytes()
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+            record["ok"] = True
+        except Exception as e:
+            record["ok"] = False
+            record["error"] = repr(e)
+            raise
+        finally:
+            record["wall_s"] = time.perf_counter() - wall0
+            record["cpu_s"] = time.thread_time() - cpu0
+            rss1 = peak_rss_bytes()
+            record["peak_rss_delta_bytes"] = None if rss0 is None else rss1 - rss0
+            _current.reset(token)
+            self._emit(record)
+
+    def wrap(self, name: str, func, image: str = None):
+        """func wrapped so that each call is recorded as stage name."""
+        def traced(*args, **kwargs):
+            with self.stage(name, image=image):
+                return func(*args, **kwargs)
+        return traced
+
+    def _emit(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, default=str) + "\n")
+                self._file.flush()
+
+    # ---------- Reports ----------
+    def summary(self) -> list:
+        """One row per stage: count, errors, wall/cpu p50/p95 (seconds), bytes, retries."""
+        with self._lock:
+            records = list(self.records)
+        rows = []
+        for name in dict.fromkeys(r["stage"] for r in records):
+            rs = [r for r in records if r["stage"] == name]
+            wall = np.array([r["wall_s"] for r in rs])
+            cpu = np.array([r["cpu_s"] for r in rs])
+            rows.append({
+                "stage": name,
+                "count": len(rs),
+                "errors": sum(not r["ok"] for r in rs),
+                "wall_p50": float(np.percentile(wall, 50)),
+                "wall_p95": float(np.percentile(wall, 95)),
+                "wall_sum": float(wall.sum()),
+                "cpu_p50": float(np.percentile(cpu, 50)),
+                "cpu_p95": float(np.percentile(cpu, 95)),
+                "request_bytes": sum(r.get("request_bytes", 0) for r in rs),
+                "response_bytes": sum(r.get("response_bytes", 0) for r in rs),
+                "retries": sum(r.get("retries", 0) for r in rs),
+            })
+        return rows
+
+    def print_summary(self):
+        rows = self.summary()
+        header = f"{'stage':<20}{'n':>6}{'err':>5}{'wall p50':>10}{'wall p95':>10}{'cpu p50':>10}{'cpu p95':>10}{'req MB':>9}{'resp MB':>9}{'retries':>9}"
+        print(header)
+        print("-" * len(header))
+        for r in rows:
+            print(f"{r['stage']:<20}{r['count']:>6}{r['errors']:>5}"
+                  f"{r['wall_p50']:>10.3f}{r['wall_p95']:>10.3f}{r['cpu_p50']:>10.3f}{r['cpu_p95']:>10.3f}"
+                  f"{r['request_bytes'] / 1e6:>9.2f}{r['response_bytes'] / 1e6:>9.2f}{r['retries']:>9}")
+
+    def prometheus_text(self) -> str:
+        rows = self.summary()
+        lines = ["# TYPE pipeline_stage_wall_seconds summary"]
+        for r in rows:
+            lbl = f'stage="{r["stage"]}"'
+            lines += [
+                f'pipeline_stage_wall_seconds{{{lbl},quantile="0.5"}} {r["wall_p50"]}',
+                f'pipeline_stage_wall_seconds{{{lbl},quantile="0.95"}} {r["wall_p95"]}',
+                f'pipeline_stage_wall_seconds_sum{{{lbl}}} {r["wall_sum"]}',
+                f'pipeline_stage_wall_seconds_count{{{lbl}}} {r["count"]}',
+            ]
+        for metric, key in (
+            ("pipeline_stage_errors_total", "errors"),
+            ("pipeline_stage_request_bytes_total", "request_bytes"),
+            ("pipeline_stage_response_bytes_total", "response_bytes"),
+            ("pipeline_stage_retries_total", "retries"),
+        ):
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{stage="{r["stage"]}"}} {r[key]}' for r in rows]
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """Print the summary, write the Prometheus snapshot and close the trace file."""
+        self.print_summary()
+        if self.prometheus_path:
+            with open(self.prometheus_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def traced(settings: dict, name: str, image: str, func):
+    """func recorded as stage name when settings carries a "tracer", func itself otherwise."""
+    tracer = settings.get("tracer")
+    return func if tracer is None else tracer.wrap(name, func, image=image)
@@ -0,0 +1,22 @@
+# Font and text-measurement caches shared by the overlay renderers
+# (roi_highlighting.roi_overlay, overlay_bboxes.draw_bboxes).
+# Loading a TrueType font and measuring a label are pure functions of their
+# inputs, so they are done once per process instead of once per box / image.
+
+# Imports
+from functools import lru_cache
+from PIL import ImageFont
+
+
+@lru_cache(maxsize=64)
+def get_font(name: str, size: int):
+    """TrueType font name at size, or PIL's default font if it is not installed."""
+    try:
+        return ImageFont.truetype(name, size=size)
+    except OSError:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=65536)
+def text_bbox(font, text: str) -> tuple:
+    """(left, top, right, bottom) of a single line, same as ImageDraw.textbbox((0, 0), text, font)."""
+    return font.getbbox(text)
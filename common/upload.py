@@ -0,0 +1,112 @@
+# Upload preparation for the remote services.
+# Downscales an image to a maximum side and re-encodes it (JPEG / WebP / PNG) before
+# it is POSTed to Vision or embedded in the Azure OpenAI request, and reports the
+# bytes saved. Vision boundingBox pixels are mapped back to the original image with
+# the scale returned here (see roi_identification).
+#
+# Options (dict, None = upload the original bytes unchanged):
+#   {"max_side": 2048, "format": "JPEG", "quality": 85}
+
+# Imports
+import os, cv2 # requires opencv-python
+import numpy as np
+from .image_context import ImageContext
+
+FORMATS = {
+    "JPEG": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "WEBP": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "PNG":  (".png", "image/png", None),
+}
+
+
+def resized_size(W: int, H: int, max_side: int = None) -> tuple:
+    """(w, h) after fitting (W, H) within max_side, never upscaling."""
+    if not max_side or max(W, H) <= max_side:
+        return W, H
+    f = max_side / float(max(W, H))
+    return max(1, round(W * f)), max(1, round(H * f))
+
+def upload_scale(W: int, H: int, options: dict = None) -> tuple:
+    """(sx, sy) factors mapping uploaded-image pixels back to original pixels."""
+    w, h = resized_size(W, H, (options or {}).get("max_side"))
+    return W / w, H / h
+
+def encode_image(bgr, options: dict) -> tuple:
+    """Resize a BGR(A) array per options and encode it. Returns (bytes, mime)."""
+    fmt = options.get("format", "JPEG").upper()
+    ext, mime, quality_flag = FORMATS[fmt]
+    H, W = bgr.shape[:2]
+    w, h = resized_size(W, H, options.get("max_side"))
+    if (w, h) != (W, H):
+        bgr = cv2.resize(bgr, (w, h), interpolation=cv2.INTER_AREA)
+    params = [quality_flag, int(options.get("quality", 85))] if quality_flag is not None else []
+    ok, buf = cv2.imencode(ext, bgr, params)
+    if not ok:
+        raise ValueError(f"Could not encode upload as {fmt}")
+    return buf.tobytes(), mime
+
+def prepare_upload(image, options: dict = None, original_bytes: bytes = None) -> dict:
+    """
+    Prepare one upload.
+    image          : ImageContext (raw bytes + decoded pixels) or a BGR array
+    options        : see module header; None uploads original_bytes / ctx.raw unchanged
+    original_bytes : encoded bytes of a BGR array input, used for the passthrough and the stats
+    Returns {"data", "mime", "scale": (sx, sy), "original_bytes", "upload_bytes", "bytes_saved"}.
+    """
+    if isinstance(image, ImageContext):
+        original_bytes = image.raw
+    if not options:
+        return {
+            "data": original_bytes,
+            "mime": "image/png",
+            "scale": (1.0, 1.0),
+            "original_bytes": len(original_bytes),
+            "upload_bytes": len(original_bytes),
+            "bytes_saved": 0,
+        }
+    if isinstance(image, ImageContext):
+        key = tuple(sorted(options.items()))
+        if key in image.prepared:
+            return image.prepared[key]
+        W, H = image.size
+        bgr = cv2.cvtColor(image.pixels, cv2.COLOR_RGBA2BGR)
+    else:
+        H, W = image.shape[:2]
+        bgr = image
+    data, mime = encode_image(bgr, options)
+    n_original = len(original_bytes) if original_bytes is not None else bgr.nbytes
+    prepared = {
+        "data": data,
+        "mime": mime,
+        "scale": upload_scale(W, H, options),
+        "original_bytes": n_original,
+        "upload_bytes": len(data),
+        "bytes_saved": n_original - len(data),
+    }
+    if isinstance(image, ImageContext):
+        image.prepared[key] = prepared
+    return prepared
+
+def report_upload(ctx: ImageContext, target: str, prepared: dict) -> None:
+    """Record and print the bytes saved by one upload."""
+    stats = {k: prepared[k] for k in ("original_bytes", "upload_bytes", "bytes_saved")}
+    ctx.uploads.append({"target": target, **stats})
+    if prepared["bytes_saved"]:
+        print(f"Upload {target} for {os.path.basename(ctx.path)}: "
+              f"{stats['original_bytes'] / 1024:.0f} KB -> {stats['upload_bytes'] / 1024:.0f} KB "
+              f"(saved {stats['bytes_saved'] / 1024:.0f} KB)")
+
+def upload_options_from_env(prefix: str, defaults: dict = None) -> dict:
+    """
+    Read <prefix>_MAX_SIDE, <prefix>_FORMAT and <prefix>_QUALITY
+    (e.g. UPLOAD_MAX_SIDE=2048, UPLOAD_FORMAT=JPEG, UPLOAD_QUALITY=85).
+    Returns None when none of them (nor defaults) is set.
+    """
+    options = dict(defaults or {})
+    if os.getenv(f"{prefix}_MAX_SIDE"):
+        options["max_side"] = int(os.getenv(f"{prefix}_MAX_SIDE"))
+    if os.getenv(f"{prefix}_FORMAT"):
+        options["format"] = os.getenv(f"{prefix}_FORMAT").upper()
+    if os.getenv(f"{prefix}_QUALITY"):
+        options["quality"] = int(os.getenv(f"{prefix}_QUALITY"))
+    return options or None
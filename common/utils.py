@@ -13,6 +13,25 @@ def compose_filename(image_path: str, postfix: str, extension: str="png") -> str
     return f"artifacts/{base_name}_{postfix}.{extension}"
 
 
+def options_from_env(defaults: dict, prefix: str) -> dict:
+    """
+    defaults overridden by the environment variables <prefix><NAME> (e.g. PRESCREEN_MIN_SCORE),
+    each value converted to the type of its default; lists are comma-separated.
+    """
+    options = dict(defaults)
+    for name, default in defaults.items():
+        value = os.getenv(f"{prefix}{name.upper()}")
+        if not value:
+            continue
+        if isinstance(default, bool):
+            options[name] = value.lower() in ("1", "true", "yes", "on")
+        elif isinstance(default, list):
+            options[name] = [s.strip() for s in value.split(",")]
+        else:
+            options[name] = type(default)(value)
+    return options
+
+
 def copy_file(source_file: str, target_file: str) -> None:
     """
     Copies a file from source_file to target_file.
@@ -0,0 +1,338 @@
+# Streaming ingestion of a watched folder (python main.py --watch).
+# Instead of one os.listdir snapshot, new images are picked up as they arrive:
+#   - inotify (Linux, through ctypes): a file is ready when its writer closes it
+#     (IN_CLOSE_WRITE) or when it is renamed into the folder (IN_MOVED_TO)
+#   - polling fallback (other systems, network shares): a file is ready when its
+#     size and mtime have not changed for settle_s seconds
+# Files present at startup go through the polling check. Hidden and temporary names
+# (.x, x.part, x.tmp, x.crdownload, x~) and non-image extensions are ignored.
+#
+# Ready files go into a bounded queue consumed by the image workers (process_image,
+# with the usual per-service limits). Admission adapts to throttling: every 429 seen
+# by call_with_retry halves the number of images admitted at once (down to 1), every
+# image completed without a new 429 gives one slot back. When the workers slow down
+# the queue fills up and the watcher stops feeding it.
+#
+# A checkpoint (JSONL: path, size, mtime_ns) records the images processed successfully,
+# so a restart skips them; a modified file (new size or mtime) is processed again.
+#
+# Environment (see watch_options_from_env):
+#   WATCH_MODE       : auto (default: inotify when available) | inotify | poll
+#   WATCH_POLL_S     : polling period, seconds (default 1)
+#   WATCH_SETTLE_S   : unchanged time before a polled file is ready, seconds (default 1)
+#   WATCH_QUEUE      : queued + in-flight images (default 2 x the sum of the in-flight limits)
+#   WATCH_CHECKPOINT : checkpoint file (default artifacts/watch_checkpoint.jsonl)
+
+# Imports
+import os, sys, json, time, struct, asyncio, ctypes, ctypes.util
+from collections import deque
+import numpy as np
+from .http_clients import throttle_events
+from .utils import options_from_env
+
+WATCH_MODES = ("auto", "inotify", "poll")
+DEFAULT_WATCH = {
+    "mode": "auto",
+    "poll_s": 1.0,
+    "settle_s": 1.0,
+    "queue": 0, # 0 = 2 x the sum of the in-flight limits
+    "checkpoint": "artifacts/watch_checkpoint.jsonl",
+}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+TEMP_SUFFIXES = (".part", ".tmp", ".crdownload", "~")
+LATENCY_WINDOW = 1024 # latencies kept for the percentiles (most recent images)
+
+# inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+def is_candidate(name: str) -> bool:
+    return (not name.startswith(".") and not name.endswith(TEMP_SUFFIXES)
+            and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+
+
+# region Checkpoint
+class Checkpoint:
+    """Append-only record of the images processed successfully, keyed by path, size and mtime."""
+    def __init__(self, path: str):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue # truncated last line of an interrupted run
+                    self.done[item["path"]] = (item["size"], item["mtime_ns"])
+
+    @staticmethod
+    def signature(st: os.stat_result) -> tuple:
+        return st.st_size, st.st_mtime_ns
+
+    def is_done(self, path: str, st: os.stat_result) -> bool:
+        return self.done.get(path) == self.signature(st)
+
+    def record(self, path: str, st: os.stat_result) -> None:
+        self.done[path] = self.signature(st)
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "ts": time.time()}) + "\n")
+#endregion
+
+
+# region Watcher
+class Inotify:
+    """Minimal inotify binding (ctypes) for one directory; None from open() when unavailable."""
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    @classmethod
+    def open(cls, folder: str):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+                os.close(fd)
+                return None
+        except (OSError, AttributeError):
+            return None
+        return cls(fd)
+
+    def read(self) -> tuple:
+        """(names of the files closed after writing or moved in, overflowed) since the last read."""
+        names, overflow = [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names, overflow
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].split(b"\0", 1)[0]
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                names.append(os.fsdecode(name))
+        return names, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Hands out (in .ready) the images of folder that are ready to process, once per (path, size, mtime)."""
+    def __init__(self, folder: str, checkpoint: Checkpoint, options: dict = None):
+        self.folder = folder
+        self.checkpoint = checkpoint
+        self.options = {**DEFAULT_WATCH, **(options or {})}
+        self.ready = deque()           # (path, detected at)
+        self.available = asyncio.Event()
+        self._settling = {}            # path -> (signature, first seen with it)
+        self._queued = {}              # path -> signature handed out (a failed file is retried once it changes)
+        self._inotify = None
+        if self.options["mode"] != "poll":
+            self._inotify = Inotify.open(folder)
+            if self._inotify is None and self.options["mode"] == "inotify":
+                raise OSError(f"inotify is not available for {folder}")
+        self.mode = "inotify" if self._inotify is not None else "poll"
+
+    def _offer(self, path: str, st: os.stat_result) -> None:
+        sig = Checkpoint.signature(st)
+        if self._queued.get(path) == sig or self.checkpoint.is_done(path, st):
+            return
+        self._queued[path] = sig
+        self._settling.pop(path, None)
+        self.ready.append((path, time.monotonic()))
+        self.available.set()
+
+    def _stat(self, path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None # deleted meanwhile
+        return st if os.path.isfile(path) and st.st_size > 0 else None
+
+    def scan(self) -> None:
+        """Polling check: list the folder and hand out the files unchanged for settle_s."""
+        now = time.monotonic()
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return
+        for name in names:
+            if not is_candidate(name):
+                continue
+            path = os.path.join(self.folder, name)
+            st = self._stat(path)
+            if st is None or self._queued.get(path) == Checkpoint.signature(st) or self.checkpoint.is_done(path, st):
+                continue
+            sig, since = self._settling.get(path, (None, now))
+            if sig != Checkpoint.signature(st):
+                self._settling[path] = (Checkpoint.signature(st), now)
+            elif now - since >= self.options["settle_s"]:
+                self._offer(path, st)
+
+    def _on_inotify(self) -> None:
+        names, overflow = self._inotify.read()
+        if overflow:
+            self.scan() # events were lost: fall back to a full listing
+        for name in names:
+            if is_candidate(name):
+                st = self._stat(os.path.join(self.folder, name))
+                if st is not None:
+                    self._offer(os.path.join(self.folder, name), st)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Watch until stop is set. With inotify the periodic scan only settles the files present at startup."""
+        loop = asyncio.get_running_loop()
+        if self._inotify is not None:
+            loop.add_reader(self._inotify.fd, self._on_inotify)
+        try:
+            self.scan()
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), self.options["poll_s"])
+                except asyncio.TimeoutError:
+                    pass
+                if self._inotify is None:
+                    self.scan()
+                elif self._settling:
+                    self._settle()
+        finally:
+            if self._inotify is not None:
+                loop.remove_reader(self._inotify.fd)
+                self._inotify.close()
+
+    def _settle(self) -> None:
+        """inotify mode: re-check only the files found at startup that were still changing."""
+        now = time.monotonic()
+        for path, (sig, since) in list(self._settling.items()):
+            st = self._stat(path)
+            if st is None:
+                self._settling.pop(path)
+            elif Checkpoint.signature(st) != sig:
+                self._settling[path] = (Checkpoint.signature(st), now)
+            elif now - since >= self.options["settle_s"]:
+                self._offer(path, st)
+#endregion
+
+
+# region Admission
+class Admission:
+    """
+    Number of images processed at once, between 1 and limit: halved when a 429 was
+    seen since the last adjustment, one slot back per image completed without one.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.allowed = limit
+        self.active = 0
+        self._throttled = throttle_events()
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.active < self.allowed)
+            self.active += 1
+
+    async def release(self) -> None:
+        async with self._changed:
+            self.active -= 1
+            seen = throttle_events()
+            if seen > self._throttled:
+                self.allowed = max(1, self.allowed // 2)
+                print(f"Throttled by the remote services: admitting {self.allowed} images at once.")
+            elif self.allowed < self.limit:
+                self.allowed += 1
+            self._throttled = seen
+            self._changed.notify_all()
+#endregion
+
+
+async def watch_folder(folder: str, settings: dict, limits: dict = None, options: dict = None, stop: asyncio.Event = None) -> dict:
+    """
+    Process the images of folder as they arrive, until stop is set; images queued or
+    in flight are finished first. Returns {"processed", "failed", "latency_s": deque},
+    latency_s measured from the file mtime to the end of its processing, for the
+    last LATENCY_WINDOW images.
+    """
+    from .pipeline import StageLimiter, process_image
+
+    options = {**DEFAULT_WATCH, **(options or {})}
+    stop = stop or asyncio.Event()
+    limiter = StageLimiter(limits)
+    size = options["queue"] or 2 * sum(limiter.limits.values())
+    checkpoint = Checkpoint(options["checkpoint"])
+    watcher = FolderWatcher(folder, checkpoint, options)
+    queue = asyncio.Queue(maxsize=size)
+    admission = Admission(size)
+    stats = {"processed": 0, "failed": 0, "latency_s": deque(maxlen=LATENCY_WINDOW)}
+    print(f"Watching {folder} ({watcher.mode}, up to {size} images queued or in flight)...")
+
+    async def feed():
+        while not stop.is_set():
+            while watcher.ready:
+                await queue.put(watcher.ready.popleft()) # blocks while the workers are behind
+            watcher.available.clear()
+            if not watcher.ready:
+                await watcher.available.wait()
+
+    async def work():
+        while True:
+            await admission.acquire() # first: while throttled, images stay in the bounded queue and feed() blocks
+            path, detected = await queue.get()
+            try:
+                st = os.stat(path)
+                result = await process_image(path, settings, limiter, wait_artifacts=True) # the artifacts exist before the checkpoint says so
+                checkpoint.record(path, st)
+                latency = time.time() - st.st_mtime
+                stats["processed"] += 1
+                stats["latency_s"].append(latency)
+                skipped = f", up to date: {', '.join(result['skipped'])}" if result["skipped"] else ""
+                print(f"Image {os.path.basename(path)} done {latency:.1f} s after it was written "
+                      f"({time.monotonic() - detected:.1f} s after it was ready){skipped}.")
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Image {os.path.basename(path)} failed: {e!r}")
+            finally:
+                await admission.release()
+                queue.task_done()
+
+    tasks = [asyncio.create_task(watcher.run(stop)), asyncio.create_task(feed())]
+    workers = [asyncio.create_task(work()) for _ in range(size)]
+    try:
+        await stop.wait()
+        tasks[1].cancel()
+        await queue.join() # finish what is queued and in flight
+    finally:
+        for task in tasks + workers:
+            task.cancel()
+        await asyncio.gather(*tasks, *workers, return_exceptions=True)
+        limiter.close()
+
+    if stats["latency_s"]:
+        p50, p95 = np.percentile(stats["latency_s"], [50, 95])
+        print(f"{stats['processed']} images processed, {stats['failed']} failed; "
+              f"latency p50 {p50:.1f} s, p95 {p95:.1f} s (last {len(stats['latency_s'])} images).")
+    return stats
+
+
+def watch_options_from_env() -> dict:
+    """DEFAULT_WATCH overridden by WATCH_<OPTION> (WATCH_MODE, WATCH_POLL_S, WATCH_SETTLE_S, WATCH_QUEUE, WATCH_CHECKPOINT)."""
+    options = options_from_env(DEFAULT_WATCH, "WATCH_")
+    if options["mode"] not in WATCH_MODES:
+        raise ValueError(f"Unknown WATCH_MODE <{options['mode']}>, expected one of {WATCH_MODES}")
+    return options
@@ -0,0 +1,244 @@
+# Long-running local worker.
+# Loads the pipeline once (cv2, numpy, openai, pooled Vision / Azure OpenAI clients,
+# prompts, schema, fonts, response cache) and accepts jobs over HTTP, on a TCP port
+# or a Unix socket, so a single image costs no interpreter startup.
+#
+#   POST /jobs    {"image_path": "...", "stages": ["roi", "genai"]}
+#                 {"image_base64": "...", "filename": "x.png", "stages": [...]}
+#                 -> {"ok", "image_path", "stages", "skipped", "prescreen", "near_duplicate", "artifacts", "roi_payload", "genai_payload", "elapsed_s"}
+#   GET  /health  -> {"ok": true, "jobs_in_flight": n}
+#   GET  /stats   -> per-stage telemetry summary and response cache stats
+#
+# stages is a subset of original, roi, overlay, hotspots, genai (default: all);
+# the stages they depend on run too, and up-to-date stages are skipped (see common/manifest.py).
+# Jobs run on the pipeline worker pool, with the same per-service in-flight limits as main.py.
+#
+# Usage:
+#   python daemon.py --port 8765                     # http://127.0.0.1:8765/jobs
+#   python daemon.py --socket /tmp/cv_pipeline.sock
+#   python daemon.py --socket /tmp/cv_pipeline.sock --submit "images/1. ARTWORK COLLISION/G6YK54W3653-MCDM.png"
+
+# Imports
+import os, json, time, base64, hashlib, socket, asyncio, argparse, threading, http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+INBOX_DIR = "artifacts/inbox" # images submitted as bytes are stored here
+
+
+# region Server
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)  # stale socket of a previous run
+        super().server_bind()
+
+
+class Worker:
+    """Warm pipeline: settings, clients and the worker pool live as long as the process."""
+    def __init__(self, settings: dict, limits: dict = None):
+        from common.pipeline import StageLimiter
+
+        self.settings = settings
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True, name="pipeline-loop").start()
+        self.limiter = StageLimiter(limits)
+        self.jobs = threading.BoundedSemaphore(2 * sum(self.limiter.limits.values())) # images held in memory
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Import and build everything a first job would otherwise pay for."""
+        from common.http_clients import get_vision_session, get_openai_client
+        from common.image_genai import load_prompts
+        from common.text_render import get_font
+        from common import roi_identification, roi_highlighting, roi_hotspots, image_genai # noqa: F401
+
+        s = self.settings
+        if s.get("VISION_ENDPOINT"):
+            get_vision_session(roi_identification.with_trailing_slash(s["VISION_ENDPOINT"]))
+        if s.get("AZURE_OPENAI_ENDPOINT"):
+            get_openai_client(s["AZURE_OPENAI_ENDPOINT"], s["AZURE_OPENAI_API_KEY"], s["AZURE_OPENAI_API_VERSION"])
+        load_prompts()
+        get_font("arial.ttf", 16)
+
+    def process(self, image_path: str, stages=None) -> dict:
+        from common.pipeline import process_image, read_json, resolve_stages, STAGES
+
+        with self.jobs:
+            with self._lock:
+                self.in_flight += 1
+            try:
+                t0 = time.perf_counter()
+                result = asyncio.run_coroutine_threadsafe(
+                    process_image(image_path, self.settings, self.limiter, stages=stages, wait_artifacts=True), self.loop
+                ).result() # returned artifacts exist on disk
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        genai_json = result["artifacts"].get("genai_json_path")
+        return {
+            "ok": True,
+            "image_path": image_path,
+            "stages": [s for s in STAGES if s in resolve_stages(stages)],
+            "skipped": result["skipped"],
+            "prescreen": result["prescreen"],
+            "near_duplicate": result["near_duplicate"],
+            "artifacts": {name: os.path.abspath(p) for name, p in result["artifacts"].items()},
+            "roi_payload": result["roi_payload"],
+            "genai_payload": read_json(genai_json) if genai_json else None,
+            "elapsed_s": time.perf_counter() - t0,
+        }
+
+    def stats(self) -> dict:
+        tracer, cache = self.settings.get("tracer"), self.settings.get("cache")
+        return {
+            "stages": tracer.summary() if tracer is not None else [],
+            "cache": cache.stats() if cache is not None else None,
+        }
+
+    def close(self):
+        if self.settings.get("writer") is not None:
+            self.settings["writer"].close()
+        if self.settings.get("process_pool") is not None:
+            self.settings["process_pool"].close()
+        self.limiter.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.settings.get("tracer") is not None:
+            self.settings["tracer"].close()
+
+
+def job_image_path(job: dict) -> str:
+    """
+    Path of the job image; images sent as base64 bytes are written to INBOX_DIR first,
+    as <content digest>_<filename> so that concurrent jobs with the same filename
+    neither overwrite each other's image nor share artifacts.
+    """
+    if job.get("image_path"):
+        if not os.path.isfile(job["image_path"]):
+            raise ValueError(f"Image not found: {job['image_path']}")
+        return job["image_path"]
+    if job.get("image_base64"):
+        filename = os.path.basename(job.get("filename") or "")
+        if not filename:
+            raise ValueError("filename is required with image_base64")
+        data = base64.b64decode(job["image_base64"])
+        os.makedirs(INBOX_DIR, exist_ok=True)
+        path = os.path.join(INBOX_DIR, f"{hashlib.sha256(data).hexdigest()[:16]}_{filename}")
+        part = f"{path}.{threading.get_ident()}.part"
+        with open(part, "wb") as f:
+            f.write(data)
+        os.replace(part, path) # atomic: a job decoding the same image never sees a partial file
+        return path
+    raise ValueError("Either image_path or image_base64 is required")
+
+
+def make_handler(worker: Worker):
+    from common.pipeline import resolve_stages
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def address_string(self):
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            print(f"[daemon] {self.address_string()} {format % args}")
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                return self._reply(200, {"ok": True, "jobs_in_flight": worker.in_flight})
+            if self.path == "/stats":
+                return self._reply(200, worker.stats())
+            self._reply(404, {"ok": False, "error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                return self._reply(404, {"ok": False, "error": f"Unknown path {self.path}"})
+            try:
+                job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                image_path = job_image_path(job)
+                stages = job.get("stages")
+                resolve_stages(stages) # validate before queueing
+            except ValueError as e:
+                return self._reply(400, {"ok": False, "error": str(e)})
+            try:
+                self._reply(200, worker.process(image_path, stages))
+            except Exception as e:
+                self._reply(500, {"ok": False, "image_path": image_path, "error": repr(e)})
+
+    return Handler
+#endregion
+
+
+# region Client
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 600):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def submit_job(image_path: str, stages: list = None, socket_path: str = None, host: str = "127.0.0.1", port: int = 8765) -> dict:
+    """Send one image path to a running daemon and return its answer."""
+    conn = UnixHTTPConnection(socket_path) if socket_path else http.client.HTTPConnection(host, port, timeout=600)
+    body = json.dumps({"image_path": os.path.abspath(image_path), "stages": stages})
+    conn.request("POST", "/jobs", body=body, headers={"Content-Type": "application/json"})
+    answer = json.loads(conn.getresponse().read())
+    conn.close()
+    return answer
+#endregion
+
+
+# ---------- Main function ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline worker daemon.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None, help="Unix socket path (instead of host/port)")
+    parser.add_argument("--submit", default=None, help="send this image to a running daemon and print the answer")
+    parser.add_argument("--stages", nargs="+", default=None, help="with --submit: stages to run")
+    args = parser.parse_args(argv)
+
+    if args.submit:
+        print(json.dumps(submit_job(args.submit, args.stages, args.socket, args.host, args.port), indent=2))
+        return
+
+    from main import build_settings # loads the credentials
+    from common.pipeline import limits_from_env
+
+    worker = Worker(build_settings(), limits_from_env())
+    worker.warm_up()
+    if args.socket:
+        server = UnixHTTPServer(args.socket, make_handler(worker))
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(worker))
+        server.daemon_threads = True
+        where = f"http://{args.host}:{args.port}"
+    print(f"Pipeline daemon ready on {where} (in-flight limits {worker.limiter.limits}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        worker.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 import os
-import shutil
-from dotenv import load_dotenv
-
-from common.utils import compose_filename, copy_file # requires python-dotenv
+import sys
+import asyncio
+from dotenv import load_dotenv # requires python-dotenv
 
 
 if not load_dotenv("./../config/credentials_my.env"):
@@ -14,68 +13,115 @@ VISION_ENDPOINT = os.getenv('VISION_ENDPOINT')
 VISION_KEY = os.getenv('VISION_KEY')
 images_path = os.getenv('IMAGES_PATH', './images/1. ARTWORK COLLISION/')
 
-def main():
-    from common.roi_identification import roi_identification
-    from common.roi_highlighting import roi_overlay
-    from common.roi_hotspots import roi_hotspots
-    from common.image_genai import genai_analysis
+def build_settings() -> dict:
+    """Pipeline settings (endpoints, keys, cache, uploads, writer, tracer) from the environment."""
+    from common.response_cache import cache_from_env
+    from common.upload import upload_options_from_env
+    from common.artifact_writer import writer_from_env
+    from common.telemetry import Tracer
+    from common.prescreen import gate_from_env, check_engine
+    from common.roi_hotspots import default_engine
+    from common.crops import crop_options_from_env
+    from common.roi_prompt import roi_prompt_options_from_env
+    from common.process_pool import pool_from_env
+    from common.phash_index import near_dup_from_env
+    from common.heat_planes import plane_store_from_env
+
+    writer = writer_from_env() # ARTIFACT_FORMATS, ORIGINAL_MODE, ARTIFACT_WRITERS
+    prescreen = gate_from_env()
+    check_engine(prescreen, default_engine()) # no gate on pyramid heat
+    return {
+        "VISION_ENDPOINT": VISION_ENDPOINT,
+        "VISION_KEY": VISION_KEY,
+        "features": "Caption,Objects,Tags,DenseCaptions",
+        "limit_proposals": 0, # get all proposals
+        "AZURE_OPENAI_CHAT_MULTIMODEL_DEPLOYMENT_NAME": os.getenv("AZURE_OPENAI_CHAT_MULTIMODEL_DEPLOYMENT_NAME"),
+        "AZURE_OPENAI_ENDPOINT": os.getenv("AZURE_OPENAI_ENDPOINT"), # Azure OpenAI resource
+        "AZURE_OPENAI_API_KEY": os.getenv("AZURE_OPENAI_API_KEY"),
+        "AZURE_OPENAI_API_VERSION": os.getenv("AZURE_OPENAI_API_VERSION"), # at least 2024-02-15-preview
+        "cache": cache_from_env(), # RESPONSE_CACHE_MODE=use|refresh|off
+        "upload": upload_options_from_env("UPLOAD"), # e.g. UPLOAD_MAX_SIDE=2048 UPLOAD_FORMAT=JPEG UPLOAD_QUALITY=85
+        "heat_upload": upload_options_from_env("HEAT_UPLOAD"), # e.g. HEAT_UPLOAD_MAX_SIDE=768 HEAT_UPLOAD_QUALITY=60
+        "writer": writer,
+        "process_pool": pool_from_env(writer), # CPU_PROCESSES=auto|n: overlays and hotspots in worker processes
+        "prescreen": prescreen, # PRESCREEN=off|shadow|on, PRESCREEN_MIN_SCORE, ...
+        "genai_crops": crop_options_from_env(), # GENAI_MODE=crops, GENAI_CROP_TOP_K, GENAI_CROP_MAX_SIDE, ...
+        "roi_prompt": roi_prompt_options_from_env(), # ROI_PROMPT_TOP_N, ROI_PROMPT_MAX_TOKENS, ...
+        "heat_planes": plane_store_from_env(), # HOTSPOT_PLANES=1: store the hotspot feature planes, re-weight without recomputing
+        "near_dup": near_dup_from_env(), # NEAR_DUP=off|seed|reuse, NEAR_DUP_MAX_DISTANCE, NEAR_DUP_INDEX, ...
+        "incremental": os.getenv("INCREMENTAL", "1") != "0", # skip stages whose inputs are unchanged (artifacts/manifests)
+        "tracer": Tracer(
+            trace_path=os.getenv("TRACE_PATH", "artifacts/trace.jsonl"),
+            prometheus_path=os.getenv("PROMETHEUS_PATH"), # e.g. artifacts/metrics.prom
+        ),
+    }
 
-    payloads = []
+def main():
+    from common.pipeline import run_batch, limits_from_env
 
     images_to_process = [] # ["G6YH19W3643-G6O3.png", "G6YK36W3244-G7R6.png", "G6YK54W3653-MCDM.png", "J74Q10KAUG0-G6N3.png", "J74Q10KAUG0-G8CR.png", "J74Q10KAUG0-G011.png"] # [] # leave empty to process all images in the folder
     if not images_to_process:
         images_to_process = os.listdir(images_path)
 
-    # iterate over images in the images folder
-    for image_file_name in images_to_process:
-        if os.path.isfile(os.path.join(images_path, image_file_name)):
-            print(f"Duplicating source image {image_file_name}...")
-            image_source_path=os.path.join(images_path, image_file_name)
-            image_target_path=compose_filename(os.path.join(images_path, image_file_name), "00_original")
-            copy_file(
-                source_file=image_source_path,
-                target_file=image_target_path
-            )
-
-            print(f"Analyzing image {image_file_name}...")
-            roi_payload = roi_identification(
-                image_path=image_source_path,
-                VISION_ENDPOINT=VISION_ENDPOINT,
-                VISION_KEY=VISION_KEY,
-                features="Caption,Objects,Tags,DenseCaptions",
-                limit_proposals=0, # get all proposals
-            )            
-            payloads.append(roi_payload)
-
-            print(f"Overlaying ROI for image {image_file_name}...")
-            roi_overlay(
-                image_path=image_source_path,
-                payload=roi_payload,
-            )
-
-            print(f"Creating hotspots for image {image_file_name}...")
-            hotspots = roi_hotspots(
-                image_path=image_source_path,
-                create_edge_map=True,
-                create_local_variance_map=True,
-                create_high_freq_map=True,
-                save_hotspots_heat=True,
-                save_hotspots_overlay=True
-            )
-
-            print(f"Analyzing with GENAI hotspots for image {image_file_name}...")
-            hostspotted_image = genai_analysis(
-                deployment_name=os.getenv("AZURE_OPENAI_CHAT_MULTIMODEL_DEPLOYMENT_NAME"),
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"), # Azure OpenAI resource
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version=os.getenv("AZURE_OPENAI_API_VERSION"),# at least 2024-02-15-preview,
-                original_image_path=image_source_path, # "G6YH19W3643-G6O3.png", 
-                hotspots_image_path=hotspots["hotspots_heat_path"], # "G6YH19W3643-hotspots_heat.png"
-                roi_json_str=str(roi_payload).replace("'", '"'),
-                save_payload=True,
-            )
-
-    print(f"{len(payloads)} images processed.") 
+    image_paths = [
+        os.path.join(images_path, image_file_name)
+        for image_file_name in images_to_process
+        if os.path.isfile(os.path.join(images_path, image_file_name))
+    ]
+
+    settings = build_settings()
+
+    # in-flight limits per service (VISION_MAX_IN_FLIGHT, OPENAI_MAX_IN_FLIGHT, CPU_MAX_IN_FLIGHT)
+    limits = limits_from_env()
+    print(f"Processing {len(image_paths)} images with in-flight limits {limits}...")
+    results = asyncio.run(run_batch(image_paths, settings, limits))
+    settings["writer"].close() # flush the artifacts still being written
+    if settings["process_pool"] is not None:
+        settings["process_pool"].close()
+
+    failed = [r for r in results if not r["ok"]]
+    for r in failed:
+        print(f"FAILED {r['image_path']}: {r['error']}")
+
+    print(f"{len(results) - len(failed)} images processed, {len(failed)} failed.")
+    if settings["prescreen"]["mode"] != "off":
+        clean = [r for r in results if r["ok"] and r["prescreen"] and not r["prescreen"]["needs_llm"]]
+        print(f"Pre-screening ({settings['prescreen']['mode']}): {len(clean)} images without hot regions, see {settings['prescreen']['log_path']}.")
+    if settings["near_dup"] is not None:
+        near = [r for r in results if r["ok"] and r["near_duplicate"]]
+        print(f"Near-duplicates ({settings['near_dup']['mode']}): {len(near)} images reused earlier results, {len(settings['near_dup']['index'])} images indexed.")
+    print(f"Response cache: {settings['cache'].stats()}")
+    settings["tracer"].close() # per-stage p50/p95 summary
+
+def watch():
+    """Process the images of IMAGES_PATH as they arrive (common/watch.py), until Ctrl+C or SIGTERM."""
+    import signal
+    from common.pipeline import limits_from_env
+    from common.watch import watch_folder, watch_options_from_env
+
+    settings = build_settings()
+    limits = limits_from_env()
+
+    async def run():
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(sig, stop.set) # finish the images in flight, then stop
+            except (NotImplementedError, RuntimeError):
+                pass # Windows: Ctrl+C interrupts directly
+        await watch_folder(images_path, settings, limits, watch_options_from_env(), stop)
+
+    try:
+        asyncio.run(run())
+    finally:
+        settings["writer"].close()
+        if settings["process_pool"] is not None:
+            settings["process_pool"].close()
+        print(f"Response cache: {settings['cache'].stats()}")
+        settings["tracer"].close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--watch" in sys.argv[1:]: # streaming mode: python main.py --watch
+        watch()
+    else:
+        main()
@@ -1,25 +1,181 @@
 
-import json, os
+import json, os, re, sys, time, argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image, ImageDraw
 
 # Usage: python overlay_bboxes.py input.jpg artifacts/llm_triage.json output.png
+# Batch: python overlay_bboxes.py --batch artifacts/ [--images "images/1. ARTWORK COLLISION"] [--out-dir artifacts/overlays] [--workers 8]
+#        python overlay_bboxes.py --batch pairs.jsonl     # one {"image": ..., "json": ..., "output": ...} per line (output optional)
+#
+# The JSON schema is detected per file:
+#   suspects  : {"suspects": [{"bbox": [x, y, w, h], "defect_type", "severity", "confidence"}]}   pixels (notebook 02 triage)
+#   bboxes    : {"bboxes": [{"x_min", "y_min", "x_max", "y_max", "label", "confidence"}]}         normalized (genai_analysis)
+#   proposals : {"proposals": [{"bbox": {"x", "y", "w", "h"}, "text", "confidence"}]}         pixels (roi_identification)
+# In batch mode outputs newer than their image and JSON are skipped (--force renders them again);
+# JSON files of a folder that use none of these schemas (manifests, cache entries) are ignored.
 
-def draw_overlay(image_path, json_path, output_path):
-    img = Image.open(image_path).convert('RGB')
+SCHEMAS = ("suspects", "bboxes", "proposals")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+ARTIFACT_POSTFIX = re.compile(r"_\d{2}[A-Z]?(_|$)") # pipeline artifact names: X_00_original, X_04_genai_bboxes, ...
+
+
+def detect_schema(data) -> str:
+    """Which of SCHEMAS a triage / analysis JSON uses."""
+    if isinstance(data, dict):
+        for schema in SCHEMAS:
+            if isinstance(data.get(schema), list):
+                return schema
+    raise ValueError(f"Unknown bbox schema, expected a list under one of {SCHEMAS}")
+
+def draw_suspects(img, data):
     draw = ImageDraw.Draw(img)
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-    suspects = data.get('suspects', [])
-    for s in suspects:
+    for s in data.get('suspects', []):
         x,y,w,h = s['bbox']
         draw.rectangle([(x,y),(x+w,y+h)], outline=(255,0,0), width=3)
         note = f"{s['defect_type']} | {s.get('severity','')} | conf={s.get('confidence',0):.2f}"
         draw.text((x, max(0,y-18)), note, fill=(255,0,0))
-    img.save(output_path)
+    return img
+
+def draw_proposals(img, data):
+    draw = ImageDraw.Draw(img)
+    for p in data.get('proposals', []):
+        b = p['bbox']
+        x, y = b['x'], b['y']
+        draw.rectangle([(x,y),(x+b['w'],y+b['h'])], outline=(255,0,0), width=3)
+        note = f"{p.get('text') or p.get('source','')} | conf={p.get('confidence',0):.2f}"
+        draw.text((x, max(0,y-18)), note, fill=(255,0,0))
+    return img
+
+def render(image_path, json_path, output_path) -> str:
+    """Draw the boxes of json_path (any of SCHEMAS) over image_path; returns the schema."""
+    from common.overlay_bboxes import render_bboxes
+    from common.artifact_writer import encode_to_file, parse_format
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    schema = detect_schema(data)
+    img = Image.open(image_path).convert('RGB')
+    {"suspects": draw_suspects, "bboxes": render_bboxes, "proposals": draw_proposals}[schema](img, data)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    encode_to_file(img, output_path, parse_format(os.path.splitext(output_path)[1][1:] or "png")) # written atomically
+    return schema
+
+def draw_overlay(image_path, json_path, output_path):
+    render(image_path, json_path, output_path)
+
+
+# region Batch mode
+def find_image(json_path, images_dirs=()):
+    """
+    Image of a JSON, next to it or in images_dirs. Candidate names are the JSON name minus
+    its "_" postfixes, longest first (X_04_genai_bboxes -> X_04_genai, X_04, X): the pipeline
+    copy <base>_00_original.<ext> is preferred, other pipeline artifacts (X_04_...) are never used.
+    """
+    parts = os.path.splitext(os.path.basename(json_path))[0].split("_")
+    bases = ["_".join(parts[:i]) for i in range(len(parts), 0, -1)]
+    names = [f"{base}_00_original" for base in bases] + [base for base in bases if not ARTIFACT_POSTFIX.search(base)]
+    for folder in (os.path.dirname(json_path), *images_dirs):
+        for name in names:
+            for ext in IMAGE_EXTENSIONS:
+                path = os.path.join(folder, name + ext)
+                if os.path.isfile(path):
+                    return path
+    return None
+
+def discover_pairs(source, images_dirs=(), out_dir=None) -> list:
+    """(image, json, output) triples from a folder of JSON files or a JSONL manifest."""
+    pairs = []
+    if os.path.isfile(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in filter(str.strip, f):
+                item = json.loads(line)
+                output = item.get("output") or default_output(item["json"], out_dir)
+                pairs.append((item["image"], item["json"], output))
+        return pairs
+    for folder, _, files in os.walk(source):
+        for name in sorted(files):
+            if not name.endswith(".json"):
+                continue
+            json_path = os.path.join(folder, name)
+            image_path = find_image(json_path, images_dirs=images_dirs)
+            if image_path is not None and has_bboxes(json_path): # e.g. manifests (artifacts/manifests/X.json) match image X by name
+                pairs.append((image_path, json_path, default_output(json_path, out_dir)))
+    return pairs
+
+def has_bboxes(json_path) -> bool:
+    """True when json_path uses one of SCHEMAS."""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            detect_schema(json.load(f))
+        return True
+    except (OSError, ValueError): # includes json.JSONDecodeError
+        return False
+
+def default_output(json_path, out_dir=None):
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    return os.path.join(out_dir or os.path.dirname(json_path), f"{stem}_overlay.png")
+
+def up_to_date(image_path, json_path, output_path) -> bool:
+    try:
+        out = os.stat(output_path).st_mtime_ns
+        return out >= os.stat(image_path).st_mtime_ns and out >= os.stat(json_path).st_mtime_ns
+    except OSError:
+        return False
+
+def render_job(image_path, json_path, output_path):
+    t0 = time.perf_counter()
+    schema = render(image_path, json_path, output_path)
+    return schema, time.perf_counter() - t0
+
+def run_batch(pairs, workers=None, force=False) -> dict:
+    """Render pairs on a process pool, printing one progress line per pair."""
+    total = len(pairs)
+    counts = {"rendered": 0, "skipped": 0, "failed": 0}
+    done = 0
+    t0 = time.perf_counter()
+
+    def progress(status, output_path, detail=""):
+        nonlocal done
+        done += 1
+        counts[status] += 1
+        print(f"[{done:>{len(str(total))}}/{total}] {status:<8} {output_path}{detail}", flush=True)
+
+    todo = []
+    for pair in pairs:
+        if not force and up_to_date(*pair):
+            progress("skipped", pair[2])
+        else:
+            todo.append(pair)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(render_job, *pair): pair for pair in todo}
+        for future in as_completed(futures):
+            output_path = futures[future][2]
+            try:
+                schema, elapsed = future.result()
+                progress("rendered", output_path, f" ({schema}, {elapsed * 1000:.0f} ms)")
+            except Exception as e:
+                progress("failed", output_path, f": {e!r}")
+
+    elapsed = time.perf_counter() - t0
+    rate = counts["rendered"] / elapsed if elapsed else 0
+    print(f"{counts['rendered']} rendered, {counts['skipped']} up to date, {counts['failed']} failed in {elapsed:.1f} s ({rate:.1f} images/s).")
+    return counts
+#endregion
+
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv)<4:
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        parser = argparse.ArgumentParser(description="Render bbox overlays for many image / JSON pairs.")
+        parser.add_argument("--batch", required=True, help="folder of JSON files (searched recursively) or JSONL manifest")
+        parser.add_argument("--images", nargs="*", default=[], help="folders where to look for the images too")
+        parser.add_argument("--out-dir", default=None, help="output folder (default: next to each JSON)")
+        parser.add_argument("--workers", type=int, default=None, help="render processes (default: cores)")
+        parser.add_argument("--force", action="store_true", help="render outputs that are up to date too")
+        args = parser.parse_args()
+        counts = run_batch(discover_pairs(args.batch, args.images, args.out_dir), args.workers, args.force)
+        sys.exit(1 if counts["failed"] else 0)
+    elif len(sys.argv)<4:
         print('Usage: python overlay_bboxes.py <image> <json> <output>')
+        print('       python overlay_bboxes.py --batch <folder|pairs.jsonl> [--images <folder>] [--out-dir <folder>] [--workers N] [--force]')
     else:
         draw_overlay(sys.argv[1], sys.argv[2], sys.argv[3])
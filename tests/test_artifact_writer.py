@@ -0,0 +1,27 @@
+# Checks that an image waits for its own artifacts only.
+import os, threading
+import numpy as np
+from common.artifact_writer import ArtifactWriter
+
+
+def test_scope_waits_for_its_own_jobs_only(tmp_path):
+    writer = ArtifactWriter(max_workers=2)
+    release = threading.Event()
+    try:
+        blocked = writer._submit(release.wait) # another image's job, stuck
+        scope = writer.scope()
+        path = scope.write_image(str(tmp_path / "a_03A_hotspots_heat.png"), np.zeros((4, 4, 3), np.uint8))
+        assert scope.wait() == []
+        assert os.path.exists(path)
+        assert not blocked.done()
+    finally:
+        release.set()
+        writer.close()
+
+def test_scope_reports_its_errors(tmp_path):
+    writer = ArtifactWriter(max_workers=1)
+    scope = writer.scope()
+    scope.copy_original(str(tmp_path / "missing.png"), str(tmp_path / "out" / "x_00_original.png"))
+    errors = scope.wait()
+    writer.close()
+    assert len(errors) == 1 and isinstance(errors[0], OSError)
@@ -0,0 +1,76 @@
+# Checks of common/boxes.py against the pairwise loops it replaced.
+import numpy as np
+from common.boxes import iou_matrix, nms, proposals_to_array
+from common.roi_identification import nms_proposals
+
+
+def iou(a, b):
+    """Pairwise IoU of two x,y,w,h dicts, as in the original roi_identification."""
+    ax1, ay1, ax2, ay2 = a["x"], a["y"], a["x"]+a["w"], a["y"]+a["h"]
+    bx1, by1, bx2, by2 = b["x"], b["y"], b["x"]+b["w"], b["y"]+b["h"]
+    iw = max(0, min(ax2, bx2) - max(ax1, bx1))
+    ih = max(0, min(ay2, by2) - max(ay1, by1))
+    inter = iw * ih
+    union = a["w"]*a["h"] + b["w"]*b["h"] - inter
+    return 0.0 if union == 0 else inter / union
+
+def pairwise_selection(proposals, keep_confidence):
+    """The original double loop of roi_identification."""
+    proposals_sorted = sorted(proposals, key=lambda p: (p["source"] != "dense_captions", -p["confidence"]))
+    selected = []
+    for p in proposals_sorted:
+        if not selected:
+            selected.append(p); continue
+        if max(iou(p["bbox"], s["bbox"]) for s in selected) < keep_confidence:
+            selected.append(p)
+    return selected
+
+def random_proposals(rng, n):
+    # clustered boxes, so that many overlap; integer pixels with some duplicates and zero-area boxes
+    centers = rng.integers(0, 1000, size=(max(1, n // 8), 2))
+    proposals = []
+    for i in range(n):
+        cx, cy = centers[rng.integers(len(centers))] + rng.integers(-30, 30, size=2)
+        w, h = rng.integers(0, 200, size=2)
+        proposals.append({
+            "source": "dense_captions" if rng.random() < 0.5 else "objects",
+            "confidence": float(rng.choice([0.5, 0.7, 0.9, rng.random()])),
+            "bbox": {"x": int(cx), "y": int(cy), "w": int(w), "h": int(h)},
+        })
+    return proposals
+
+
+def test_iou_matrix_matches_pairwise():
+    rng = np.random.default_rng(0)
+    a, b = random_proposals(rng, 40), random_proposals(rng, 30)
+    expected = np.array([[iou(p["bbox"], q["bbox"]) for q in b] for p in a])
+    np.testing.assert_allclose(iou_matrix(proposals_to_array(a), proposals_to_array(b)), expected, atol=1e-12)
+
+def test_iou_matrix_broadcasts_over_images():
+    rng = np.random.default_rng(1)
+    a = rng.uniform(0, 100, size=(3, 5, 4)); a[..., 2:] += a[..., :2]
+    b = rng.uniform(0, 100, size=(3, 7, 4)); b[..., 2:] += b[..., :2]
+    stacked = iou_matrix(a, b)
+    assert stacked.shape == (3, 5, 7)
+    for k in range(3):
+        np.testing.assert_array_equal(stacked[k], iou_matrix(a[k], b[k]))
+
+def test_nms_proposals_keeps_the_pairwise_selection():
+    for seed, n in ((2, 1), (3, 50), (4, 700)): # 700 > one chunk of 256
+        proposals = random_proposals(np.random.default_rng(seed), n)
+        for threshold in (0.3, 0.6, 0.9):
+            expected = pairwise_selection(proposals, threshold)
+            kept = nms_proposals(proposals, threshold)
+            assert [id(p) for p in kept] == [id(p) for p in expected]
+
+def test_nms_chunk_size_does_not_change_the_result():
+    proposals = random_proposals(np.random.default_rng(5), 300)
+    boxes = proposals_to_array(proposals)
+    order = np.argsort([-p["confidence"] for p in proposals], kind="stable")
+    reference = nms(boxes, 0.5, order=order, chunk=len(boxes))
+    for chunk in (1, 7, 64):
+        np.testing.assert_array_equal(nms(boxes, 0.5, order=order, chunk=chunk), reference)
+
+def test_nms_per_box_thresholds():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 8], [0, 0, 10, 8]], float) # IoU 0.8 with the first
+    assert nms(boxes, [0.5, 0.9, 0.5]).tolist() == [0, 1]
@@ -0,0 +1,68 @@
+# Checks of the batched matching and AP of common/evaluation.py on hand-computed cases.
+import numpy as np
+from common.boxes import iou_matrix
+from common.evaluation import pad, match_greedy, average_precision
+
+
+def test_average_precision_hand_computed():
+    # ranks: TP (P 1, R 1/3), FP, TP (P 2/3, R 2/3), FP; the third label box is missed
+    # AP = 1/3 x 1 + 1/3 x 2/3 = 5/9
+    scores = np.array([0.6, 0.9, 0.7, 0.8])
+    tp = np.array([False, True, True, False])
+    assert np.isclose(average_precision(scores, tp, 3), 5 / 9)
+
+def test_average_precision_edge_cases():
+    assert np.isnan(average_precision(np.array([0.5]), np.array([True]), 0))
+    assert average_precision(np.zeros(0), np.zeros(0, bool), 2) == 0.0
+    assert average_precision(np.array([0.9, 0.8]), np.array([True, True]), 2) == 1.0
+
+def test_match_greedy_hand_computed():
+    gt = [np.array([[0, 0, 10, 10], [2, 0, 12, 10]], float)]
+    gt_labels = [np.array([0, 0])]
+    pred = [np.array([
+        [1, 0, 11, 10],    # best score: IoU 0.82 with both label boxes -> takes the first (argmax tie)
+        [2, 0, 12, 10],    # IoU 1 with the second label box, still free -> TP
+        [0, 0, 10, 10],    # both label boxes taken -> FP
+        [0, 0, 10, 10],    # other label -> FP
+    ], float)]
+    scores = [np.array([0.9, 0.8, 0.7, 0.95])]
+    pred_labels = [np.array([0, 0, 0, 1])]
+    # a second image without predictions, to exercise the padding
+    gt.append(np.array([[0, 0, 5, 5]], float)); gt_labels.append(np.array([0]))
+    pred.append(np.zeros((0, 4))); scores.append(np.zeros(0)); pred_labels.append(np.zeros(0, int))
+
+    P, pv = pad(pred); S, _ = pad(scores); PL, _ = pad(pred_labels, fill=-1, dtype=np.int64)
+    G, gv = pad(gt); GL, _ = pad(gt_labels, fill=-2, dtype=np.int64)
+    tp, matched = match_greedy(P, pv, S, PL, G, gv, GL, 0.5)
+    assert tp[0].tolist() == [True, True, False, False]
+    assert matched[0].tolist() == [True, True]
+    assert tp[1].tolist() == [False] * 4 and matched[1].tolist() == [False, False]
+
+def greedy_loop(pred, scores, pred_labels, gt, gt_labels, threshold):
+    """Per-image reference: visit predictions by decreasing score, take the free same-label box of highest IoU."""
+    iou = iou_matrix(pred, gt) if len(pred) and len(gt) else np.zeros((len(pred), len(gt)))
+    tp, taken = np.zeros(len(pred), bool), np.zeros(len(gt), bool)
+    for p in np.argsort(-scores, kind="stable"):
+        best, best_iou = None, -1.0
+        for g in range(len(gt)):
+            if not taken[g] and pred_labels[p] == gt_labels[g] and iou[p, g] > best_iou:
+                best, best_iou = g, iou[p, g]
+        if best is not None and best_iou >= threshold:
+            tp[p] = taken[best] = True
+    return tp
+
+def test_match_greedy_matches_the_per_image_loop():
+    rng = np.random.default_rng(0)
+    def boxes(n):
+        b = rng.uniform(0, 80, (n, 4)); b[:, 2:] = b[:, :2] + rng.uniform(5, 30, (n, 2))
+        return b
+    images = []
+    for _ in range(60):
+        n, m = rng.integers(0, 8), rng.integers(0, 6)
+        images.append((boxes(n), rng.random(n), rng.integers(0, 2, n), boxes(m), rng.integers(0, 2, m)))
+    P, pv = pad([i[0] for i in images]); S, _ = pad([i[1] for i in images])
+    PL, _ = pad([i[2] for i in images], fill=-1, dtype=np.int64)
+    G, gv = pad([i[3] for i in images]); GL, _ = pad([i[4] for i in images], fill=-2, dtype=np.int64)
+    tp, _ = match_greedy(P, pv, S, PL, G, gv, GL, 0.3)
+    for k, image in enumerate(images):
+        assert tp[k, :len(image[0])].tolist() == greedy_loop(*image, 0.3).tolist()
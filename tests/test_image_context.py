@@ -0,0 +1,17 @@
+# Checks that ImageContext reports the same geometry before and after decoding.
+import numpy as np
+from PIL import Image
+from common.image_context import ImageContext
+
+
+def test_exif_rotated_jpeg_keeps_the_stored_layout(tmp_path):
+    path = tmp_path / "rotated.jpg"
+    image = Image.fromarray(np.zeros((20, 40, 3), np.uint8))
+    exif = image.getexif()
+    exif[0x0112] = 6 # Orientation: rotate 90 CW on display
+    image.save(path, exif=exif)
+
+    ctx = ImageContext(str(path))
+    header_size = ctx.size
+    assert ctx.pixels.shape[:2] == (20, 40)
+    assert header_size == ctx.size == (40, 20)
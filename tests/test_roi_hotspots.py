@@ -0,0 +1,36 @@
+# Checks of the histogram percentiles used by the hotspot engine against np.percentile.
+import numpy as np
+import cv2
+from common.roi_hotspots import histogram_percentile, FEATURE_HIST, HotspotEngine
+
+
+def test_histogram_percentile_within_one_bin():
+    rng = np.random.default_rng(0)
+    for name, sample in (
+        ("edge", rng.gamma(2.0, 60.0, 200_000)),
+        ("var", rng.exponential(900.0, 200_000)),
+    ):
+        bins, upper, integer_valued = FEATURE_HIST[name]
+        sample = np.clip(sample, 0, upper * (1 - 1e-9)).astype(np.float32)
+        hist = cv2.calcHist([sample.reshape(1, -1)], [0], None, [bins], [0, upper]).ravel()
+        for q in (2, 50, 98):
+            assert abs(histogram_percentile(hist, upper, q, integer_valued) - np.percentile(sample, q)) <= upper / bins
+
+def test_histogram_percentile_exact_on_integer_maps():
+    bins, upper, integer_valued = FEATURE_HIST["hf"]
+    sample = np.random.default_rng(1).integers(0, 256, 50_001).astype(np.uint8)
+    hist = cv2.calcHist([sample.reshape(1, -1)], [0], None, [bins], [0, upper]).ravel()
+    for q in (0, 2, 37.5, 98, 100):
+        assert histogram_percentile(hist, upper, q, integer_valued) == np.percentile(sample, q)
+
+def test_histogram_percentile_empty_histogram():
+    assert histogram_percentile(np.zeros(16), 16.0, 98) == 0.0
+
+def test_tiles_match_a_single_tile():
+    gray = (np.random.default_rng(2).random((300, 420)) * 255).astype(np.uint8)
+    gray = cv2.GaussianBlur(gray, (0, 0), 1.5)
+    maps = ["edge", "var", "hf"]
+    for var_ksize, hf_sigma in ((9, 2.0), (21, 4.0)):
+        tiled = HotspotEngine(tile_size=64, var_ksize=var_ksize, hf_sigma=hf_sigma).compute(gray, maps)
+        whole = HotspotEngine(tile_size=1024, var_ksize=var_ksize, hf_sigma=hf_sigma).compute(gray, maps)
+        np.testing.assert_array_equal(tiled, whole)
@@ -0,0 +1,19 @@
+# Checks of the environment overrides shared by the *_from_env helpers.
+from common.utils import options_from_env
+
+DEFAULTS = {"top_k": 4, "pad": 0.15, "sources": ["hotspots", "roi"], "mode": "auto", "enabled": False}
+
+
+def test_options_from_env(monkeypatch):
+    monkeypatch.setenv("X_TOP_K", "7")
+    monkeypatch.setenv("X_PAD", "0.5")
+    monkeypatch.setenv("X_SOURCES", "roi, hotspots")
+    monkeypatch.setenv("X_ENABLED", "true")
+    monkeypatch.setenv("X_MODE", "") # empty = default
+    options = options_from_env(DEFAULTS, "X_")
+    assert options == {"top_k": 7, "pad": 0.5, "sources": ["roi", "hotspots"], "mode": "auto", "enabled": True}
+    assert DEFAULTS["top_k"] == 4 # defaults are not modified
+
+def test_bool_false_values(monkeypatch):
+    monkeypatch.setenv("X_ENABLED", "0")
+    assert options_from_env(DEFAULTS, "X_")["enabled"] is False